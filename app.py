@@ -1,12 +1,26 @@
+import hashlib
+import hmac
+import json
+import os
 import random
+import threading
 import time
-from datetime import datetime, timedelta
+from datetime import timedelta
 import requests
-from flask import Flask, render_template, redirect, url_for, session, jsonify, request
+from flask import Flask, Response, g, render_template, redirect, url_for, session, jsonify, request, send_file, send_from_directory
 
 from database import DatabaseImproved as Database
 
 from donehub_api import DoneHubAPI, DoneHubAPIError
+from donehub_async import HTTPX_AVAILABLE, AsyncDoneHubAPI
+from leaderboard_cache import LeaderboardCache
+from metrics import Metrics
+from profiling import RequestProfiler
+from slow_query_log import SlowQueryLog
+from static_assets import StaticAssets
+from profile_cache import DoneHubProfileCache
+from server_session import SQLiteSessionInterface
+from settlement import SettlementWorker
 
 try:
     import config
@@ -16,7 +30,42 @@ except ImportError:
 
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
-_db = Database()
+
+# 运行指标：各 worker 定期写入 METRICS_DIR，/metrics 汇总输出
+METRICS_ENABLED = getattr(config, 'METRICS_ENABLED', True)
+METRICS_DIR = getattr(config, 'METRICS_DIR', 'metrics')
+METRICS_FLUSH_INTERVAL = getattr(config, 'METRICS_FLUSH_INTERVAL', 5)
+# 管理接口令牌（Authorization: Bearer <token>）；未配置时管理接口关闭
+ADMIN_TOKEN = getattr(config, 'ADMIN_TOKEN', None)
+# 未配置令牌时是否放行来自本机的请求；同机反向代理转发的请求也来自本机，仅在无代理时开启
+ADMIN_ALLOW_LOOPBACK = getattr(config, 'ADMIN_ALLOW_LOOPBACK', False)
+
+metrics = Metrics(METRICS_DIR, METRICS_FLUSH_INTERVAL) if METRICS_ENABLED else None
+
+# 慢查询日志：超过 SLOW_QUERY_MS 毫秒的语句连同查询计划记录下来，0 为关闭
+SLOW_QUERY_MS = getattr(config, 'SLOW_QUERY_MS', 50)
+SLOW_QUERY_LOG_SIZE = getattr(config, 'SLOW_QUERY_LOG_SIZE', 200)
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE, METRICS_DIR) if SLOW_QUERY_MS else None
+
+# 请求分析：管理员请求带 X-Profile: 1 时分析该请求，另可按比例抽样；结果写入 PROFILE_DIR
+PROFILE_SAMPLE_RATE = getattr(config, 'PROFILE_SAMPLE_RATE', 0)
+PROFILE_DIR = getattr(config, 'PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = getattr(config, 'PROFILE_MAX_FILES', 200)
+
+request_profiler = RequestProfiler(PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_MAX_FILES)
+
+_db = Database(
+    pragmas=getattr(config, 'SQLITE_PRAGMAS', None),
+    listeners=[listener for listener in (metrics, slow_query_log) if listener is not None]
+)
+
+# 服务端会话：会话数据保存在 web_sessions 表，Cookie 只保存签名后的会话 id
+SESSION_LIFETIME = getattr(config, 'SESSION_LIFETIME', 7 * 24 * 3600)
+SESSION_SWEEP_INTERVAL = getattr(config, 'SESSION_SWEEP_INTERVAL', 300)
+
+app.permanent_session_lifetime = timedelta(seconds=SESSION_LIFETIME)
+app.session_interface = SQLiteSessionInterface(_db, SESSION_LIFETIME, SESSION_SWEEP_INTERVAL)
 
 # LinuxDo OAuth2 配置
 LINUXDO_AUTHORIZE_URL = "https://connect.linux.do/oauth2/authorize"
@@ -32,6 +81,33 @@ LOTTERY_WEIGHTS = [0.50, 0.25, 0.15, 0.05, 0.04, 0.01]
 LOTTERY_EXTRA_PURCHASE_COST = 5
 LOTTERY_EXTRA_PURCHASE_LIMIT = 5
 
+LEADERBOARD_SIZE = 10
+
+# 带内容哈希的静态资源（/assets/...）可被浏览器长期缓存；STATIC_BUILD_DIR 为 build_assets.py 的输出目录
+STATIC_ASSET_MAX_AGE = 365 * 24 * 3600
+STATIC_BUILD_DIR = getattr(config, 'STATIC_BUILD_DIR', 'dist')
+static_assets = StaticAssets(app.static_folder, os.path.join(app.root_path, STATIC_BUILD_DIR))
+LEADERBOARD_CACHE_TTL = getattr(config, 'LEADERBOARD_CACHE_TTL', 5)
+
+# 实时推送（SSE）配置
+EVENT_STREAM_MAX_SECONDS = getattr(config, 'EVENT_STREAM_MAX_SECONDS', 55)
+EVENT_STREAM_POLL_INTERVAL = getattr(config, 'EVENT_STREAM_POLL_INTERVAL', 2)
+EVENT_STREAM_HEARTBEAT = 15
+EVENT_STREAM_MAX_CLIENTS = getattr(config, 'EVENT_STREAM_MAX_CLIENTS', 24)
+
+# 额度结算：开启异步时本地记录提交后即返回，由后台线程把额度调整提交到 DoneHub
+DONEHUB_ASYNC_SETTLEMENT = getattr(config, 'DONEHUB_ASYNC_SETTLEMENT', True)
+SETTLEMENT_POLL_INTERVAL = getattr(config, 'SETTLEMENT_POLL_INTERVAL', 1.0)
+SETTLEMENT_MAX_ATTEMPTS = getattr(config, 'SETTLEMENT_MAX_ATTEMPTS', 8)
+# 提交成功后按比例抽样回读 DoneHub 余额核对，在后台线程中进行，不阻塞请求
+DONEHUB_VERIFY_SAMPLE_RATE = getattr(config, 'DONEHUB_VERIFY_SAMPLE_RATE', 0.1)
+DONEHUB_VERIFY_DELAY = getattr(config, 'DONEHUB_VERIFY_DELAY', 5)
+# 后台结算使用 httpx 异步客户端并发提交（需安装 httpx，未安装时退回逐条同步提交）
+DONEHUB_ASYNC_CLIENT = getattr(config, 'DONEHUB_ASYNC_CLIENT', True)
+SETTLEMENT_CONCURRENCY = getattr(config, 'SETTLEMENT_CONCURRENCY', 10)
+# 同步模式下条目推迟这么多秒才允许后台线程领取，由请求线程先提交；请求线程中途退出时再由后台线程接手
+SYNC_SETTLEMENT_GRACE = 60
+
 # 加油站（签到）配置
 SIGN_REWARD_MIN = 50
 SIGN_REWARD_MAX = 100
@@ -39,13 +115,41 @@ SIGN_REWARD_MAX = 100
 CURRENCY_UNIT = getattr(config, 'QUOTA_UNIT', 500000)
 DONEHUB_BASE_URL = getattr(config, 'DONEHUB_BASE_URL', getattr(config, 'NEW_API_BASE_URL', None))
 DONEHUB_ACCESS_TOKEN = getattr(config, 'DONEHUB_ACCESS_TOKEN', getattr(config, 'NEW_API_ADMIN_TOKEN', None))
+DONEHUB_POOL_SIZE = getattr(config, 'DONEHUB_POOL_SIZE', 10)
+DONEHUB_KEEP_ALIVE = getattr(config, 'DONEHUB_KEEP_ALIVE', True)
+DONEHUB_PROFILE_CACHE_TTL = getattr(config, 'DONEHUB_PROFILE_CACHE_TTL', 300)
+DONEHUB_PROFILE_CACHE_SIZE = getattr(config, 'DONEHUB_PROFILE_CACHE_SIZE', 1000)
+
+_profile_cache = DoneHubProfileCache(_db, DONEHUB_PROFILE_CACHE_TTL, DONEHUB_PROFILE_CACHE_SIZE)
 
 try:
-    donehub_api = DoneHubAPI(DONEHUB_BASE_URL, DONEHUB_ACCESS_TOKEN, CURRENCY_UNIT)
+    donehub_api = DoneHubAPI(
+        DONEHUB_BASE_URL,
+        DONEHUB_ACCESS_TOKEN,
+        CURRENCY_UNIT,
+        pool_size=DONEHUB_POOL_SIZE,
+        keep_alive=DONEHUB_KEEP_ALIVE,
+        profile_cache=_profile_cache,
+        metrics=metrics
+    )
 except ValueError as exc:
     print(f"配置错误: {exc}")
     exit(1)
 
+async_donehub_api = None
+if DONEHUB_ASYNC_CLIENT and HTTPX_AVAILABLE:
+    async_donehub_api = AsyncDoneHubAPI(
+        DONEHUB_BASE_URL,
+        DONEHUB_ACCESS_TOKEN,
+        CURRENCY_UNIT,
+        pool_size=max(DONEHUB_POOL_SIZE, SETTLEMENT_CONCURRENCY),
+        keep_alive=DONEHUB_KEEP_ALIVE,
+        profile_cache=_profile_cache,
+        metrics=metrics
+    )
+elif DONEHUB_ASYNC_CLIENT:
+    print("提示: 未安装 httpx，后台结算将逐条同步提交")
+
 
 def _serialize_lottery_record(record):
     if not record:
@@ -82,26 +186,148 @@ def _serialize_sign_history(records):
     return [_serialize_sign_record(record) for record in records] if records else []
 
 
-def _get_donehub_user(user):
+def _load_leaderboard():
+    return [
+        {
+            'username': record.get('username') or '未知用户',
+            'total_prize': int(record.get('total_quota') or 0),
+            'total_cost': int(record.get('total_cost') or 0),
+            'net_change': int(record.get('net_change') or 0),
+            'attempts': int(record.get('attempts') or 0)
+        }
+        for record in _db.get_today_lottery_totals(limit=LEADERBOARD_SIZE)
+    ]
+
+
+leaderboard_cache = LeaderboardCache(_load_leaderboard, ttl=LEADERBOARD_CACHE_TTL)
+
+
+def _on_quota_change_applied(entry):
+    if entry.get('source_type') == 'lottery':
+        leaderboard_cache.invalidate()
+
+
+settlement_worker = SettlementWorker(
+    _db,
+    donehub_api,
+    interval=SETTLEMENT_POLL_INTERVAL,
+    max_attempts=SETTLEMENT_MAX_ATTEMPTS,
+    on_applied=_on_quota_change_applied,
+    verify_sample_rate=DONEHUB_VERIFY_SAMPLE_RATE,
+    verify_delay=DONEHUB_VERIFY_DELAY,
+    async_api=async_donehub_api,
+    concurrency=SETTLEMENT_CONCURRENCY,
+    metrics=metrics
+)
+
+
+@app.before_request
+def _ensure_settlement_worker():
+    settlement_worker.ensure_started()
+
+
+@app.before_request
+def _start_request_timer():
+    if metrics is not None:
+        metrics.ensure_started()
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if metrics is not None and started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                        route=route, method=request.method, status=response.status_code)
+    return response
+
+
+def _is_admin_request():
+    if ADMIN_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        return hmac.compare_digest(supplied.encode(), f'Bearer {ADMIN_TOKEN}'.encode())
+    return bool(ADMIN_ALLOW_LOOPBACK) and request.remote_addr in ('127.0.0.1', '::1')
+
+
+# 长连接推送与管理接口不做分析
+PROFILE_EXCLUDED_ENDPOINTS = {'event_stream', 'metrics_endpoint', 'profile_report', 'slow_query_report', 'static',
+                              'static_asset'}
+
+
+@app.before_request
+def _start_profiling():
+    if request.endpoint in PROFILE_EXCLUDED_ENDPOINTS:
+        return
+    forced = request.headers.get('X-Profile') == '1' and _is_admin_request()
+    if request_profiler.should_profile(forced):
+        g.profiler = request_profiler.start()
+
+
+@app.teardown_request
+def _stop_profiling(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        request_profiler.stop(profiler, request.endpoint)
+
+
+def _profile_matches_user(profile, user):
+    linuxdo_id = str(user.get('linuxdo_id') or '').strip()
+    candidate = profile.get('linuxdo_id')
+    if linuxdo_id and linuxdo_id != '0' and candidate not in (None, '', 0, '0'):
+        return str(candidate) == linuxdo_id
+
+    username = user.get('username')
+    return bool(username) and username in (profile.get('linuxdo_username'), profile.get('username'))
+
+
+def _get_linked_donehub_user(user, use_cache=True):
+    """通过本地映射表直接按 id 读取 DoneHub 用户，映射缺失或失效时返回 None"""
+    user_id = user.get('id')
+    if not user_id:
+        return None
+
+    donehub_user_id = _db.get_donehub_user_id(user_id)
+    if not donehub_user_id:
+        return None
+
+    try:
+        profile = donehub_api.get_user_by_id(donehub_user_id, use_cache=use_cache)
+    except DoneHubAPIError:
+        # 网络错误不代表映射失效，交给关键词搜索兜底
+        return None
+
+    if profile and _profile_matches_user(profile, user):
+        return profile
+
+    _db.delete_donehub_user_id(user_id)
+    return None
+
+
+def _get_donehub_user(user, use_cache=True):
     if not user:
         return None
 
+    profile = _get_linked_donehub_user(user, use_cache=use_cache)
+    if profile:
+        return profile
+
     linuxdo_id = str(user.get('linuxdo_id') or '').strip()
     username = user.get('username')
 
     try:
         if linuxdo_id and linuxdo_id != '0':
             profile = donehub_api.get_user_by_linuxdo_id(linuxdo_id)
-            if profile:
-                return profile
-
-        if username:
-            return donehub_api.get_user_by_linuxdo_username(username)
 
-        return None
+        if not profile and username:
+            profile = donehub_api.get_user_by_linuxdo_username(username)
     except DoneHubAPIError as exc:
         raise DoneHubAPIError(f"DoneHub 查询失败: {exc}")
 
+    if profile and profile.get('id') and user.get('id') and _profile_matches_user(profile, user):
+        _db.set_donehub_user_id(user['id'], profile['id'])
+    return profile
+
 
 def _available_units(user_profile):
     quota_units = user_profile.get('quota') or 0
@@ -114,6 +340,50 @@ def _current_balance_dollars(user_profile):
     return round(total_units / CURRENCY_UNIT, 2)
 
 
+def _projected_profile(profile):
+    """在最新已知资料上叠加结算队列中尚未提交到 DoneHub 的额度变化"""
+    return _with_pending_delta(donehub_api.get_cached_user(profile['id']) or profile)
+
+
+def _with_pending_delta(profile):
+    projected = dict(profile)
+    projected['quota'] = (profile.get('quota') or 0) + _db.get_pending_quota_delta(profile['id'])
+    return projected
+
+
+def _settlement_due_at():
+    """条目允许后台线程领取的时间；同步模式推迟领取，避免后台线程抢在请求线程之前处理"""
+    return 0 if DONEHUB_ASYNC_SETTLEMENT else time.time() + SYNC_SETTLEMENT_GRACE
+
+
+def _settle_quota_change(entry_id):
+    """异步模式交给后台线程并返回 pending；同步模式立即提交，失败时来源记录已被撤销
+
+    同步模式下未能由当前请求确认结果（如条目已被其他线程领取）时返回 unknown，不当作成功。
+    """
+    if DONEHUB_ASYNC_SETTLEMENT:
+        settlement_worker.notify()
+        return 'pending'
+    status = settlement_worker.settle_now(entry_id)
+    return status if status in ('applied', 'failed', 'missing') else 'unknown'
+
+
+def _settlement_error_response(status, code, current_balance, **extra):
+    if status == 'unknown':
+        message = 'DoneHub 额度调整结果待确认，请稍后刷新查看'
+        code = 'SETTLEMENT_UNKNOWN'
+    else:
+        message = 'DoneHub 额度调整失败，请稍后再试'
+    payload = {
+        'success': False,
+        'message': message,
+        'code': code,
+        'current_balance': current_balance
+    }
+    payload.update(extra)
+    return jsonify(payload), 500
+
+
 def _default_personal_summary():
     return {
         'total_quota': 0,
@@ -123,84 +393,60 @@ def _default_personal_summary():
     }
 
 
-def _verify_quota_increment(profile_id, initial_units, added_units):
-    expected_units = initial_units + added_units
-    latest_profile = None
+# /dashboard-data 可按 sections 参数只返回部分数据；balance 需要查询 DoneHub 资料
+DASHBOARD_SECTIONS = ('balance', 'sign', 'lottery', 'leaderboard')
 
-    for _ in range(3):
-        try:
-            latest_profile = donehub_api.get_user_by_id(profile_id)
-        except DoneHubAPIError:
-            latest_profile = None
-
-        if latest_profile:
-            current_units = latest_profile.get('quota') or 0
-            if current_units >= expected_units:
-                return latest_profile
 
-        time.sleep(0.3)
-
-    return latest_profile
+def _parse_dashboard_sections(value):
+    """解析逗号分隔的 sections 参数，缺省为全部；包含未知名称时返回 None"""
+    if not value:
+        return DASHBOARD_SECTIONS
+    requested = {item.strip() for item in value.split(',') if item.strip()}
+    if not requested or not requested <= set(DASHBOARD_SECTIONS):
+        return None
+    return tuple(section for section in DASHBOARD_SECTIONS if section in requested)
 
 
-def _build_dashboard_data(user):
+def _build_dashboard_data(user, known_leaderboard_version=None, sections=DASHBOARD_SECTIONS):
+    """组装 Dashboard 数据，只计算 sections 中的部分；客户端已持有相同版本的榜单时省略 leaderboard 字段"""
     user_id = user['id']
+    data = {'is_authenticated': True, 'sections': list(sections)}
 
-    spins_today, last_lottery = (getattr(_db, 'get_today_lottery_summary')(user_id)
-                                 if hasattr(_db, 'get_today_lottery_summary')
-                                 else (0, None))
-    extra_purchases = getattr(_db, 'get_today_extra_purchases')(user_id) if hasattr(_db, 'get_today_extra_purchases') else 0
-    total_attempt_limit = LOTTERY_MAX_DAILY_SPINS + extra_purchases
-    remaining_attempts = max(0, total_attempt_limit - (spins_today or 0))
-    lottery_history = _serialize_lottery_history(
-        _db.get_user_lottery_history(user_id, limit=10)
-        if hasattr(_db, 'get_user_lottery_history') else []
-    )
-
-    sign_today = getattr(_db, 'check_today_sign')(user_id) if hasattr(_db, 'check_today_sign') else None
-    sign_history = _serialize_sign_history(
-        getattr(_db, 'get_recent_sign_history')(user_id, limit=7) if hasattr(_db, 'get_recent_sign_history') else []
-    )
-
-    raw_leaderboard_records = getattr(_db, 'get_today_lottery_totals')(limit=10) if hasattr(_db, 'get_today_lottery_totals') else []
-    leaderboard_records = [
-        {
-            'username': record.get('username') or '未知用户',
-            'total_prize': int(record.get('total_quota') or 0),
-            'total_cost': int(record.get('total_cost') or 0),
-            'net_change': int(record.get('net_change') or 0),
-            'attempts': int(record.get('attempts') or 0)
-        }
-        for record in raw_leaderboard_records
-    ]
-
-    personal_summary = (
-        getattr(_db, 'get_today_lottery_summary_for_user')(user_id)
-        if hasattr(_db, 'get_today_lottery_summary_for_user') else _default_personal_summary()
-    ) or _default_personal_summary()
+    snapshot_sections = [section for section in sections if section != 'balance']
+    snapshot = {}
+    if snapshot_sections:
+        snapshot = _db.get_dashboard_snapshot(user_id, history_limit=10, sign_history_limit=7, leaderboard_limit=0,
+                                              sections=snapshot_sections)
 
-    donehub_user = None
-    try:
-        donehub_user = _get_cached_donehub_profile(user) or _get_donehub_user(user)
-        if donehub_user:
-            _store_donehub_profile_in_session(user, donehub_user)
-    except DoneHubAPIError:
+    current_balance = None
+    if 'balance' in sections:
         donehub_user = None
+        try:
+            donehub_user = _get_cached_donehub_profile(user) or _get_donehub_user(user)
+            if donehub_user:
+                _store_donehub_profile_in_session(user, donehub_user)
+        except DoneHubAPIError:
+            donehub_user = None
 
-    current_balance = _current_balance_dollars(donehub_user) if donehub_user else 0.0
+        current_balance = _current_balance_dollars(_projected_profile(donehub_user)) if donehub_user else 0.0
+        data['balance'] = current_balance
 
-    data = {
-        'is_authenticated': True,
-        'balance': current_balance,
-        'sign': {
+    if 'sign' in sections:
+        sign_today = snapshot['sign_today']
+        data['sign'] = {
             'today_signed': bool(sign_today),
             'today_reward': sign_today.get('reward') if sign_today else None,
-            'history': sign_history
-        },
-        'lottery': {
-            'remaining_attempts': remaining_attempts,
-            'history': lottery_history,
-            'last_record': _serialize_lottery_record(last_lottery),
+            'history': _serialize_sign_history(snapshot['sign_history'])
+        }
+
+    if 'lottery' in sections:
+        spins_today = snapshot['spins_today']
+        extra_purchases = snapshot['extra_purchases']
+        total_attempt_limit = LOTTERY_MAX_DAILY_SPINS + extra_purchases
+        data['lottery'] = {
+            'remaining_attempts': max(0, total_attempt_limit - (spins_today or 0)),
+            'history': _serialize_lottery_history(snapshot['lottery_history']),
+            'last_record': _serialize_lottery_record(snapshot['last_lottery']),
             'cost': LOTTERY_COST,
             'max_attempts': total_attempt_limit,
             'base_attempts': LOTTERY_MAX_DAILY_SPINS,
@@ -208,10 +454,16 @@ def _build_dashboard_data(user):
             'extra_purchase_limit': LOTTERY_EXTRA_PURCHASE_LIMIT,
             'extra_purchase_cost': LOTTERY_EXTRA_PURCHASE_COST,
             'can_purchase_extra': extra_purchases < LOTTERY_EXTRA_PURCHASE_LIMIT
-        },
-        'leaderboard': leaderboard_records,
-        'leaderboard_self': personal_summary
-    }
+        }
+
+    if 'leaderboard' in sections:
+        leaderboard_version, leaderboard_records = leaderboard_cache.get()
+        data['leaderboard_version'] = leaderboard_version
+        data['leaderboard_self'] = snapshot['leaderboard_self'] or _default_personal_summary()
+        if known_leaderboard_version and known_leaderboard_version == leaderboard_version:
+            data['leaderboard_unchanged'] = True
+        else:
+            data['leaderboard'] = leaderboard_records
 
     return data, current_balance
 
@@ -219,7 +471,7 @@ def _build_dashboard_data(user):
 @app.route('/')
 def index():
     if 'user' not in session:
-        initial_data = {'is_authenticated': False}
+        initial_data = {'is_authenticated': False, 'config': _page_config()}
         return render_template(
             'index.html',
             logged_in=False,
@@ -234,6 +486,7 @@ def index():
 
     user = session['user']
     initial_data, current_balance = _build_dashboard_data(user)
+    initial_data['config'] = _page_config()
 
     return render_template(
         'index.html',
@@ -248,6 +501,48 @@ def index():
     )
 
 
+def _page_config():
+    """前端脚本使用的费用与次数配置，随初始数据下发"""
+    return {
+        'lottery_max': LOTTERY_MAX_DAILY_SPINS,
+        'cost_per_spin': LOTTERY_COST,
+        'extra_purchase_cost': LOTTERY_EXTRA_PURCHASE_COST,
+        'extra_purchase_limit': LOTTERY_EXTRA_PURCHASE_LIMIT,
+    }
+
+
+@app.template_global()
+def asset_url(filename):
+    """static 目录下文件的带哈希地址，内容变化后地址随之变化"""
+    return url_for('static_asset', filename=static_assets.hashed_name(filename))
+
+
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    # 优先使用构建目录中的预压缩 / 新格式版本
+    variant = static_assets.select(
+        filename,
+        (value for value, quality in request.accept_mimetypes if quality > 0),
+        (value for value, quality in request.accept_encodings if quality > 0),
+    )
+    if variant is not None:
+        response = send_file(variant.path, mimetype=variant.mimetype, etag=variant.etag, conditional=True, max_age=0)
+        if variant.encoding:
+            response.headers['Content-Encoding'] = variant.encoding
+        response.vary.update(variant.vary)
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_ASSET_MAX_AGE}, immutable'
+        return response
+
+    source, current = static_assets.resolve(filename)
+    response = send_from_directory(app.static_folder, source, max_age=0)
+    if current:
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_ASSET_MAX_AGE}, immutable'
+    else:
+        # 哈希已过期（如发布后旧页面仍在请求旧地址），返回当前内容但不长期缓存
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.route('/login')
 def login():
     params = {
@@ -293,6 +588,8 @@ def callback():
         username = user_info.get('username', 'unknown')
         user = _db.get_or_create_user(linuxdo_id, username)
 
+        # 登录后更换会话 id
+        session.rotate()
         session['user'] = {
             'id': user['id'],
             'username': user['username'],
@@ -315,15 +612,105 @@ def dashboard_data():
     if 'user' not in session:
         return jsonify({'success': False, 'message': '请先登录'}), 401
 
+    sections = _parse_dashboard_sections(request.args.get('sections'))
+    if sections is None:
+        return jsonify({
+            'success': False,
+            'message': f"sections 只能包含 {', '.join(DASHBOARD_SECTIONS)}",
+            'code': 'INVALID_SECTIONS'
+        }), 400
+
     user = session['user']
-    data, _ = _build_dashboard_data(user)
-    return jsonify({'success': True, 'data': data})
+    data, _ = _build_dashboard_data(user, request.args.get('leaderboard_version'), sections)
+    body = {'success': True, 'data': data}
+
+    # 按完整响应内容生成 ETag，内容未变时返回 304，浏览器复用本地副本
+    payload = json.dumps(body, sort_keys=True, ensure_ascii=False, default=str)
+    response = jsonify(body)
+    response.set_etag(hashlib.sha1(payload.encode('utf-8')).hexdigest(), weak=True)
+    return response.make_conditional(request)
+
+
+# 每个 worker 同时保持的推送连接上限，需小于 gunicorn 的 threads，为普通请求留出线程
+_event_stream_slots = threading.BoundedSemaphore(EVENT_STREAM_MAX_CLIENTS)
+
+
+def _format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _get_cached_balance(donehub_user_id):
+    """只读共享资料缓存与结算队列，不触发 DoneHub 调用，也不写数据库
+
+    缓存超过 TTL 后仍以最近一次已知资料加待结算额度推算余额；缓存由 Dashboard 请求刷新。
+    """
+    if not donehub_user_id:
+        return None
+    profile = donehub_api.peek_cached_user(donehub_user_id)
+    return _current_balance_dollars(_with_pending_delta(profile)) if profile else None
+
+
+@app.route('/events')
+def event_stream():
+    """推送榜单与本人余额变化；连接定期结束，由浏览器按 retry 自动重连"""
+    if 'user' not in session:
+        return jsonify({'success': False, 'message': '请先登录'}), 401
+
+    user_id = session['user']['id']
+    donehub_user_id = _db.get_donehub_user_id(user_id)
+
+    if not _event_stream_slots.acquire(blocking=False):
+        return jsonify({'success': False, 'message': '实时连接已满，请稍后再试', 'code': 'STREAM_BUSY'}), 503
+
+    def generate():
+        yield f"retry: {EVENT_STREAM_POLL_INTERVAL * 1000}\n\n"
+        last_version = None
+        last_balance = None
+        last_sent = time.monotonic()
+        deadline = last_sent + EVENT_STREAM_MAX_SECONDS
+
+        while time.monotonic() < deadline:
+            version, records = leaderboard_cache.get()
+            if version != last_version:
+                last_version = version
+                last_sent = time.monotonic()
+                yield _format_sse('leaderboard', {
+                    'version': version,
+                    'leaderboard': records,
+                    'leaderboard_self': _db.get_today_lottery_summary_for_user(user_id)
+                })
+
+            balance = _get_cached_balance(donehub_user_id)
+            if balance is not None and balance != last_balance:
+                last_balance = balance
+                last_sent = time.monotonic()
+                yield _format_sse('balance', {'balance': balance})
+
+            if time.monotonic() - last_sent >= EVENT_STREAM_HEARTBEAT:
+                last_sent = time.monotonic()
+                yield ": ping\n\n"
+
+            time.sleep(EVENT_STREAM_POLL_INTERVAL)
+
+    response = Response(generate(), mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+    # 无论流是否正常结束，服务端关闭响应时都会归还名额
+    response.call_on_close(_event_stream_slots.release)
+    return response
+
+
+# 允许浏览器在私有缓存中保存、但每次使用前必须向服务端验证的接口
+REVALIDATE_ENDPOINTS = {'dashboard_data'}
 
 
 @app.after_request
 def add_no_cache_headers(response):
     """避免登录后的个性化页面被中间层缓存，保护用户数据"""
-    if request.path.startswith('/static'):
+    if request.path.startswith(('/static', '/assets/')):
+        return response
+
+    if request.endpoint in REVALIDATE_ENDPOINTS:
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['Vary'] = 'Cookie'
         return response
 
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0, private'
@@ -333,51 +720,44 @@ def add_no_cache_headers(response):
 
 
 def _get_cached_donehub_profile(user):
+    """会话只记录已匹配的 DoneHub 用户 id，资料从 donehub_profile_cache 读取（过期时回源）"""
     cached = session.get('donehub_profile') or {}
     cached_user_id = cached.get('donehub_user_id')
-    cached_username = cached.get('username')
-    cached_linuxdo_id = cached.get('linuxdo_id')
-    cached_updated = cached.get('updated_at')
-    cached_profile = cached.get('profile')
-
-    if cached_updated:
-        try:
-            updated = datetime.fromisoformat(cached_updated)
-            if datetime.utcnow() - updated > timedelta(minutes=5):
-                cached_user_id = None  # force refresh
-        except ValueError:
-            cached_user_id = None
-
     if (
-        cached_user_id
-        and cached_username == user.get('username')
-        and cached_linuxdo_id == user.get('linuxdo_id')
+        not cached_user_id
+        or cached.get('username') != user.get('username')
+        or cached.get('linuxdo_id') != user.get('linuxdo_id')
     ):
-        try:
-            profile = donehub_api.get_user_by_id(cached_user_id)
-            if profile:
-                return profile
-        except DoneHubAPIError:
-            pass
-
-        if cached_profile:
-            return cached_profile
+        return None
 
-    return None
+    try:
+        profile = donehub_api.get_user_by_id(cached_user_id)
+        if profile:
+            return profile
+    except DoneHubAPIError:
+        pass
+    # DoneHub 暂不可用时沿用最近一次已知的资料
+    return donehub_api.peek_cached_user(cached_user_id)
 
 
 def _store_donehub_profile_in_session(user, profile):
     if not profile:
-        session.pop('donehub_profile', None)
+        _clear_donehub_profile_in_session()
         return
 
-    session['donehub_profile'] = {
+    binding = {
         'donehub_user_id': profile.get('id'),
         'username': user.get('username'),
-        'linuxdo_id': user.get('linuxdo_id'),
-        'updated_at': datetime.utcnow().isoformat(),
-        'profile': profile
+        'linuxdo_id': user.get('linuxdo_id')
     }
+    # 只在绑定变化时写入，避免每次查询余额都改写 web_sessions
+    if session.get('donehub_profile') != binding:
+        session['donehub_profile'] = binding
+
+
+def _clear_donehub_profile_in_session():
+    if 'donehub_profile' in session:
+        session.pop('donehub_profile')
 
 
 def _get_donehub_profile_or_response(user, force_refresh=False):
@@ -385,20 +765,20 @@ def _get_donehub_profile_or_response(user, force_refresh=False):
         return None, jsonify({'success': False, 'message': '未登录', 'code': 'UNAUTHORIZED'}), 401
 
     if force_refresh:
-        session.pop('donehub_profile', None)
+        _clear_donehub_profile_in_session()
     else:
         cached_profile = _get_cached_donehub_profile(user)
         if cached_profile:
             return cached_profile, None, None
 
     try:
-        profile = _get_donehub_user(user)
+        profile = _get_donehub_user(user, use_cache=not force_refresh)
     except DoneHubAPIError as exc:
-        session.pop('donehub_profile', None)
+        _clear_donehub_profile_in_session()
         return None, jsonify({'success': False, 'message': str(exc), 'code': 'USER_LOOKUP_FAILED'}), 500
 
     if not profile or not profile.get('id'):
-        session.pop('donehub_profile', None)
+        _clear_donehub_profile_in_session()
         return None, jsonify({'success': False, 'message': '未在 DoneHub 中找到对应用户，请先绑定账号', 'code': 'USER_NOT_FOUND'}), 400
 
     _store_donehub_profile_in_session(user, profile)
@@ -412,12 +792,11 @@ def sign_action():
 
     user = session['user']
     user_id = user['id']
-    profile, error_response, status_code = _get_donehub_profile_or_response(user, force_refresh=True)
+    profile, error_response, status_code = _get_donehub_profile_or_response(user)
     if error_response:
         return error_response, status_code
 
-    initial_quota_units = profile.get('quota') or 0
-    current_balance = _current_balance_dollars(profile)
+    current_balance = _current_balance_dollars(_projected_profile(profile))
 
     today_record = getattr(_db, 'check_today_sign')(user_id) if hasattr(_db, 'check_today_sign') else None
     if today_record:
@@ -434,11 +813,15 @@ def sign_action():
         }), 400
 
     reward_amount = random.randint(SIGN_REWARD_MIN, SIGN_REWARD_MAX)
+    reward_units = reward_amount * CURRENCY_UNIT
 
-    if hasattr(_db, 'create_sign_record_atomic'):
-        record = _db.create_sign_record_atomic(user_id, reward_amount)
-    else:
-        record = _db.create_sign_record(user_id, reward_amount)
+    record = _db.create_sign_record_atomic(user_id, reward_amount, quota_change={
+        'donehub_user_id': profile['id'],
+        'delta_units': reward_units,
+        'prize': reward_amount,
+        'remark': f"签到奖励 {reward_amount} $",
+        'next_attempt_at': _settlement_due_at()
+    })
 
     if not record:
         sign_history = _serialize_sign_history(
@@ -452,51 +835,11 @@ def sign_action():
             'current_balance': current_balance
         }), 400
 
-    reward_units = reward_amount * CURRENCY_UNIT
-    try:
-        donehub_api.change_user_quota(profile['id'], reward_units, f"签到奖励 {reward_amount} $")
-    except DoneHubAPIError as exc:
-        if record and 'id' in record and hasattr(_db, 'delete_sign_record'):
-            try:
-                _db.delete_sign_record(record['id'])
-            except Exception:  # pylint:disable=broad-except
-                pass
-        return jsonify({
-            'success': False,
-            'message': str(exc),
-            'code': 'SIGN_FAILED',
-            'current_balance': current_balance
-        }), 500
+    status = _settle_quota_change(record['outbox_id'])
+    if status in ('failed', 'unknown', 'missing'):
+        return _settlement_error_response(status, 'SIGN_FAILED', current_balance)
 
-    if record and 'id' in record and hasattr(_db, 'update_sign_status'):
-        _db.update_sign_status(record['id'], 'completed')
-
-    sync_profile = _verify_quota_increment(
-        profile['id'],
-        initial_quota_units,
-        reward_units
-    )
-
-    if not sync_profile or (sync_profile.get('quota') or 0) < (initial_quota_units + reward_units):
-        if record and 'id' in record and hasattr(_db, 'delete_sign_record'):
-            try:
-                _db.delete_sign_record(record['id'])
-            except Exception:  # pylint:disable=broad-except
-                pass
-        sign_history = _serialize_sign_history(
-            getattr(_db, 'get_recent_sign_history')(user_id, limit=7) if hasattr(_db, 'get_recent_sign_history') else []
-        )
-        return jsonify({
-            'success': False,
-            'message': 'DoneHub 额度同步失败，请稍后再试',
-            'code': 'SIGN_SYNC_FAILED',
-            'current_balance': current_balance,
-            'sign_history': sign_history
-        }), 500
-
-    updated_profile = sync_profile
-    current_balance = _current_balance_dollars(updated_profile)
-    _store_donehub_profile_in_session(user, updated_profile)
+    current_balance = _current_balance_dollars(_projected_profile(profile))
 
     sign_history = _serialize_sign_history(
         getattr(_db, 'get_recent_sign_history')(user_id, limit=7) if hasattr(_db, 'get_recent_sign_history') else []
@@ -516,6 +859,15 @@ def lottery():
     if 'user' not in session:
         return jsonify({'success': False, 'message': '请先登录'}), 401
 
+    # 请求体可省略；提供时须为 JSON 对象，count 须为整数
+    payload = request.get_json(silent=True)
+    try:
+        if payload is not None and not isinstance(payload, dict):
+            raise TypeError
+        requested_count = int((payload or {}).get('count', 1))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'count 须为整数', 'code': 'INVALID_COUNT'}), 400
+
     user = session['user']
     user_id = user['id']
 
@@ -531,7 +883,7 @@ def lottery():
     if error_response:
         return error_response, status_code
 
-    available_units = _available_units(profile)
+    available_units = _available_units(_projected_profile(profile))
     current_balance = round(available_units / CURRENCY_UNIT, 2)
 
     if remaining_attempts <= 0:
@@ -558,22 +910,31 @@ def lottery():
             'lottery_history': _serialize_lottery_history(_db.get_user_lottery_history(user_id, limit=10))
         }), 400
 
-    prize_amount = random.choices(LOTTERY_OPTIONS, weights=LOTTERY_WEIGHTS, k=1)[0]
-    redemption_code = f"DIRECT_{prize_amount}$"
-
-    if hasattr(_db, 'create_lottery_record_atomic'):
-        record = _db.create_lottery_record_atomic(
-            user_id,
-            prize_amount,
-            redemption_code,
-            cost=LOTTERY_COST,
-            max_attempts=max_attempts_today
-        )
-    else:
-        record = _db.create_lottery_record(user_id, prize_amount, redemption_code, cost=LOTTERY_COST,
-                                           max_attempts=max_attempts_today)
+    # 连抽次数不超过剩余次数，也不超过余额足以支付的次数
+    spin_count = max(1, min(requested_count, remaining_attempts, available_units // required_units))
+
+    prizes = random.choices(LOTTERY_OPTIONS, weights=LOTTERY_WEIGHTS, k=spin_count)
+    total_prize = sum(prizes)
+    total_cost = LOTTERY_COST * spin_count
+
+    # 整批扣费与奖励合并为一次净额调整，明细保留在结算队列与记账流水中
+    records = _db.create_lottery_records_atomic(
+        user_id,
+        [(prize_amount, f"DIRECT_{prize_amount}$") for prize_amount in prizes],
+        cost=LOTTERY_COST,
+        max_attempts=max_attempts_today,
+        quota_change={
+            'donehub_user_id': profile['id'],
+            'delta_units': (total_prize - total_cost) * CURRENCY_UNIT,
+            'cost': total_cost,
+            'prize': total_prize,
+            'remark': (f"抽奖扣除 {LOTTERY_COST} $，奖励 {total_prize} $" if spin_count == 1
+                       else f"{spin_count} 连抽扣除 {total_cost} $，奖励 {total_prize} $"),
+            'next_attempt_at': _settlement_due_at()
+        }
+    )
 
-    if not record:
+    if not records:
         spins_today, last_lottery = (getattr(_db, 'get_today_lottery_summary')(user_id)
                                      if hasattr(_db, 'get_today_lottery_summary')
                                      else (LOTTERY_MAX_DAILY_SPINS, None))
@@ -589,71 +950,15 @@ def lottery():
             'lottery_history': _serialize_lottery_history(_db.get_user_lottery_history(user_id, limit=10))
         }), 400
 
-    cost_units = LOTTERY_COST * CURRENCY_UNIT
-    prize_units = prize_amount * CURRENCY_UNIT
-
-    try:
-        donehub_api.change_user_quota(profile['id'], -cost_units, f"抽奖扣除 {LOTTERY_COST} $")
-    except DoneHubAPIError as exc:
-        if record and 'id' in record and hasattr(_db, 'delete_lottery_record'):
-            try:
-                _db.delete_lottery_record(record['id'])
-            except Exception:  # pylint:disable=broad-except
-                pass
-        return jsonify({
-            'success': False,
-            'message': str(exc),
-            'code': 'LOTTERY_FAILED',
-            'remaining_attempts': remaining_attempts,
-            'current_balance': current_balance
-        }), 500
-
-    try:
-        donehub_api.change_user_quota(profile['id'], prize_units, f"抽奖奖励 {prize_amount} $")
-    except DoneHubAPIError as exc:
-        try:
-            donehub_api.change_user_quota(profile['id'], cost_units, "抽奖失败回滚")
-        except DoneHubAPIError as rollback_exc:
-            print(f"抽奖回滚失败: {rollback_exc}")
-            if isinstance(rollback_exc, DoneHubAPIError):
-                return jsonify({
-                    'success': False,
-                    'message': f"奖励回滚失败，请联系管理员：{rollback_exc}",
-                    'code': 'ROLLBACK_FAILED',
-                    'remaining_attempts': remaining_attempts,
-                    'current_balance': current_balance
-                }), 500
-        if record and 'id' in record and hasattr(_db, 'delete_lottery_record'):
-            try:
-                _db.delete_lottery_record(record['id'])
-            except Exception:  # pylint:disable=broad-except
-                pass
-        return jsonify({
-            'success': False,
-            'message': str(exc),
-            'code': 'LOTTERY_FAILED',
-            'remaining_attempts': remaining_attempts,
-            'current_balance': current_balance
-        }), 500
+    status = _settle_quota_change(records[0]['outbox_id'])
+    if status in ('failed', 'unknown', 'missing'):
+        return _settlement_error_response(status, 'LOTTERY_FAILED', current_balance,
+                                          remaining_attempts=remaining_attempts)
 
-    if record and 'id' in record and hasattr(_db, 'update_lottery_status'):
-        _db.update_lottery_status(record['id'], 'completed')
+    current_balance = _current_balance_dollars(_projected_profile(profile))
 
-    updated_profile = None
-    try:
-        updated_profile = donehub_api.get_user_by_id(profile['id'])
-        if updated_profile:
-            _store_donehub_profile_in_session(user, updated_profile)
-    except DoneHubAPIError:
-        updated_profile = None
-
-    if updated_profile:
-        current_balance = _current_balance_dollars(updated_profile)
-    else:
-        total_units = profile.get('quota') or 0
-        current_balance = round((total_units - cost_units + prize_units) / CURRENCY_UNIT, 2)
-
-    attempt_number = record.get('attempt_number') if isinstance(record, dict) else (spins_today + 1)
+    last_record = records[-1]
+    attempt_number = last_record.get('attempt_number')
     extra_purchases = getattr(_db, 'get_today_extra_purchases')(user_id) if hasattr(_db, 'get_today_extra_purchases') else extra_purchases
     max_attempts_today = LOTTERY_MAX_DAILY_SPINS + extra_purchases
     remaining_after = max(0, max_attempts_today - attempt_number)
@@ -663,13 +968,18 @@ def lottery():
     return jsonify({
         'success': True,
         'message': '恭喜你抽中了！额度已直接充值到账户',
-        'quota': prize_amount,
+        'quota': last_record['quota'],
         'cost': LOTTERY_COST,
         'attempt_number': attempt_number,
         'remaining_attempts': remaining_after,
-        'redemption_code': redemption_code,
+        'redemption_code': last_record['redemption_code'],
         'current_balance': current_balance,
-        'net_change': round(prize_amount - LOTTERY_COST, 2),
+        'net_change': round(last_record['quota'] - LOTTERY_COST, 2),
+        'count': spin_count,
+        'total_prize': total_prize,
+        'total_cost': total_cost,
+        'total_net_change': round(total_prize - total_cost, 2),
+        'results': [_serialize_lottery_record(record) for record in records],
         'lottery_history': lottery_history
     })
 
@@ -707,13 +1017,13 @@ def purchase_lottery_attempt():
             'remaining_quota': remaining_quota
         }), 400
 
-    profile, error_response, status_code = _get_donehub_profile_or_response(user, force_refresh=True)
+    profile, error_response, status_code = _get_donehub_profile_or_response(user)
     if error_response:
         return error_response, status_code
 
     purchase_units = LOTTERY_EXTRA_PURCHASE_COST * CURRENCY_UNIT
     total_purchase_units = purchase_units * requested_quantity
-    available_units = _available_units(profile)
+    available_units = _available_units(_projected_profile(profile))
     if available_units < total_purchase_units:
         return jsonify({
             'success': False,
@@ -722,49 +1032,32 @@ def purchase_lottery_attempt():
             'current_balance': round(available_units / CURRENCY_UNIT, 2)
         }), 400
 
-    records = None
-    if hasattr(_db, 'add_extra_purchase_atomic'):
-        records = _db.add_extra_purchase_atomic(user_id, LOTTERY_EXTRA_PURCHASE_LIMIT, count=requested_quantity)
-    else:
-        return jsonify({
-            'success': False,
-            'message': '暂不支持购买额外次数'
-        }), 500
+    purchase = _db.add_extra_purchase_atomic(
+        user_id,
+        LOTTERY_EXTRA_PURCHASE_LIMIT,
+        count=requested_quantity,
+        quota_change={
+            'donehub_user_id': profile['id'],
+            'delta_units': -total_purchase_units,
+            'cost': LOTTERY_EXTRA_PURCHASE_COST * requested_quantity,
+            'remark': f"购买抽奖次数 {LOTTERY_EXTRA_PURCHASE_COST} $ × {requested_quantity}",
+            'next_attempt_at': _settlement_due_at()
+        }
+    )
 
-    if not records:
+    if not purchase:
         return jsonify({
             'success': False,
             'message': '今日可购买次数已达上限',
             'code': 'PURCHASE_LIMIT_REACHED'
         }), 400
 
-    try:
-        donehub_api.change_user_quota(profile['id'], -total_purchase_units,
-                                      f"购买抽奖次数 {LOTTERY_EXTRA_PURCHASE_COST} $ × {requested_quantity}")
-    except DoneHubAPIError as exc:
-        if records and hasattr(_db, 'delete_extra_purchase'):
-            for inserted in records:
-                record_id = inserted.get('id') if isinstance(inserted, dict) else None
-                if record_id:
-                    try:
-                        _db.delete_extra_purchase(record_id)
-                    except Exception:  # pylint:disable=broad-except
-                        pass
-        return jsonify({
-            'success': False,
-            'message': str(exc),
-            'code': 'PURCHASE_FAILED'
-        }), 500
-
-    updated_profile = None
-    try:
-        updated_profile = donehub_api.get_user_by_id(profile['id'])
-        if updated_profile:
-            _store_donehub_profile_in_session(user, updated_profile)
-    except DoneHubAPIError:
-        updated_profile = None
+    status = _settle_quota_change(purchase['outbox_id'])
+    if status in ('failed', 'unknown', 'missing'):
+        return _settlement_error_response(status, 'PURCHASE_FAILED', round(available_units / CURRENCY_UNIT, 2))
 
-    dashboard_data, current_balance = _build_dashboard_data(user)
+    # 购买只影响余额与抽奖次数
+    dashboard_data, current_balance = _build_dashboard_data(user, sections=('balance', 'lottery'))
 
     return jsonify({
         'success': True,
@@ -774,6 +1067,73 @@ def purchase_lottery_attempt():
     })
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    if metrics is None:
+        return Response('metrics disabled\n', status=404, mimetype='text/plain')
+    if not _is_admin_request():
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/admin/profiles')
+def profile_report():
+    """合并各 worker 的请求分析结果，输出热点函数排行"""
+    if not _is_admin_request():
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    limit = request.args.get('limit', 30, type=int)
+    report = request_profiler.report(
+        endpoint=request.args.get('endpoint') or None,
+        sort=request.args.get('sort', 'cumulative'),
+        limit=max(1, min(limit, 200))
+    )
+    return Response(report, mimetype='text/plain')
+
+
+@app.route('/admin/slow-queries')
+def slow_query_report():
+    """各 worker 最近的慢查询，新的在前"""
+    if not _is_admin_request():
+        return jsonify({'success': False, 'message': 'forbidden'}), 403
+    if slow_query_log is None:
+        return jsonify({'success': False, 'message': '慢查询日志未开启'}), 404
+    entries = slow_query_log.entries(request.args.get('limit', type=int))
+    return jsonify({
+        'success': True,
+        'threshold_ms': SLOW_QUERY_MS,
+        'count': len(entries),
+        'entries': entries
+    })
+
+
+@app.route('/admin/outbox/unknown')
+def unknown_outbox_entries():
+    """结果未知、等待人工核对的额度调整"""
+    if not _is_admin_request():
+        return jsonify({'success': False, 'message': 'forbidden'}), 403
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    entries = _db.get_unknown_outbox_entries(limit)
+    return jsonify({'success': True, 'count': len(entries), 'entries': entries})
+
+
+@app.route('/admin/outbox/<int:entry_id>/resolve', methods=['POST'])
+def resolve_outbox_entry(entry_id):
+    """核对 DoneHub 后确认 unknown 条目：applied 为 true 时完成来源记录并记账，false 时撤销"""
+    if not _is_admin_request():
+        return jsonify({'success': False, 'message': 'forbidden'}), 403
+    payload = request.get_json(silent=True)
+    applied = payload.get('applied') if isinstance(payload, dict) else None
+    if not isinstance(applied, bool):
+        return jsonify({'success': False, 'message': '请求体需为 {"applied": true/false}', 'code': 'INVALID_PAYLOAD'}), 400
+
+    if not _db.resolve_unknown_outbox_entry(entry_id, applied):
+        return jsonify({'success': False, 'message': '条目不存在或不处于 unknown 状态', 'code': 'NOT_UNKNOWN'}), 409
+    entry = _db.get_outbox_entry(entry_id)
+    if applied:
+        _on_quota_change_applied(entry)
+    return jsonify({'success': True, 'entry': entry})
+
+
 def check_api_token():
     print("当前模式：DoneHub API 接入")
     print("正在校验 Access Token...")
@@ -0,0 +1,535 @@
+"""DatabaseImproved 微基准：在生产规模的合成数据上逐个计时公开方法并检查查询计划.
+
+- 按 --users/--days/--max-spins 等参数生成合成数据（用户、抽奖、签到、购买、记账流水、结算队列等）；
+- 对每个公开方法重复调用并统计 mean/p50/p95/max；
+- 通过记录型连接（connection_factory）捕获方法实际执行的 SQL 与绑定参数，按原样
+  执行 EXPLAIN QUERY PLAN（LIMIT ? 等绑定参数与字面量的计划可能不同，不能用展开后的
+  SQL 代替），标记全表扫描（SCAN 表且未使用索引）与临时 B 树排序（USE TEMP B-TREE）；
+- 与 --baseline 指定的历史结果对比，标记变慢或新出现的计划问题。
+
+示例：
+
+    python bench/db_bench.py --users 20000 --days 60 --output bench/results/db-base.json
+    python bench/db_bench.py --users 20000 --days 60 --baseline bench/results/db-base.json --strict
+"""
+
+import argparse
+import inspect
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from database import DatabaseImproved  # noqa: E402  pylint:disable=wrong-import-position
+
+# 连接管理、建表等基础设施方法不计入基准
+INFRASTRUCTURE_METHODS = {'get_connection', 'close_connection', 'pool_stats', 'init_db'}
+SKIPPED_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', 'SAVEPOINT', 'RELEASE')
+SCAN_PATTERN = re.compile(r'^SCAN (\w+)(.*)$')
+ALIAS_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+SQL_KEYWORDS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'ON', 'GROUP', 'ORDER', 'LIMIT', 'SET', 'USING', 'WHEN'}
+
+
+class RecordingCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        self.connection.record(sql, parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        rows = list(seq_of_parameters)
+        if rows:
+            self.connection.record(sql, rows[0])
+        return super().executemany(sql, rows)
+
+
+class RecordingConnection(sqlite3.Connection):
+    """记录语句与绑定参数的连接，recording 为 None 时不记录"""
+
+    recording: Optional[List[Tuple[str, Any]]] = None
+
+    def record(self, sql, parameters):
+        if self.recording is not None:
+            self.recording.append((sql, parameters))
+
+    def cursor(self, factory=RecordingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
+class BenchContext:
+    """生成数据的规模信息与随机数源，供各用例挑选参数"""
+
+    def __init__(self, db: DatabaseImproved, users: int, seed: Optional[int]):
+        self.db = db
+        self.users = users
+        self.rng = random.Random(seed)
+        self._next_linuxdo_id = 10_000_000
+
+    def user_id(self) -> int:
+        return self.rng.randint(1, self.users)
+
+    def donehub_user_id(self) -> int:
+        return self.user_id() + 1
+
+    def new_user_id(self) -> int:
+        """新建一个今天尚无记录的用户，用于每日只能执行一次的写操作"""
+        self._next_linuxdo_id += 1
+        user = self.db.get_or_create_user(str(self._next_linuxdo_id), f'bench{self._next_linuxdo_id}')
+        return user['id']
+
+    def quota_change(self, user_id: int, delta: int = -1) -> Dict[str, Any]:
+        return {'donehub_user_id': user_id + 1, 'delta_units': delta, 'cost': 1, 'remark': 'bench'}
+
+    def pending_outbox_id(self) -> int:
+        user_id = self.user_id()
+        record = self.db.create_lottery_record_atomic(
+            user_id, 10, 'BENCH', cost=20, max_attempts=10 ** 9, quota_change=self.quota_change(user_id)
+        )
+        return record['outbox_id']
+
+    def claimed_outbox_id(self) -> int:
+        entry_id = self.pending_outbox_id()
+        self.db.claim_outbox_entry(entry_id, time.time())
+        return entry_id
+
+    def random_row_id(self, table: str) -> int:
+        with self.db.get_connection() as conn:
+            row = conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()
+        return self.rng.randint(1, max(1, row[0] or 1))
+
+
+@dataclass
+class Case:
+    method: str
+    # 每次调用前（不计时）生成参数
+    make_args: Callable[[BenchContext], Tuple[tuple, dict]]
+
+
+def _args(*args, **kwargs):
+    return args, kwargs
+
+
+def build_cases() -> List[Case]:
+    now = time.time
+    return [
+        Case('get_or_create_user', lambda c: _args(str(100000 + c.user_id() - 1), 'user')),
+        Case('get_today_lottery_summary', lambda c: _args(c.user_id())),
+        Case('check_today_lottery', lambda c: _args(c.user_id())),
+        Case('create_lottery_record_atomic', lambda c: _args(
+            c.user_id(), 10, 'BENCH', cost=20, max_attempts=10 ** 9, quota_change=c.quota_change(1)
+        )),
+        Case('create_lottery_records_atomic', lambda c: _args(
+            c.user_id(), [(10, 'BENCH')] * 5, cost=20, max_attempts=10 ** 9, quota_change=c.quota_change(1)
+        )),
+        Case('update_lottery_status', lambda c: _args(c.random_row_id('lottery_records'), 'completed')),
+        Case('delete_lottery_record', lambda c: _args(
+            c.db.create_lottery_record_atomic(c.user_id(), 10, 'BENCH', cost=20, max_attempts=10 ** 9)['id']
+        )),
+        Case('get_user_lottery_history', lambda c: _args(c.user_id(), limit=10)),
+        Case('get_today_extra_purchases', lambda c: _args(c.user_id())),
+        Case('add_extra_purchase_atomic', lambda c: _args(
+            c.user_id(), 10 ** 9, count=2, quota_change=c.quota_change(1)
+        )),
+        Case('delete_extra_purchase', lambda c: _args(c.db.add_extra_purchase_atomic(c.user_id(), 10 ** 9)['id'])),
+        Case('get_today_lottery_totals', lambda c: _args(limit=10)),
+        Case('get_today_lottery_summary_for_user', lambda c: _args(c.user_id())),
+        Case('get_dashboard_snapshot', lambda c: _args(c.user_id(), history_limit=10, sign_history_limit=7,
+                                                       leaderboard_limit=10)),
+        Case('check_today_sign', lambda c: _args(c.user_id())),
+        Case('create_sign_record_atomic', lambda c: _args(c.new_user_id(), 50, quota_change=c.quota_change(1))),
+        Case('get_recent_sign_history', lambda c: _args(c.user_id(), limit=7)),
+        Case('update_sign_status', lambda c: _args(c.random_row_id('sign_records'), 'completed')),
+        Case('delete_sign_record', lambda c: _args(c.db.create_sign_record_atomic(c.new_user_id(), 50)['id'])),
+        Case('claim_due_outbox_entries', lambda c: _args(20, now())),
+        Case('claim_outbox_entry', lambda c: _args(c.pending_outbox_id(), now())),
+        Case('complete_outbox_entry', lambda c: _args(c.claimed_outbox_id())),
+        Case('retry_outbox_entry', lambda c: _args(c.claimed_outbox_id(), 'bench', now() + 3600)),
+        Case('fail_outbox_entry', lambda c: _args(c.claimed_outbox_id(), 'bench')),
+        Case('mark_outbox_unknown', lambda c: _args(c.claimed_outbox_id(), 'bench')),
+        Case('resolve_unknown_outbox_entry', lambda c: _args(_unknown_outbox_id(c), True)),
+        Case('expire_outbox_leases', lambda c: _args(now() - 120)),
+        Case('mark_stale_pending_records_unknown', lambda c: _args(600, 500000)),
+        Case('get_pending_quota_delta', lambda c: _args(c.donehub_user_id())),
+        Case('count_inflight_quota_changes', lambda c: _args(c.donehub_user_id())),
+        Case('get_outbox_entry', lambda c: _args(c.random_row_id('quota_outbox'))),
+        Case('get_outbox_stats', lambda c: _args()),
+        Case('get_unknown_outbox_entries', lambda c: _args(100)),
+        Case('get_user_ledger', lambda c: _args(c.user_id(), limit=50)),
+        Case('get_quota_ledger_position', lambda c: _args()),
+        Case('sum_quota_ledger_delta', lambda c: _args(c.user_id(), 0)),
+        Case('get_donehub_user_id', lambda c: _args(c.user_id())),
+        Case('set_donehub_user_id', lambda c: _args(c.user_id(), c.donehub_user_id())),
+        Case('delete_donehub_user_id', lambda c: _args(c.user_id())),
+        Case('get_cached_profile', lambda c: _args(c.donehub_user_id(), 300)),
+        Case('save_cached_profile', lambda c: _args(c.donehub_user_id(), _profile(c), 1000)),
+        Case('adjust_cached_profile_quota', lambda c: _args(c.donehub_user_id(), 1)),
+        Case('delete_cached_profile', lambda c: _args(c.donehub_user_id())),
+        Case('get_web_session', lambda c: _args(_session_id(c), now())),
+        Case('save_web_session', lambda c: _args(_session_id(c), json.dumps({'user': _profile(c)}), now() + 3600)),
+        Case('delete_web_session', lambda c: _args(_session_id(c))),
+        Case('delete_expired_web_sessions', lambda c: _args(now())),
+    ]
+
+
+def _unknown_outbox_id(ctx: BenchContext) -> int:
+    entry_id = ctx.claimed_outbox_id()
+    ctx.db.mark_outbox_unknown(entry_id, 'bench')
+    return entry_id
+
+
+def _session_id(ctx: BenchContext) -> str:
+    return f'bench-session-{ctx.user_id()}'
+
+
+def _profile(ctx: BenchContext) -> Dict[str, Any]:
+    user_id = ctx.user_id()
+    return {'id': user_id + 1, 'username': f'user{user_id}', 'quota': 500 * 500000, 'used_quota': 0,
+            'linuxdo_id': 100000 + user_id - 1}
+
+
+def generate_data(db: DatabaseImproved, users: int, days: int, max_spins: int, sign_rate: float,
+                  purchase_rate: float, cached_profiles: int, seed: Optional[int]) -> Dict[str, int]:
+    """直接批量写入合成数据，最后由已完成的抽奖记录重建当日汇总"""
+    rng = random.Random(seed)
+    today = date.today()
+    prizes = [10, 20, 30, 50, 60, 100]
+    weights = [0.50, 0.25, 0.15, 0.05, 0.04, 0.01]
+
+    def lottery_rows():
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            for user_id in range(1, users + 1):
+                for attempt in range(1, rng.randint(0, max_spins) + 1):
+                    # 今天的少量记录仍在结算中
+                    status = 'pending' if offset == 0 and rng.random() < 0.02 else 'completed'
+                    created = f'{day.isoformat()} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}'
+                    prize = rng.choices(prizes, weights=weights, k=1)[0]
+                    yield (user_id, prize, f'DIRECT_{prize}$', day.isoformat(), status, attempt, 20, created)
+
+    def sign_rows():
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            for user_id in range(1, users + 1):
+                if rng.random() < sign_rate:
+                    yield (user_id, rng.randint(50, 100), day.isoformat(), 'completed', f'{day.isoformat()} 08:00:00')
+
+    def purchase_rows():
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            for user_id in range(1, users + 1):
+                if rng.random() < purchase_rate:
+                    yield (user_id, day.isoformat(), rng.randint(1, 3))
+
+    started = time.time()
+    with db.get_connection(immediate=True) as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            'INSERT INTO users (id, linuxdo_id, username) VALUES (?, ?, ?)',
+            ((user_id, str(100000 + user_id - 1), f'ld_user{user_id - 1}') for user_id in range(1, users + 1))
+        )
+        cursor.executemany(
+            '''INSERT INTO lottery_records
+               (user_id, quota, redemption_code, lottery_date, status, attempt_number, cost, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            lottery_rows()
+        )
+        cursor.executemany(
+            'INSERT INTO sign_records (user_id, reward, sign_date, status, created_at) VALUES (?, ?, ?, ?, ?)',
+            sign_rows()
+        )
+        cursor.executemany(
+            'INSERT INTO lottery_extra_purchases (user_id, purchase_date, quantity) VALUES (?, ?, ?)',
+            purchase_rows()
+        )
+        # 每条抽奖、签到对应一条结算条目，已完成的同时有记账流水
+        cursor.execute(
+            '''INSERT INTO quota_outbox
+               (idempotency_key, user_id, donehub_user_id, source_type, source_id, cost, prize, delta_units,
+                remark, status, created_at)
+               SELECT 'lottery:' || id, user_id, user_id + 1, 'lottery', id, cost, quota, (quota - cost) * 500000,
+                      'bench', CASE status WHEN 'completed' THEN 'applied' ELSE 'pending' END, created_at
+               FROM lottery_records'''
+        )
+        cursor.execute(
+            '''INSERT INTO quota_outbox
+               (idempotency_key, user_id, donehub_user_id, source_type, source_id, prize, delta_units,
+                remark, status, created_at)
+               SELECT 'sign:' || id, user_id, user_id + 1, 'sign', id, reward, reward * 500000,
+                      'bench', 'applied', created_at
+               FROM sign_records'''
+        )
+        cursor.execute(
+            '''INSERT INTO quota_ledger
+               (user_id, donehub_user_id, source_type, source_id, cost, prize, delta_units, remark, created_at)
+               SELECT user_id, donehub_user_id, source_type, source_id, cost, prize, delta_units, remark, created_at
+               FROM quota_outbox WHERE status = 'applied' '''
+        )
+        cursor.executemany(
+            'INSERT INTO donehub_user_links (user_id, donehub_user_id) VALUES (?, ?)',
+            ((user_id, user_id + 1) for user_id in range(1, users + 1))
+        )
+        now = time.time()
+        cursor.executemany(
+            'INSERT INTO donehub_profile_cache (donehub_user_id, profile, updated_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (
+                (user_id + 1, json.dumps({'id': user_id + 1, 'quota': 500 * 500000, 'used_quota': 0}), now, now - user_id)
+                for user_id in range(1, min(users, cached_profiles) + 1)
+            )
+        )
+        # 每个用户一个会话，其中十分之一已过期
+        cursor.executemany(
+            'INSERT INTO web_sessions (id, data, expires_at) VALUES (?, ?, ?)',
+            (
+                (f'bench-session-{user_id}', json.dumps({'user': {'id': user_id}}),
+                 now - 60 if user_id % 10 == 0 else now + 86400)
+                for user_id in range(1, users + 1)
+            )
+        )
+        db._rebuild_daily_totals(cursor)  # pylint:disable=protected-access
+
+    with db.get_connection() as conn:
+        conn.execute('ANALYZE')
+        counts = {
+            table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('users', 'lottery_records', 'sign_records', 'lottery_extra_purchases',
+                          'lottery_daily_totals', 'quota_outbox', 'quota_ledger', 'donehub_profile_cache',
+                          'web_sessions')
+        }
+    counts['generation_seconds'] = round(time.time() - started, 2)
+    return counts
+
+
+def table_aliases(sql: str, tables: set) -> Dict[str, str]:
+    """FROM/JOIN 子句中的别名 -> 表名，查询计划里 SCAN 的是别名"""
+    aliases = {table: table for table in tables}
+    for table, alias in ALIAS_PATTERN.findall(sql):
+        if table in tables and alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def explain_statements(conn: sqlite3.Connection, statements: List[Tuple[str, Any]]) -> List[Dict[str, Any]]:
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    plans = []
+    seen = set()
+    for sql, parameters in statements:
+        normalized = ' '.join(sql.split())
+        if not normalized or normalized.upper().startswith(SKIPPED_STATEMENTS) or normalized in seen:
+            continue
+        seen.add(normalized)
+        aliases = table_aliases(normalized, tables)
+        try:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        except sqlite3.Error as exc:
+            plans.append({'sql': normalized, 'plan': [], 'flags': [], 'error': str(exc)})
+            continue
+
+        details = [row[3] for row in rows]
+        flags = []
+        for detail in details:
+            match = SCAN_PATTERN.match(detail)
+            if match and match.group(1) in aliases and 'USING' not in match.group(2):
+                flags.append(f'full_scan:{aliases[match.group(1)]}')
+            if 'USE TEMP B-TREE' in detail:
+                flags.append('temp_btree')
+        plans.append({'sql': normalized, 'plan': details, 'flags': sorted(set(flags))})
+    return plans
+
+
+def run_case(db: DatabaseImproved, ctx: BenchContext, case: Case, repeat: int) -> Dict[str, Any]:
+    method = getattr(db, case.method)
+
+    # 先单独执行一次并记录实际 SQL，用于查询计划分析
+    args, kwargs = case.make_args(ctx)
+    conn = db._acquire_connection()  # pylint:disable=protected-access
+    statements: List[Tuple[str, Any]] = []
+    conn.recording = statements
+    try:
+        method(*args, **kwargs)
+    finally:
+        conn.recording = None
+    plans = explain_statements(conn, statements)
+
+    timings = []
+    for _ in range(repeat):
+        args, kwargs = case.make_args(ctx)
+        started = time.perf_counter()
+        method(*args, **kwargs)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    def pct(value):
+        # nearest-rank 百分位
+        return round(timings[max(0, math.ceil(len(timings) * value) - 1)], 4)
+
+    return {
+        'calls': len(timings),
+        'mean_ms': round(sum(timings) / len(timings), 4),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'max_ms': round(timings[-1], 4),
+        'statements': len([plan for plan in plans if 'error' not in plan]),
+        'flags': sorted({flag for plan in plans for flag in plan['flags']}),
+        'plans': plans,
+    }
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+                          min_delta_ms: float) -> Dict[str, List[str]]:
+    regressions = {}
+    for name, current in results.items():
+        before = baseline.get('methods', {}).get(name)
+        if not before:
+            continue
+        notes = []
+        old, new = before.get('p50_ms'), current['p50_ms']
+        if old and new > old * threshold and new - old > min_delta_ms:
+            notes.append(f'p50 {old}ms -> {new}ms ({(new / old - 1) * 100:+.0f}%)')
+        new_flags = sorted(set(current['flags']) - set(before.get('flags', [])))
+        if new_flags:
+            notes.append(f"新增计划问题 {', '.join(new_flags)}")
+        if notes:
+            regressions[name] = notes
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True,
+                              timeout=10, check=False).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='DatabaseImproved 微基准')
+    parser.add_argument('--users', type=int, default=5000, help='合成用户数')
+    parser.add_argument('--days', type=int, default=30, help='生成多少天的历史数据（含今天）')
+    parser.add_argument('--max-spins', type=int, default=5, help='每个用户每天的最多抽奖次数（均匀随机）')
+    parser.add_argument('--sign-rate', type=float, default=0.6, help='每个用户每天签到的概率')
+    parser.add_argument('--purchase-rate', type=float, default=0.05, help='每个用户每天购买额外次数的概率')
+    parser.add_argument('--cached-profiles', type=int, default=1000, help='资料缓存中的条目数')
+    parser.add_argument('--repeat', type=int, default=200, help='每个方法的计时调用次数')
+    parser.add_argument('--method', action='append', default=[], help='只运行指定方法，可重复')
+    parser.add_argument('--db', default=None, help='数据库路径，默认使用临时文件')
+    parser.add_argument('--reuse', action='store_true', help='--db 已存在时直接复用，不重新生成数据')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default=None, help='与之前的结果 JSON 对比')
+    parser.add_argument('--threshold', type=float, default=1.25, help='p50 超过基线的倍数时视为变慢')
+    parser.add_argument('--min-delta-ms', type=float, default=0.02, help='忽略小于该差值的波动')
+    parser.add_argument('--output', default=None, help='结果 JSON 路径，默认 bench/results/db-<时间>.json')
+    parser.add_argument('--strict', action='store_true', help='存在变慢或全表扫描时以非零状态退出')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    tmpdir = None
+    db_path = args.db
+    if db_path is None:
+        tmpdir = tempfile.mkdtemp(prefix='lucky-db-bench-')
+        db_path = os.path.join(tmpdir, 'bench.db')
+
+    reuse = args.reuse and os.path.exists(db_path)
+    if not reuse:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    db = DatabaseImproved(db_path, connection_factory=RecordingConnection)
+    if reuse:
+        with db.get_connection() as conn:
+            users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        counts = {'reused': True}
+    else:
+        print(f"生成合成数据: {args.users} 用户 × {args.days} 天 ...")
+        counts = generate_data(db, args.users, args.days, args.max_spins, args.sign_rate,
+                               args.purchase_rate, args.cached_profiles, args.seed)
+        users = args.users
+        print(json.dumps(counts, ensure_ascii=False))
+
+    ctx = BenchContext(db, users, args.seed)
+    cases = build_cases()
+    public_methods = {
+        name for name, _ in inspect.getmembers(DatabaseImproved, inspect.isfunction)
+        if not name.startswith('_') and name not in INFRASTRUCTURE_METHODS
+    }
+    uncovered = sorted(public_methods - {case.method for case in cases})
+    if args.method:
+        cases = [case for case in cases if case.method in args.method]
+
+    results = {}
+    for case in cases:
+        results[case.method] = run_case(db, ctx, case, args.repeat)
+
+    baseline = None
+    regressions = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+        regressions = compare_with_baseline(results, baseline, args.threshold, args.min_delta_ms)
+
+    flagged = {name: result['flags'] for name, result in results.items() if result['flags']}
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'sqlite_version': sqlite3.sqlite_version,
+        'parameters': {key: getattr(args, key) for key in (
+            'users', 'days', 'max_spins', 'sign_rate', 'purchase_rate', 'cached_profiles', 'repeat', 'seed'
+        )},
+        'data': counts,
+        'methods': results,
+        'flagged': flagged,
+        'uncovered_methods': uncovered,
+        'regressions': regressions,
+    }
+
+    output = os.path.abspath(args.output or os.path.join(
+        BENCH_DIR, 'results', f"db-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    ))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+
+    print(f"\n{'method':<38} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}  flags")
+    for name, result in results.items():
+        marker = ' !' if name in regressions else ''
+        print(f"{name:<38} {result['mean_ms']:>9} {result['p50_ms']:>9} {result['p95_ms']:>9} "
+              f"{result['max_ms']:>9}  {', '.join(result['flags'])}{marker}")
+    if uncovered:
+        print(f"\n未覆盖的公开方法: {', '.join(uncovered)}")
+    if regressions:
+        print('\n相对基线变慢或出现新问题:')
+        for name, notes in regressions.items():
+            print(f"  {name}: {'; '.join(notes)}")
+    print(f"\n结果已写入 {output}")
+
+    db.close_connection()
+    if tmpdir:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.rmdir(tmpdir)
+
+    if args.strict and (regressions or flagged):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,475 @@
+"""本地 DoneHub 替身服务，用于离线压测与联调（仅依赖标准库）.
+
+实现 DoneHubAPI 用到的接口：
+
+- GET  /api/user/self
+- GET  /api/user/{id}
+- GET  /api/user/?keyword=
+- POST /api/user/quota/{id}
+
+额度变更记录在内存流水中，可配置延迟分布、错误率与读写复制延迟。
+另提供 /_fake/stats、/_fake/ledger、/_fake/config、/_fake/reset 供压测脚本读取结果、调整故障参数。
+
+示例：
+
+    python bench/fake_donehub.py --port 18080 --users 500 \\
+        --latency lognormal:40:0.6 --latency quota=lognormal:120:0.8 \\
+        --error-rate 0.01 --timeout-rate 0.005 --replication-lag uniform:0.2:1.5
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+ENDPOINTS = ('self', 'user', 'search', 'quota')
+REMARK_KEY_PATTERN = re.compile(r'\[([^\[\]]+)\]\s*$')
+
+
+class LatencyDistribution:
+    """延迟分布，单位毫秒.
+
+    支持 fixed:ms、uniform:min:max、normal:mean:stddev、lognormal:median:sigma、exponential:mean，
+    只写数字时等同 fixed。
+    """
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal', 'exponential')
+
+    def __init__(self, spec: str = 'fixed:0'):
+        parts = str(spec).strip().split(':')
+        if len(parts) == 1:
+            parts = ['fixed'] + parts
+        self.kind = parts[0]
+        if self.kind not in self.KINDS:
+            raise ValueError(f"未知的延迟分布: {spec}")
+        try:
+            self.params = [float(value) for value in parts[1:]]
+        except ValueError as exc:
+            raise ValueError(f"延迟参数必须是数字: {spec}") from exc
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'exponential': 1}[self.kind]
+        if len(self.params) != expected:
+            raise ValueError(f"{self.kind} 需要 {expected} 个参数: {spec}")
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        """返回一次采样的秒数"""
+        if self.kind == 'fixed':
+            value = self.params[0]
+        elif self.kind == 'uniform':
+            value = rng.uniform(self.params[0], self.params[1])
+        elif self.kind == 'normal':
+            value = rng.gauss(self.params[0], self.params[1])
+        elif self.kind == 'lognormal':
+            value = rng.lognormvariate(math.log(max(self.params[0], 1e-6)), self.params[1])
+        else:
+            value = rng.expovariate(1.0 / self.params[0]) if self.params[0] > 0 else 0.0
+        return max(0.0, value) / 1000.0
+
+    def __repr__(self):
+        return self.spec
+
+
+class FakeDoneHub:
+    """内存中的 DoneHub 状态与故障注入参数.
+
+    - error_rate：返回 500，额度不变；
+    - api_error_rate：返回 200 + success=false，额度不变；
+    - timeout_rate：额度已变更，但响应拖延 hang_seconds 秒（用于触发客户端超时）；
+    - drop_rate：额度已变更，直接断开连接不返回响应；
+    - replication_lag：额度写入后经过该延迟才对读取可见，模拟主从复制延迟。
+    错误注入只作用于 /api/user/quota，读取接口只受延迟影响。
+    """
+
+    def __init__(self, users: int = 100, initial_quota: int = 500 * 500000, token: Optional[str] = None,
+                 latency: Optional[Dict[str, str]] = None, error_rate: float = 0.0, api_error_rate: float = 0.0,
+                 timeout_rate: float = 0.0, drop_rate: float = 0.0, hang_seconds: float = 30.0,
+                 replication_lag: str = 'fixed:0', seed: Optional[int] = None):
+        self.token = token
+        self.initial_quota = initial_quota
+        self.user_count = users
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.configure(
+            latency=latency or {}, error_rate=error_rate, api_error_rate=api_error_rate,
+            timeout_rate=timeout_rate, drop_rate=drop_rate, hang_seconds=hang_seconds,
+            replication_lag=replication_lag
+        )
+        self.reset()
+
+    def configure(self, latency: Optional[Dict[str, str]] = None, **options) -> Dict[str, Any]:
+        """运行中调整故障参数，未传入的参数保持不变"""
+        with self._lock:
+            if latency is not None:
+                default = LatencyDistribution(latency.get('default', getattr(self, '_default_latency', 'fixed:0')))
+                self.latency = {name: default for name in ENDPOINTS}
+                for name, spec in latency.items():
+                    if name == 'default':
+                        continue
+                    if name not in ENDPOINTS:
+                        raise ValueError(f"未知的接口名: {name}，可选 {', '.join(ENDPOINTS)}")
+                    self.latency[name] = LatencyDistribution(spec)
+                self._default_latency = default.spec
+            for name in ('error_rate', 'api_error_rate', 'timeout_rate', 'drop_rate', 'hang_seconds'):
+                if name in options and options[name] is not None:
+                    setattr(self, name, float(options[name]))
+            if options.get('replication_lag') is not None:
+                self.replication_lag = LatencyDistribution(options['replication_lag'])
+            return self.describe()
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'latency': {name: repr(dist) for name, dist in self.latency.items()},
+            'error_rate': self.error_rate,
+            'api_error_rate': self.api_error_rate,
+            'timeout_rate': self.timeout_rate,
+            'drop_rate': self.drop_rate,
+            'hang_seconds': self.hang_seconds,
+            'replication_lag': repr(self.replication_lag),
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.users: Dict[int, Dict[str, Any]] = {
+                1: {'id': 1, 'username': 'admin', 'display_name': 'admin', 'role': 100,
+                    'quota': self.initial_quota, 'used_quota': 0, 'linuxdo_id': 0, 'linuxdo_username': ''}
+            }
+            for index in range(self.user_count):
+                user_id = index + 2
+                self.users[user_id] = {
+                    'id': user_id,
+                    'username': f'user{index}',
+                    'display_name': f'user{index}',
+                    'role': 1,
+                    'quota': self.initial_quota,
+                    'used_quota': 0,
+                    'linuxdo_id': 100000 + index,
+                    'linuxdo_username': f'ld_user{index}',
+                }
+            # 已写入但尚未对读取可见的额度变化：user_id -> [(visible_at, delta)]
+            self._unreplicated: Dict[int, List] = {}
+            self.ledger: List[Dict[str, Any]] = []
+            self._keys: Dict[str, int] = {}
+            self.stats = {
+                'requests': {name: 0 for name in ENDPOINTS},
+                'injected': {'error': 0, 'api_error': 0, 'timeout': 0, 'drop': 0},
+                'duplicate_keys': 0,
+                'stale_reads': 0,
+            }
+
+    def sample_latency(self, endpoint: str) -> float:
+        with self._lock:
+            return self.latency[endpoint].sample(self._rng)
+
+    def pick_fault(self) -> Optional[str]:
+        """按配置的比例为一次额度请求抽取故障类型"""
+        with self._lock:
+            roll = self._rng.random()
+            for name, rate in (('error', self.error_rate), ('api_error', self.api_error_rate),
+                               ('timeout', self.timeout_rate), ('drop', self.drop_rate)):
+                if roll < rate:
+                    self.stats['injected'][name] += 1
+                    return name
+                roll -= rate
+            return None
+
+    def count_request(self, endpoint: str) -> None:
+        with self._lock:
+            self.stats['requests'][endpoint] += 1
+
+    def _visible_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """调用方需持有锁；把已过复制延迟的变化合并进可见额度"""
+        user = self.users.get(user_id)
+        if user is None:
+            return None
+        pending = self._unreplicated.get(user_id)
+        if pending:
+            now = time.monotonic()
+            remaining = []
+            for visible_at, delta in pending:
+                if visible_at <= now:
+                    user['quota'] += delta
+                else:
+                    remaining.append((visible_at, delta))
+            if remaining:
+                self.stats['stale_reads'] += 1
+                self._unreplicated[user_id] = remaining
+            else:
+                self._unreplicated.pop(user_id, None)
+        return dict(user)
+
+    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._visible_user(user_id)
+
+    def search(self, keyword: str) -> List[Dict[str, Any]]:
+        keyword = str(keyword or '')
+        with self._lock:
+            matched = [
+                user_id for user_id, user in self.users.items()
+                if keyword and keyword in (user['username'], str(user['linuxdo_id']), user['linuxdo_username'])
+            ]
+            return [self._visible_user(user_id) for user_id in matched]
+
+    def change_quota(self, user_id: int, delta: int, remark: str = '') -> bool:
+        with self._lock:
+            if user_id not in self.users:
+                return False
+            key_match = REMARK_KEY_PATTERN.search(remark or '')
+            key = key_match.group(1) if key_match else None
+            if key:
+                if key in self._keys:
+                    self.stats['duplicate_keys'] += 1
+                self._keys[key] = self._keys.get(key, 0) + 1
+
+            lag = self.replication_lag.sample(self._rng)
+            if lag > 0:
+                self._unreplicated.setdefault(user_id, []).append((time.monotonic() + lag, delta))
+            else:
+                self.users[user_id]['quota'] += delta
+            self.ledger.append({
+                'seq': len(self.ledger) + 1,
+                'user_id': user_id,
+                'quota': delta,
+                'remark': remark,
+                'idempotency_key': key,
+                'at': time.time(),
+            })
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'config': self.describe(),
+                'requests': dict(self.stats['requests']),
+                'injected': dict(self.stats['injected']),
+                'duplicate_keys': self.stats['duplicate_keys'],
+                'stale_reads': self.stats['stale_reads'],
+                'ledger_entries': len(self.ledger),
+                'ledger_total': sum(entry['quota'] for entry in self.ledger),
+            }
+
+
+class FakeDoneHubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeDoneHub/1.0'
+
+    @property
+    def hub(self) -> FakeDoneHub:
+        return self.server.hub
+
+    def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def _authorized(self) -> bool:
+        if not self.hub.token:
+            return True
+        if self.headers.get('Authorization') == f'Bearer {self.hub.token}':
+            return True
+        self._send_json({'success': False, 'message': '无权进行此操作，access token 无效'}, 401)
+        return False
+
+    def _delay(self, endpoint: str) -> None:
+        self.hub.count_request(endpoint)
+        delay = self.hub.sample_latency(endpoint)
+        if delay:
+            time.sleep(delay)
+
+    def do_GET(self):  # pylint:disable=invalid-name
+        parsed = urlparse(self.path)
+        path = parsed.path
+
+        if path.startswith('/_fake/'):
+            return self._handle_control('GET', path)
+        if not self._authorized():
+            return None
+
+        if path == '/api/user/self':
+            self._delay('self')
+            return self._send_json({'success': True, 'message': '', 'data': self.hub.get_user(1)})
+
+        if path == '/api/user/':
+            self._delay('search')
+            keyword = parse_qs(parsed.query).get('keyword', [''])[0]
+            items = self.hub.search(keyword)
+            return self._send_json({
+                'success': True,
+                'message': '',
+                'data': {'data': items, 'page': 1, 'size': len(items), 'total_count': len(items)}
+            })
+
+        match = re.fullmatch(r'/api/user/(\d+)', path)
+        if match:
+            self._delay('user')
+            user = self.hub.get_user(int(match.group(1)))
+            if user is None:
+                return self._send_json({'success': False, 'message': '用户不存在'})
+            return self._send_json({'success': True, 'message': '', 'data': user})
+
+        return self._send_json({'success': False, 'message': 'not found'}, 404)
+
+    def do_POST(self):  # pylint:disable=invalid-name
+        path = urlparse(self.path).path
+        if path.startswith('/_fake/'):
+            return self._handle_control('POST', path)
+        if not self._authorized():
+            return None
+
+        match = re.fullmatch(r'/api/user/quota/(\d+)', path)
+        if not match:
+            return self._send_json({'success': False, 'message': 'not found'}, 404)
+
+        payload = self._read_json()
+        self._delay('quota')
+        fault = self.hub.pick_fault()
+        if fault == 'error':
+            return self._send_json({'success': False, 'message': 'injected server error'}, 500)
+        if fault == 'api_error':
+            return self._send_json({'success': False, 'message': 'injected api error'})
+
+        try:
+            delta = int(payload.get('quota'))
+        except (TypeError, ValueError):
+            return self._send_json({'success': False, 'message': 'quota 参数错误'})
+
+        if not self.hub.change_quota(int(match.group(1)), delta, str(payload.get('remark') or '')):
+            return self._send_json({'success': False, 'message': '用户不存在'})
+
+        if fault == 'timeout':
+            time.sleep(self.hub.hang_seconds)
+        elif fault == 'drop':
+            self.close_connection = True
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return None
+        return self._send_json({'success': True, 'message': ''})
+
+    def _handle_control(self, method: str, path: str):
+        if path == '/_fake/stats' and method == 'GET':
+            return self._send_json(self.hub.snapshot())
+        if path == '/_fake/ledger' and method == 'GET':
+            with self.hub._lock:  # pylint:disable=protected-access
+                ledger = list(self.hub.ledger)
+            return self._send_json({'data': ledger})
+        if path == '/_fake/config' and method == 'GET':
+            return self._send_json(self.hub.describe())
+        if path == '/_fake/config' and method == 'POST':
+            try:
+                return self._send_json(self.hub.configure(**self._read_json()))
+            except (TypeError, ValueError) as exc:
+                return self._send_json({'success': False, 'message': str(exc)}, 400)
+        if path == '/_fake/reset' and method == 'POST':
+            self.hub.reset()
+            return self._send_json({'success': True})
+        return self._send_json({'success': False, 'message': 'not found'}, 404)
+
+
+class FakeDoneHubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, hub: FakeDoneHub, verbose: bool = False):
+        super().__init__(address, FakeDoneHubHandler)
+        self.hub = hub
+        self.verbose = verbose
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def start_server(hub: Optional[FakeDoneHub] = None, host: str = '127.0.0.1', port: int = 0,
+                 verbose: bool = False) -> FakeDoneHubServer:
+    """在后台线程中启动替身服务，port=0 时自动分配端口（见 server.base_url）"""
+    server = FakeDoneHubServer((host, port), hub or FakeDoneHub(), verbose=verbose)
+    thread = threading.Thread(target=server.serve_forever, name='fake-donehub', daemon=True)
+    thread.start()
+    return server
+
+
+def parse_latency_options(values: List[str]) -> Dict[str, str]:
+    """把 ["lognormal:40:0.6", "quota=fixed:200"] 解析为 {"default": ..., "quota": ...}"""
+    latency = {}
+    for value in values or []:
+        name, sep, spec = value.partition('=')
+        if sep:
+            latency[name.strip()] = spec.strip()
+        else:
+            latency['default'] = value.strip()
+    return latency
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='本地 DoneHub 替身服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--token', default=None, help='要求的 access token，不设置则不校验')
+    parser.add_argument('--users', type=int, default=100, help='预置的普通用户数量')
+    parser.add_argument('--initial-quota', type=int, default=500 * 500000, help='每个用户的初始额度（原始单位）')
+    parser.add_argument('--latency', action='append', default=[],
+                        help='延迟分布（毫秒），如 lognormal:40:0.6；加接口名前缀单独设置，如 quota=fixed:200')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='额度接口返回 500 的比例')
+    parser.add_argument('--api-error-rate', type=float, default=0.0, help='额度接口返回 success=false 的比例')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='额度已变更但响应拖延的比例')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='额度已变更但直接断开连接的比例')
+    parser.add_argument('--hang-seconds', type=float, default=30.0, help='timeout 故障时的拖延时间')
+    parser.add_argument('--replication-lag', default='fixed:0', help='写入后对读取可见的延迟分布（毫秒）')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true', help='输出访问日志')
+    return parser
+
+
+def main(argv=None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    hub = FakeDoneHub(
+        users=args.users,
+        initial_quota=args.initial_quota,
+        token=args.token,
+        latency=parse_latency_options(args.latency),
+        error_rate=args.error_rate,
+        api_error_rate=args.api_error_rate,
+        timeout_rate=args.timeout_rate,
+        drop_rate=args.drop_rate,
+        hang_seconds=args.hang_seconds,
+        replication_lag=args.replication_lag,
+        seed=args.seed,
+    )
+    server = FakeDoneHubServer((args.host, args.port), hub, verbose=args.verbose)
+    print(f"Fake DoneHub 已启动: {server.base_url}")
+    print(json.dumps(hub.describe(), ensure_ascii=False, indent=2))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,473 @@
+"""端到端压测：在 gunicorn 下运行 app.py，连接本地 DoneHub 替身服务.
+
+流程：
+
+1. 在临时目录生成 config.py 与独立的 lucky.db，不会触碰仓库中的配置与数据；
+2. 启动 bench/fake_donehub.py 子进程，以及 gunicorn（沿用 gunicorn_config.py，可覆盖 worker/线程数）；
+3. 通过 Flask test_client 的 session_transaction 为每个模拟用户生成登录会话 Cookie，跳过 OAuth；
+4. 按配置的比例并发请求 /、/dashboard-data、/sign、/lottery、/lottery/purchase；
+5. 输出各路由与整体的 p50/p95/p99、RPS、状态码分布，以及 DoneHub 替身与结算队列的统计，写入 JSON。
+
+示例：
+
+    python bench/load_test.py --concurrency 32 --duration 60 --users 200 \\
+        --mix dashboard=50,index=10,sign=10,lottery=25,purchase=5 \\
+        --latency lognormal:40:0.6 --output bench/results/baseline.json
+
+    # 与之前的结果对比
+    python bench/load_test.py --compare bench/results/baseline.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+ROUTES = {
+    'index': ('GET', '/'),
+    'dashboard': ('GET', '/dashboard-data'),
+    'sign': ('POST', '/sign'),
+    'lottery': ('POST', '/lottery'),
+    'purchase': ('POST', '/lottery/purchase'),
+}
+DEFAULT_MIX = 'index=10,dashboard=50,sign=10,lottery=25,purchase=5'
+ACCESS_TOKEN = 'bench-token'
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"未知的路由: {name}，可选 {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("请求比例不能为空")
+    return mix
+
+
+def parse_config_overrides(values: List[str]) -> Dict[str, Any]:
+    """--set KEY=VALUE，VALUE 按 JSON 解析，失败时按字符串处理"""
+    overrides = {}
+    for value in values or []:
+        key, sep, raw = value.partition('=')
+        if not sep or not key.isidentifier():
+            raise ValueError(f"配置覆盖格式应为 KEY=VALUE: {value}")
+        try:
+            overrides[key] = json.loads(raw)
+        except ValueError:
+            overrides[key] = raw
+    return overrides
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_http(url: str, timeout: float = 30.0, process: Optional[subprocess.Popen] = None) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"进程已退出（返回码 {process.returncode}）: {url}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # nearest-rank
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(sample['latency'] * 1000 for sample in samples)
+    statuses = Counter(str(sample['status']) for sample in samples)
+    errors = sum(1 for sample in samples if sample['status'] == 'error' or sample['status'] >= 500)
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'status': dict(sorted(statuses.items())),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'p50': round(percentile(latencies, 50), 2) if latencies else None,
+            'p95': round(percentile(latencies, 95), 2) if latencies else None,
+            'p99': round(percentile(latencies, 99), 2) if latencies else None,
+            'max': round(latencies[-1], 2) if latencies else None,
+        },
+    }
+
+
+def git_revision() -> Dict[str, Any]:
+    def run(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=REPO_DIR, capture_output=True, text=True,
+                                  timeout=10, check=False).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ''
+    return {
+        'commit': run('rev-parse', 'HEAD') or None,
+        'dirty': bool(run('status', '--porcelain', '--untracked-files=no')),
+    }
+
+
+class BenchEnvironment:
+    """临时目录中的配置、数据库与 DoneHub 替身、gunicorn 子进程"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='lucky-bench-')
+        self.processes: List[subprocess.Popen] = []
+        self.donehub_url = args.donehub_url
+        self.app_url = None
+        self.app_module = None
+        self.cookie_name = None
+        self.cookies: List[str] = []
+
+    def write_config(self) -> None:
+        values = {
+            'SECRET_KEY': secrets.token_hex(16),
+            'LINUXDO_CLIENT_ID': 'bench',
+            'LINUXDO_CLIENT_SECRET': 'bench',
+            'LINUXDO_REDIRECT_URI': 'http://127.0.0.1/callback',
+            'DONEHUB_BASE_URL': self.donehub_url,
+            'DONEHUB_ACCESS_TOKEN': ACCESS_TOKEN,
+        }
+        values.update(parse_config_overrides(self.args.set))
+        with open(os.path.join(self.workdir, 'config.py'), 'w', encoding='utf-8') as handle:
+            handle.write('# 压测临时配置，由 bench/load_test.py 生成\n')
+            for key, value in values.items():
+                handle.write(f'{key} = {value!r}\n')
+
+    def start_donehub(self) -> None:
+        if self.donehub_url:
+            return
+        port = free_port()
+        command = [
+            sys.executable, os.path.join(BENCH_DIR, 'fake_donehub.py'),
+            '--port', str(port), '--token', ACCESS_TOKEN, '--users', str(self.args.users),
+            '--replication-lag', self.args.replication_lag,
+            '--error-rate', str(self.args.error_rate),
+            '--timeout-rate', str(self.args.timeout_rate),
+            '--hang-seconds', str(self.args.hang_seconds),
+        ]
+        for latency in self.args.latency:
+            command += ['--latency', latency]
+        if self.args.seed is not None:
+            command += ['--seed', str(self.args.seed)]
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.processes.append(process)
+        self.donehub_url = f'http://127.0.0.1:{port}'
+        wait_for_http(f'{self.donehub_url}/_fake/config', process=process)
+
+    def prepare_sessions(self) -> None:
+        """在本进程中导入 app（使用临时配置与数据库），为每个模拟用户生成会话 Cookie"""
+        os.chdir(self.workdir)
+        sys.path.insert(0, REPO_DIR)
+        sys.path.insert(0, self.workdir)
+        import app as app_module  # pylint:disable=import-outside-toplevel
+
+        self.app_module = app_module
+        flask_app = app_module.app
+        self.cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        for index in range(self.args.users):
+            # 与替身服务预置的用户一一对应：linuxdo_id = 100000 + index
+            user = app_module._db.get_or_create_user(str(100000 + index), f'ld_user{index}')  # pylint:disable=protected-access
+            client = flask_app.test_client()
+            with client.session_transaction() as sess:
+                sess['user'] = {
+                    'id': user['id'],
+                    'username': user['username'],
+                    'linuxdo_id': user['linuxdo_id'],
+                }
+            cookie = client.get_cookie(self.cookie_name)
+            if cookie is None:
+                raise RuntimeError("未能生成会话 Cookie")
+            self.cookies.append(cookie.value)
+
+    def start_app(self) -> None:
+        port = free_port()
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '-c', os.path.join(REPO_DIR, 'gunicorn_config.py'),
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(self.args.workers),
+            '--threads', str(self.args.threads),
+            '--chdir', self.workdir,
+            '--pythonpath', f'{REPO_DIR},{self.workdir}',
+            '--access-logfile', os.devnull,
+            '--error-logfile', os.path.join(self.workdir, 'gunicorn.log'),
+            # 压测期间不按请求数重启 worker，避免结果抖动
+            '--max-requests', '0',
+            'app:app',
+        ]
+        process = subprocess.Popen(command, cwd=self.workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.processes.append(process)
+        self.app_url = f'http://127.0.0.1:{port}'
+        wait_for_http(f'{self.app_url}/', timeout=60, process=process)
+
+    def fetch_donehub_stats(self) -> Optional[Dict[str, Any]]:
+        try:
+            return requests.get(f'{self.donehub_url}/_fake/stats', timeout=5).json()
+        except (requests.RequestException, ValueError):
+            return None
+
+    def wait_for_settlement(self, timeout: float) -> Dict[str, int]:
+        """等待后台结算队列清空，返回各状态条目数"""
+        db = self.app_module._db  # pylint:disable=protected-access
+        deadline = time.monotonic() + timeout
+        stats = db.get_outbox_stats()
+        while time.monotonic() < deadline and (stats.get('pending') or stats.get('processing')):
+            time.sleep(0.5)
+            stats = db.get_outbox_stats()
+        return stats
+
+    def close(self) -> None:
+        for process in reversed(self.processes):
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in self.processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.args.keep_workdir:
+            print(f"临时目录保留在 {self.workdir}")
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class LoadGenerator:
+    """固定并发的闭环压测：每个线程发完一个请求立即发下一个"""
+
+    def __init__(self, base_url: str, cookie_name: str, cookies: List[str], mix: Dict[str, float],
+                 concurrency: int, seed: Optional[int] = None, timeout: float = 30.0):
+        self.base_url = base_url
+        self.cookie_name = cookie_name
+        self.cookies = cookies
+        self.route_names = list(mix)
+        self.route_weights = [mix[name] for name in self.route_names]
+        self.concurrency = concurrency
+        self.seed = seed
+        self.timeout = timeout
+        self.samples: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _worker(self, index: int, warmup_until: float, deadline: float) -> None:
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        http = requests.Session()
+        etags: Dict[int, str] = {}
+        local_samples = []
+
+        while True:
+            started = time.monotonic()
+            if started >= deadline:
+                break
+            user_index = rng.randrange(len(self.cookies))
+            route = rng.choices(self.route_names, weights=self.route_weights, k=1)[0]
+            method, path = ROUTES[route]
+            headers = {'Cookie': f'{self.cookie_name}={self.cookies[user_index]}'}
+            kwargs = {}
+            if route == 'dashboard' and user_index in etags:
+                # 与前端一致：带上次的 ETag 重新验证
+                headers['If-None-Match'] = etags[user_index]
+            if route == 'purchase':
+                kwargs['json'] = {'quantity': 1}
+
+            try:
+                response = http.request(method, f'{self.base_url}{path}', headers=headers,
+                                        timeout=self.timeout, allow_redirects=False, **kwargs)
+                status = response.status_code
+                if route == 'dashboard' and response.headers.get('ETag'):
+                    etags[user_index] = response.headers['ETag']
+            except requests.RequestException:
+                status = 'error'
+            finished = time.monotonic()
+
+            if started >= warmup_until:
+                local_samples.append({'route': route, 'status': status, 'latency': finished - started})
+
+        with self._lock:
+            self.samples.extend(local_samples)
+
+    def run(self, duration: float, warmup: float) -> float:
+        start = time.monotonic()
+        warmup_until = start + warmup
+        deadline = warmup_until + duration
+        threads = [
+            threading.Thread(target=self._worker, args=(index, warmup_until, deadline), daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return max(0.001, time.monotonic() - warmup_until)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    lines = []
+    for name in ['overall'] + sorted(current['routes']):
+        now = current['overall'] if name == 'overall' else current['routes'].get(name)
+        before = baseline.get('overall') if name == 'overall' else baseline.get('routes', {}).get(name)
+        if not now or not before:
+            continue
+        parts = [f'{name:<10}']
+        for label, getter in (('rps', lambda r: r['rps']),
+                              ('p50', lambda r: r['latency_ms']['p50']),
+                              ('p95', lambda r: r['latency_ms']['p95']),
+                              ('p99', lambda r: r['latency_ms']['p99'])):
+            new_value, old_value = getter(now), getter(before)
+            if new_value is None or not old_value:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            parts.append(f'{label} {old_value} -> {new_value} ({change:+.1f}%)')
+        lines.append('  '.join(parts))
+    return lines
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    header = f"{'route':<10} {'requests':>9} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7}  status"
+    print(header)
+    print('-' * len(header))
+    rows = list(sorted(result['routes'].items())) + [('overall', result['overall'])]
+    for name, stats in rows:
+        latency = stats['latency_ms']
+        print(f"{name:<10} {stats['requests']:>9} {stats['rps']:>9} {latency['p50']!s:>9} {latency['p95']!s:>9} "
+              f"{latency['p99']!s:>9} {stats['errors']:>7}  {stats['status']}")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='lucky-donehub 端到端压测')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=30.0, help='统计时长（秒）')
+    parser.add_argument('--warmup', type=float, default=5.0, help='预热时长（秒），不计入结果')
+    parser.add_argument('--users', type=int, default=200, help='模拟用户数')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'路由比例，默认 {DEFAULT_MIX}')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker 数')
+    parser.add_argument('--threads', type=int, default=32, help='每个 worker 的线程数')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='写入临时 config.py 的配置，VALUE 按 JSON 解析，如 --set DONEHUB_ASYNC_SETTLEMENT=false')
+    parser.add_argument('--donehub-url', default=None, help='使用已启动的 DoneHub 替身，而不是自动启动')
+    parser.add_argument('--latency', action='append', default=[], help='传给 fake_donehub.py 的延迟分布')
+    parser.add_argument('--replication-lag', default='fixed:0', help='传给 fake_donehub.py 的复制延迟')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='传给 fake_donehub.py 的错误率')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='传给 fake_donehub.py 的超时比例')
+    parser.add_argument('--hang-seconds', type=float, default=30.0, help='传给 fake_donehub.py 的超时拖延时间')
+    parser.add_argument('--drain-timeout', type=float, default=30.0, help='压测结束后等待结算队列清空的时间')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None, help='结果 JSON 路径，默认 bench/results/load-<时间>.json')
+    parser.add_argument('--compare', default=None, help='与之前的结果 JSON 对比')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时目录（含 gunicorn 日志与数据库）')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    mix = parse_mix(args.mix)
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output = os.path.abspath(output)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+
+    env = BenchEnvironment(args)
+    try:
+        env.start_donehub()
+        env.write_config()
+        env.prepare_sessions()
+        env.start_app()
+
+        print(f"压测 {env.app_url}: 并发 {args.concurrency}，预热 {args.warmup}s，统计 {args.duration}s")
+        generator = LoadGenerator(env.app_url, env.cookie_name, env.cookies, mix, args.concurrency, seed=args.seed)
+        elapsed = generator.run(args.duration, args.warmup)
+
+        by_route = defaultdict(list)
+        for sample in generator.samples:
+            by_route[sample['route']].append(sample)
+
+        result = {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'git': git_revision(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'parameters': {
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'warmup': args.warmup,
+                'users': args.users,
+                'mix': mix,
+                'workers': args.workers,
+                'threads': args.threads,
+                'config_overrides': parse_config_overrides(args.set),
+                'donehub': {
+                    'latency': args.latency,
+                    'replication_lag': args.replication_lag,
+                    'error_rate': args.error_rate,
+                    'timeout_rate': args.timeout_rate,
+                },
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'overall': summarize(generator.samples, elapsed),
+            'routes': {name: summarize(samples, elapsed) for name, samples in sorted(by_route.items())},
+            'settlement': env.wait_for_settlement(args.drain_timeout),
+            'donehub': env.fetch_donehub_stats(),
+        }
+    finally:
+        env.close()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(result, handle, ensure_ascii=False, indent=2)
+
+    print_report(result)
+    print(f"结算队列: {result['settlement']}")
+    if result['donehub']:
+        print(f"DoneHub 替身: 请求 {result['donehub']['requests']}，重复幂等键 {result['donehub']['duplicate_keys']}")
+    if baseline:
+        print('\n与基线对比:')
+        for line in compare(result, baseline):
+            print(line)
+    print(f"\n结果已写入 {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""静态资源构建：内容哈希文件名、gzip/brotli 预压缩、背景图缩放与 WebP/AVIF 版本.
+
+用法: python build_assets.py [--source static] [--output dist]
+
+结果写入输出目录并生成 manifest.json，应用的 /assets 路由据此按 Accept / Accept-Encoding
+选择版本。brotli 与 Pillow 为可选依赖，未安装时跳过 br 压缩与图片处理。
+"""
+
+import argparse
+import gzip
+import io
+import json
+import mimetypes
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from static_assets import MANIFEST_NAME, content_hash
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover - 可选依赖
+    Image = None
+    features = None
+
+URL_PREFIX = '/assets/'
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.html', '.txt', '.map', '.xml'}
+RESIZABLE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+# 图片的新格式版本：(Pillow 格式名, MIME 类型)
+IMAGE_FORMATS = (('AVIF', 'image/avif'), ('WEBP', 'image/webp'))
+IMAGE_EXTENSIONS = {'image/avif': '.avif', 'image/webp': '.webp'}
+# 压缩后至少要小这么多才保留压缩版本
+MIN_SAVING = 0.05
+_CSS_STATIC_URL = re.compile(r'''url\((['"]?)/static/([^'")?#]+)\1\)''')
+
+
+def guess_type(filename: str) -> str:
+    if filename.endswith('.svg'):
+        return 'image/svg+xml'
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def hashed_filename(filename: str, digest: str, ext: Optional[str] = None) -> str:
+    stem, original_ext = os.path.splitext(filename)
+    return f'{stem}.{digest}{ext or original_ext}'
+
+
+def compress_variants(data: bytes) -> List[Tuple[str, bytes]]:
+    """br 优先、gzip 其次；压缩效果不明显的不保留"""
+    variants = []
+    if brotli is not None:
+        variants.append(('br', brotli.compress(data, quality=11)))
+    variants.append(('gzip', gzip.compress(data, compresslevel=9, mtime=0)))
+    return [(encoding, encoded) for encoding, encoded in variants if len(encoded) < len(data) * (1 - MIN_SAVING)]
+
+
+def image_variants(data: bytes, ext: str, max_width: int, quality: int) -> Tuple[bytes, List[Tuple[str, bytes]]]:
+    """返回缩放后的原格式图片，以及比它更小的 AVIF/WebP 版本"""
+    if Image is None:
+        return data, []
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        image = source
+        if image.width > max_width:
+            height = round(image.height * max_width / image.width)
+            image = image.resize((max_width, height), Image.LANCZOS)
+
+        primary = data
+        if image is not source:
+            buffer = io.BytesIO()
+            if ext == '.png':
+                image.save(buffer, 'PNG', optimize=True)
+            else:
+                image.convert('RGB').save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+            primary = buffer.getvalue()
+
+        variants = []
+        for fmt, mimetype in IMAGE_FORMATS:
+            if not features.check(fmt.lower()):
+                continue
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, quality=quality)
+            if buffer.tell() < len(primary) * (1 - MIN_SAVING):
+                variants.append((mimetype, buffer.getvalue()))
+    # 各格式在同一质量参数下的体积差异较大，按实际大小排序，客户端支持时优先返回最小的
+    variants.sort(key=lambda item: len(item[1]))
+    return primary, variants
+
+
+def rewrite_css_urls(css: bytes, assets: Dict[str, Dict[str, Any]]) -> bytes:
+    """把样式中的 /static/ 地址替换为已构建资源的哈希地址"""
+    def replace(match):
+        entry = assets.get(match.group(2))
+        if entry is None:
+            return match.group(0)
+        return f"url('{URL_PREFIX}{entry['file']}')"
+
+    return _CSS_STATIC_URL.sub(replace, css.decode('utf-8')).encode('utf-8')
+
+
+def source_files(source: str, output: str) -> List[str]:
+    """static 目录中的文件（相对路径）；样式表排在最后，以便替换其中引用的资源地址"""
+    output = os.path.abspath(output)
+    files = []
+    for root, dirs, names in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and os.path.abspath(os.path.join(root, d)) != output)
+        for name in sorted(names):
+            if not name.startswith('.'):
+                files.append(os.path.relpath(os.path.join(root, name), source).replace(os.sep, '/'))
+    return sorted(files, key=lambda name: (name.endswith('.css'), name))
+
+
+def _write(output: str, filename: str, data: bytes) -> None:
+    path = os.path.join(output, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        # 文件名含内容哈希，已存在即内容相同
+        return
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        handle.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(source: str, output: str, max_width: int = 1920, quality: int = 80) -> Dict[str, Any]:
+    assets: Dict[str, Dict[str, Any]] = {}
+    for filename in source_files(source, output):
+        with open(os.path.join(source, filename), 'rb') as handle:
+            original = handle.read()
+        ext = os.path.splitext(filename)[1].lower()
+        mimetype = guess_type(filename)
+
+        primary = original
+        typed_variants: List[Tuple[str, bytes]] = []
+        if ext == '.css':
+            primary = rewrite_css_urls(original, assets)
+        elif ext in RESIZABLE_EXTENSIONS:
+            primary, typed_variants = image_variants(original, ext, max_width, quality)
+
+        digest = content_hash(primary)
+        name = hashed_filename(filename, digest)
+        variants = []
+        for variant_type, data in typed_variants:
+            variant_name = hashed_filename(filename, digest, IMAGE_EXTENSIONS[variant_type])
+            _write(output, variant_name, data)
+            variants.append({'file': variant_name, 'type': variant_type, 'encoding': None,
+                             'etag': content_hash(data), 'size': len(data)})
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            for encoding, data in compress_variants(primary):
+                variant_name = f"{name}.{'gz' if encoding == 'gzip' else encoding}"
+                _write(output, variant_name, data)
+                variants.append({'file': variant_name, 'type': mimetype, 'encoding': encoding,
+                                 'etag': content_hash(data), 'size': len(data)})
+        _write(output, name, primary)
+        variants.append({'file': name, 'type': mimetype, 'encoding': None,
+                         'etag': content_hash(primary), 'size': len(primary)})
+
+        assets[filename] = {
+            'file': name,
+            'type': mimetype,
+            'source': content_hash(original),
+            'source_size': len(original),
+            'variants': variants,
+        }
+
+    manifest = {'version': 1, 'assets': assets}
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, MANIFEST_NAME)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle, ensure_ascii=False, indent=2)
+    os.replace(f'{path}.tmp', path)
+    return manifest
+
+
+def clean(output: str, manifest: Dict[str, Any]) -> int:
+    """删除不再被清单引用的旧文件"""
+    keep = {MANIFEST_NAME}
+    for entry in manifest['assets'].values():
+        keep.update(variant['file'] for variant in entry['variants'])
+    removed = 0
+    for root, _, names in os.walk(output):
+        for name in names:
+            path = os.path.join(root, name)
+            if os.path.relpath(path, output).replace(os.sep, '/') not in keep:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='构建带哈希与预压缩版本的静态资源')
+    parser.add_argument('--source', default='static', help='源目录')
+    parser.add_argument('--output', default='dist', help='输出目录，与配置项 STATIC_BUILD_DIR 一致')
+    parser.add_argument('--max-width', type=int, default=1920, help='图片最大宽度（像素），超出时等比缩小')
+    parser.add_argument('--quality', type=int, default=80, help='JPEG/WebP/AVIF 压缩质量')
+    parser.add_argument('--clean', action='store_true',
+                        help='删除旧版本文件（滚动发布时旧页面可能仍在引用，建议确认旧版本下线后再清理）')
+    args = parser.parse_args(argv)
+
+    if brotli is None:
+        print("未安装 brotli，跳过 br 预压缩", file=sys.stderr)
+    if Image is None:
+        print("未安装 Pillow，跳过图片缩放与 WebP/AVIF 转换", file=sys.stderr)
+
+    manifest = build(args.source, args.output, args.max_width, args.quality)
+    for filename, entry in manifest['assets'].items():
+        sizes = ', '.join(
+            f"{variant['encoding'] or variant['type'].split('/')[-1]} {variant['size']}" for variant in entry['variants']
+        )
+        print(f"{filename} ({entry['source_size']}) -> {entry['file']}: {sizes}")
+    if args.clean:
+        print(f"已删除 {clean(args.output, manifest)} 个旧文件")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
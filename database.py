@@ -1,31 +1,221 @@
+import json
+import os
 import sqlite3
+import time
 from datetime import datetime
 from contextlib import contextmanager
 import threading
 
 
+# 每个连接建立时执行一次的调优参数，可通过构造参数覆盖
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': -8000,
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录每条语句的耗时；返回结果集的语句计入读取时间，在 fetch* 或下一条语句前上报"""
+
+    _pending = None
+
+    def _report(self, sql, parameters, elapsed):
+        for hook in self.connection.statement_hooks:
+            hook(self.connection, sql, parameters, elapsed)
+
+    def _report_pending(self, extra=0.0):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            self._report(pending[0], pending[1], pending[2] + extra)
+
+    def execute(self, sql, parameters=()):
+        self._report_pending()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            self._report(sql, parameters, time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        if self.description is None:
+            self._report(sql, parameters, elapsed)
+        else:
+            self._pending = (sql, parameters, elapsed)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._report_pending()
+        rows = seq_of_parameters if isinstance(seq_of_parameters, list) else list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, rows)
+        finally:
+            self._report(sql, rows[0] if rows else (), time.perf_counter() - started)
+
+    def _fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._report_pending(time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def close(self):
+        self._report_pending()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """把建连、语句、提交耗时交给监听器，由 instrumented_connection_factory 绑定"""
+
+    connect_hooks = ()
+    statement_hooks = ()
+    commit_hooks = ()
+
+    def __init__(self, *args, **kwargs):
+        started = time.perf_counter()
+        super().__init__(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        for hook in self.connect_hooks:
+            hook(elapsed)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in self.commit_hooks:
+                hook(elapsed)
+
+
+def instrumented_connection_factory(listeners):
+    """监听器可实现 on_connect(elapsed)、on_statement(conn, sql, parameters, elapsed)、on_commit(elapsed)"""
+    def hooks(name):
+        return tuple(getattr(listener, name) for listener in listeners if hasattr(listener, name))
+
+    return type('InstrumentedConnection', (InstrumentedConnection,), {
+        'connect_hooks': hooks('on_connect'),
+        'statement_hooks': hooks('on_statement'),
+        'commit_hooks': hooks('on_commit'),
+    })
+
+
 class DatabaseImproved:
     """改进的 SQLite 数据库管理类，支持并发安全和原子操作"""
 
-    def __init__(self, db_name='lucky.db'):
+    def __init__(self, db_name='lucky.db', pragmas=None, connection_factory=None, listeners=None):
         self.db_name = db_name
-        self.lock = threading.Lock()
+        # 可选的 sqlite3.Connection 子类，供基准在连接层记录语句；
+        # listeners（运行指标、慢查询日志等）会接收每个连接的建连、语句与提交耗时
+        if connection_factory is None and listeners:
+            connection_factory = instrumented_connection_factory(listeners)
+        self.connection_factory = connection_factory or sqlite3.Connection
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.pragmas.update(pragmas or {})
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {'opened': 0, 'reused': 0}
+        self._stats_pid = os.getpid()
         self.init_db()
+        # 预加载模式下主进程不持有连接，避免 fork 后被子进程继承
+        self.close_connection()
 
-    @contextmanager
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_name, timeout=10.0)
+    def _open_connection(self):
+        conn = sqlite3.connect(self.db_name, timeout=10.0, factory=self.connection_factory)
         conn.row_factory = sqlite3.Row
         conn.execute('PRAGMA journal_mode=WAL')
         conn.execute('PRAGMA locking_mode=NORMAL')
+        for name, value in self.pragmas.items():
+            if not str(name).isidentifier():
+                raise ValueError(f"非法的 PRAGMA 名称: {name}")
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    def _count(self, key):
+        with self._stats_lock:
+            pid = os.getpid()
+            if self._stats_pid != pid:
+                self._stats = {'opened': 0, 'reused': 0}
+                self._stats_pid = pid
+            self._stats[key] += 1
+
+    def _acquire_connection(self):
+        local = self._local
+        pid = os.getpid()
+        conn = getattr(local, 'conn', None)
+        if conn is not None and local.pid == pid:
+            self._count('reused')
+            return conn
+
+        # 线程首次使用，或 fork 后继承了父进程的连接（只丢弃，不在子进程中关闭）
+        conn = self._open_connection()
+        local.conn = conn
+        local.pid = pid
+        local.depth = 0
+        self._count('opened')
+        return conn
+
+    @contextmanager
+    def get_connection(self, immediate=False):
+        """获取当前线程的连接；immediate=True 时以 BEGIN IMMEDIATE 开启写事务，跨进程串行化写入"""
+        conn = self._acquire_connection()
+        local = self._local
+        local.depth += 1
         try:
+            if immediate and not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE')
             yield conn
-            conn.commit()
+            if local.depth == 1:
+                conn.commit()
         except Exception as exc:  # pylint:disable=broad-except
-            conn.rollback()
+            if local.depth == 1:
+                conn.rollback()
             raise exc
         finally:
+            local.depth -= 1
+
+    def close_connection(self):
+        """关闭当前线程持有的连接"""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            return
+        if local.pid == os.getpid():
             conn.close()
+        local.conn = None
+        local.pid = None
+        local.depth = 0
+
+    def pool_stats(self):
+        with self._stats_lock:
+            if self._stats_pid != os.getpid():
+                opened, reused = 0, 0
+            else:
+                opened, reused = self._stats['opened'], self._stats['reused']
+        total = opened + reused
+        return {
+            'opened': opened,
+            'reused': reused,
+            'reuse_rate': round(reused / total, 4) if total else 0.0
+        }
 
     def init_db(self):
         with self.get_connection() as conn:
@@ -72,11 +262,95 @@ class DatabaseImproved:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id INTEGER NOT NULL,
                     purchase_date DATE NOT NULL,
+                    quantity INTEGER NOT NULL DEFAULT 1,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(id)
                 )
             ''')
 
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lottery_daily_totals'"
+            )
+            daily_totals_exists = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS lottery_daily_totals (
+                    lottery_date DATE NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    total_quota INTEGER NOT NULL DEFAULT 0,
+                    total_cost INTEGER NOT NULL DEFAULT 0,
+                    net_change INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (lottery_date, user_id)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS quota_ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    donehub_user_id INTEGER,
+                    source_type TEXT NOT NULL,
+                    source_id INTEGER NOT NULL,
+                    cost INTEGER DEFAULT 0,
+                    prize INTEGER DEFAULT 0,
+                    delta_units INTEGER NOT NULL,
+                    remark TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS quota_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT UNIQUE NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    donehub_user_id INTEGER NOT NULL,
+                    source_type TEXT NOT NULL,
+                    source_id INTEGER NOT NULL,
+                    source_count INTEGER DEFAULT 1,
+                    cost INTEGER DEFAULT 0,
+                    prize INTEGER DEFAULT 0,
+                    delta_units INTEGER NOT NULL,
+                    remark TEXT,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at REAL DEFAULT 0,
+                    claimed_at REAL,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS donehub_user_links (
+                    user_id INTEGER PRIMARY KEY,
+                    donehub_user_id INTEGER NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS donehub_profile_cache (
+                    donehub_user_id INTEGER PRIMARY KEY,
+                    profile TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+
+            # 服务端会话，Cookie 中只保存签名后的会话 id
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS web_sessions (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_lottery_user_date
                 ON lottery_records(user_id, lottery_date)
@@ -87,13 +361,78 @@ class DatabaseImproved:
                 ON sign_records(user_id, sign_date)
             ''')
 
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_lottery_user_created
+                ON lottery_records(user_id, created_at)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_sign_user_created
+                ON sign_records(user_id, created_at)
+            ''')
+
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_extra_purchase_user_date
                 ON lottery_extra_purchases(user_id, purchase_date)
             ''')
 
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_daily_totals_rank
+                ON lottery_daily_totals(lottery_date, net_change DESC, total_quota DESC)
+            ''')
+
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_quota_ledger_source
+                ON quota_ledger(source_type, source_id)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_quota_ledger_user
+                ON quota_ledger(user_id, created_at)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_quota_outbox_due
+                ON quota_outbox(status, next_attempt_at)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_quota_outbox_donehub_user
+                ON quota_outbox(donehub_user_id, status)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_quota_outbox_source
+                ON quota_outbox(source_type, source_id)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_profile_cache_accessed
+                ON donehub_profile_cache(accessed_at)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_web_sessions_expires
+                ON web_sessions(expires_at)
+            ''')
+
             self._ensure_lottery_columns(cursor)
             self._ensure_sign_constraints(cursor)
+            self._ensure_extra_purchase_columns(cursor)
+
+            # 只覆盖 pending 记录，清理过期占位时不再扫描整张表；旧库在上面补齐 status 列后才能创建
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_lottery_pending_created
+                ON lottery_records(created_at) WHERE status = 'pending'
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_sign_pending_created
+                ON sign_records(created_at) WHERE status = 'pending'
+            ''')
+
+            if not daily_totals_exists:
+                self._rebuild_daily_totals(cursor)
 
     def _ensure_lottery_columns(self, cursor):
         cursor.execute("PRAGMA table_info(lottery_records)")
@@ -113,6 +452,43 @@ class DatabaseImproved:
             """
         )
 
+    @staticmethod
+    def _rebuild_daily_totals(cursor):
+        """由已完成的抽奖记录重新汇总每日榜单（升级旧库时执行一次）"""
+        cursor.execute('DELETE FROM lottery_daily_totals')
+        cursor.execute(
+            '''INSERT INTO lottery_daily_totals
+               (lottery_date, user_id, total_quota, total_cost, net_change, attempts)
+               SELECT lottery_date, user_id,
+                      COALESCE(SUM(quota), 0), COALESCE(SUM(cost), 0),
+                      COALESCE(SUM(quota - cost), 0), COUNT(id)
+               FROM lottery_records
+               WHERE status = 'completed'
+               GROUP BY lottery_date, user_id'''
+        )
+
+    @staticmethod
+    def _apply_daily_totals(cursor, record, sign):
+        """在调用方事务内把一条抽奖记录计入（sign=1）或移出（sign=-1）当日汇总"""
+        quota = (record['quota'] or 0) * sign
+        cost = (record['cost'] or 0) * sign
+        cursor.execute(
+            '''INSERT INTO lottery_daily_totals
+               (lottery_date, user_id, total_quota, total_cost, net_change, attempts)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(lottery_date, user_id) DO UPDATE SET
+                   total_quota = total_quota + excluded.total_quota,
+                   total_cost = total_cost + excluded.total_cost,
+                   net_change = net_change + excluded.net_change,
+                   attempts = attempts + excluded.attempts''',
+            (record['lottery_date'], record['user_id'], quota, cost, quota - cost, sign)
+        )
+        if sign < 0:
+            cursor.execute(
+                'DELETE FROM lottery_daily_totals WHERE lottery_date = ? AND user_id = ? AND attempts <= 0',
+                (record['lottery_date'], record['user_id'])
+            )
+
     def _ensure_sign_constraints(self, cursor):
         cursor.execute("PRAGMA table_info(sign_records)")
         columns = {row[1] for row in cursor.fetchall()}
@@ -127,6 +503,14 @@ class DatabaseImproved:
             """
         )
 
+    @staticmethod
+    def _ensure_extra_purchase_columns(cursor):
+        # 旧库每行代表一次购买，补列后默认数量为 1
+        cursor.execute("PRAGMA table_info(lottery_extra_purchases)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'quantity' not in columns:
+            cursor.execute("ALTER TABLE lottery_extra_purchases ADD COLUMN quantity INTEGER NOT NULL DEFAULT 1")
+
     def get_or_create_user(self, linuxdo_id, username):
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -145,256 +529,842 @@ class DatabaseImproved:
     def get_today_lottery_summary(self, user_id):
         today = datetime.now().date().isoformat()
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT COUNT(*) as cnt, MAX(attempt_number) as max_attempt FROM lottery_records WHERE user_id = ? AND lottery_date = ?',
-                (user_id, today)
-            )
-            row = cursor.fetchone()
-            if row is None:
-                total = 0
-            else:
-                raw = row['cnt']
-                total = raw if isinstance(raw, int) else int(raw or 0)
+            return self._query_lottery_summary(conn.cursor(), user_id, today)
 
-            cursor.execute(
-                '''SELECT * FROM lottery_records
-                   WHERE user_id = ? AND lottery_date = ?
-                   ORDER BY attempt_number DESC, created_at DESC
-                   LIMIT 1''',
-                (user_id, today)
-            )
-            last = cursor.fetchone()
-            return total, (dict(last) if last else None)
+    @staticmethod
+    def _query_lottery_summary(cursor, user_id, today):
+        cursor.execute(
+            'SELECT COUNT(*) as cnt, MAX(attempt_number) as max_attempt FROM lottery_records WHERE user_id = ? AND lottery_date = ?',
+            (user_id, today)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            total = 0
+        else:
+            raw = row['cnt']
+            total = raw if isinstance(raw, int) else int(raw or 0)
+
+        cursor.execute(
+            '''SELECT * FROM lottery_records
+               WHERE user_id = ? AND lottery_date = ?
+               ORDER BY attempt_number DESC
+               LIMIT 1''',
+            (user_id, today)
+        )
+        last = cursor.fetchone()
+        return total, (dict(last) if last else None)
 
     def check_today_lottery(self, user_id):
         _, last = self.get_today_lottery_summary(user_id)
         return last
 
-    def create_lottery_record_atomic(self, user_id, quota, redemption_code, cost=0, max_attempts=1):
+    def create_lottery_record_atomic(self, user_id, quota, redemption_code, cost=0, max_attempts=1,
+                                     quota_change=None):
+        """创建待结算的抽奖记录；传入 quota_change 时在同一事务内写入结算队列，记录中返回 outbox_id"""
+        records = self.create_lottery_records_atomic(
+            user_id, [(quota, redemption_code)], cost=cost, max_attempts=max_attempts, quota_change=quota_change
+        )
+        return records[0] if records else None
+
+    def create_lottery_records_atomic(self, user_id, prizes, cost=0, max_attempts=1, quota_change=None):
+        """在一个写事务内连续创建多条抽奖记录，prizes 为 (quota, redemption_code) 列表
+
+        剩余次数不足以容纳全部记录时不插入任何记录并返回 None。整批只写入一条结算条目，
+        按首条记录 id 与条数定位来源记录。
+        """
+        if not prizes:
+            return None
+
         today = datetime.now().date().isoformat()
-        with self.lock:
-            try:
-                with self.get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'SELECT MAX(attempt_number) as attempt_num, COUNT(*) as total FROM lottery_records WHERE user_id = ? AND lottery_date = ?',
-                        (user_id, today)
-                    )
-                    row = cursor.fetchone()
-                    current_total = row['total'] if row and row['total'] else 0
-                    next_attempt = (row['attempt_num'] or 0) + 1
-
-                    if current_total >= max_attempts:
-                        return None
-
-                    cursor.execute(
-                        '''INSERT INTO lottery_records
-                           (user_id, quota, redemption_code, lottery_date, status, attempt_number, cost)
-                           VALUES (?, ?, ?, ?, 'pending', ?, ?)''',
-                        (user_id, quota, redemption_code, today, next_attempt, cost)
+        try:
+            with self.get_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                # BEGIN IMMEDIATE 已持有写锁，次数校验与插入之间不会有其他写入
+                cursor.execute(
+                    '''SELECT COUNT(*) as total, COALESCE(MAX(attempt_number), 0) as last_attempt
+                       FROM lottery_records
+                       WHERE user_id = ? AND lottery_date = ?''',
+                    (user_id, today)
+                )
+                row = cursor.fetchone()
+                if row['total'] + len(prizes) > max_attempts:
+                    return None
+
+                cursor.executemany(
+                    '''INSERT INTO lottery_records
+                       (user_id, quota, redemption_code, lottery_date, status, attempt_number, cost)
+                       VALUES (?, ?, ?, ?, 'pending', ?, ?)''',
+                    [
+                        (user_id, quota, redemption_code, today, row['last_attempt'] + offset, cost)
+                        for offset, (quota, redemption_code) in enumerate(prizes, start=1)
+                    ]
+                )
+                cursor.execute(
+                    '''SELECT * FROM lottery_records
+                       WHERE user_id = ? AND lottery_date = ? AND attempt_number > ?
+                       ORDER BY attempt_number''',
+                    (user_id, today, row['last_attempt'])
+                )
+                records = [dict(record) for record in cursor.fetchall()]
+                if quota_change:
+                    # 同一写事务内插入的 id 连续，结算完成或撤销时按区间整体处理
+                    outbox_id = self._enqueue_quota_change(
+                        cursor, user_id, 'lottery', records[0]['id'], quota_change, source_count=len(records)
                     )
+                    for record in records:
+                        record['outbox_id'] = outbox_id
+                return records
+        except sqlite3.IntegrityError:
+            return None
+
+    def update_lottery_status(self, record_id, status):
+        with self.get_connection(immediate=True) as conn:
+            return self._set_lottery_status(conn.cursor(), record_id, status) is not None
+
+    def _set_lottery_status(self, cursor, record_id, status):
+        """在调用方事务内更新状态并同步当日汇总，返回更新前的记录"""
+        cursor.execute(
+            'SELECT user_id, quota, cost, lottery_date, status FROM lottery_records WHERE id = ?',
+            (record_id,)
+        )
+        record = cursor.fetchone()
+        if not record:
+            return None
+
+        cursor.execute('UPDATE lottery_records SET status = ? WHERE id = ?', (status, record_id))
+        was_completed = record['status'] == 'completed'
+        if was_completed != (status == 'completed'):
+            self._apply_daily_totals(cursor, record, -1 if was_completed else 1)
+        return record
+
+    def delete_lottery_record(self, record_id):
+        with self.get_connection(immediate=True) as conn:
+            return self._delete_lottery_record(conn.cursor(), record_id)
+
+    def _delete_lottery_record(self, cursor, record_id):
+        cursor.execute(
+            'SELECT user_id, quota, cost, lottery_date, status FROM lottery_records WHERE id = ?',
+            (record_id,)
+        )
+        record = cursor.fetchone()
+        if not record:
+            return False
+
+        cursor.execute('DELETE FROM lottery_records WHERE id = ?', (record_id,))
+        if record['status'] == 'completed':
+            self._apply_daily_totals(cursor, record, -1)
+        return True
+
+    def get_user_lottery_history(self, user_id, limit=10):
+        with self.get_connection() as conn:
+            return self._query_lottery_history(conn.cursor(), user_id, limit)
+
+    @staticmethod
+    def _query_lottery_history(cursor, user_id, limit):
+        # 已提交、尚在结算中的记录也展示给用户
+        cursor.execute(
+            '''SELECT * FROM lottery_records
+               WHERE user_id = ? AND status IN ('completed', 'pending')
+               ORDER BY created_at DESC
+               LIMIT ?''',
+            (user_id, limit)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_today_extra_purchases(self, user_id):
+        today = datetime.now().date().isoformat()
+        with self.get_connection() as conn:
+            return self._query_extra_purchases(conn.cursor(), user_id, today)
 
-                    record_id = cursor.lastrowid
-                    cursor.execute('SELECT * FROM lottery_records WHERE id = ?', (record_id,))
-                    return dict(cursor.fetchone())
-            except sqlite3.IntegrityError:
+    @staticmethod
+    def _query_extra_purchases(cursor, user_id, today):
+        cursor.execute(
+            '''SELECT COALESCE(SUM(quantity), 0) as cnt FROM lottery_extra_purchases
+               WHERE user_id = ? AND purchase_date = ?''',
+            (user_id, today)
+        )
+        row = cursor.fetchone()
+        count = row['cnt'] if row and 'cnt' in row.keys() else 0
+        return int(count or 0)
+
+    def add_extra_purchase_atomic(self, user_id, max_purchases, count=1, quota_change=None):
+        """一次购买写入一行（quantity 为购买次数），上限校验与插入在同一条语句内完成"""
+        today = datetime.now().date().isoformat()
+        count = max(1, int(count or 1))
+        with self.get_connection(immediate=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO lottery_extra_purchases (user_id, purchase_date, quantity)
+                   SELECT ?, ?, ?
+                   WHERE (
+                       SELECT COALESCE(SUM(quantity), 0) FROM lottery_extra_purchases
+                       WHERE user_id = ? AND purchase_date = ?
+                   ) + ? <= ?''',
+                (user_id, today, count, user_id, today, count, max_purchases)
+            )
+            if cursor.rowcount == 0:
                 return None
 
-    def update_lottery_status(self, record_id, status):
+            record_id = cursor.lastrowid
+            cursor.execute('SELECT * FROM lottery_extra_purchases WHERE id = ?', (record_id,))
+            record = dict(cursor.fetchone())
+            if quota_change:
+                record['outbox_id'] = self._enqueue_quota_change(cursor, user_id, 'purchase', record_id, quota_change)
+            return record
+
+    def delete_extra_purchase(self, record_id):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('UPDATE lottery_records SET status = ? WHERE id = ?', (status, record_id))
+            cursor.execute('DELETE FROM lottery_extra_purchases WHERE id = ?', (record_id,))
             return cursor.rowcount > 0
 
-    def delete_lottery_record(self, record_id):
+    def get_today_lottery_totals(self, limit=10):
+        today = datetime.now().date().isoformat()
+        with self.get_connection() as conn:
+            return self._query_lottery_totals(conn.cursor(), today, limit)
+
+    @staticmethod
+    def _query_lottery_totals(cursor, today, limit):
+        cursor.execute(
+            '''SELECT
+                   t.user_id as user_id,
+                   u.username as username,
+                   t.total_quota as total_quota,
+                   t.total_cost as total_cost,
+                   t.net_change as net_change,
+                   t.attempts as attempts
+               FROM lottery_daily_totals t
+               JOIN users u ON u.id = t.user_id
+               WHERE t.lottery_date = ?
+               ORDER BY t.net_change DESC, t.total_quota DESC
+               LIMIT ?''',
+            (today, limit)
+        )
+        rows = cursor.fetchall()
+        return [
+            {
+                'user_id': row['user_id'],
+                'username': row['username'],
+                'total_quota': row['total_quota'] or 0,
+                'total_cost': row['total_cost'] or 0,
+                'net_change': row['net_change'] or 0,
+                'attempts': row['attempts'] or 0
+            }
+            for row in rows
+        ]
+
+    def get_today_lottery_summary_for_user(self, user_id):
+        today = datetime.now().date().isoformat()
+        with self.get_connection() as conn:
+            return self._query_lottery_totals_for_user(conn.cursor(), user_id, today)
+
+    @staticmethod
+    def _query_lottery_totals_for_user(cursor, user_id, today):
+        cursor.execute(
+            '''SELECT total_quota, total_cost, net_change, attempts
+               FROM lottery_daily_totals
+               WHERE lottery_date = ? AND user_id = ?''',
+            (today, user_id)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return {
+                'total_quota': 0,
+                'total_cost': 0,
+                'net_change': 0,
+                'attempts': 0
+            }
+
+        return {
+            'total_quota': row['total_quota'] or 0,
+            'total_cost': row['total_cost'] or 0,
+            'net_change': row['net_change'] or 0,
+            'attempts': row['attempts'] or 0
+        }
+
+    def get_dashboard_snapshot(self, user_id, history_limit=10, sign_history_limit=7, leaderboard_limit=10,
+                               sections=None):
+        """在同一连接、同一读事务内读取 Dashboard 所需的数据，保证各部分互相一致
+
+        sections 为 'sign'、'lottery'、'leaderboard' 的子集，只查询并返回对应部分，None 为全部；
+        leaderboard_limit 为 0 时不查询全局榜单（由调用方自行缓存）。
+        """
+        sections = {'sign', 'lottery', 'leaderboard'} if sections is None else set(sections)
+        today = datetime.now().date().isoformat()
+        snapshot = {}
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM lottery_records WHERE id = ?', (record_id,))
+            # WAL 模式下显式开启读事务，后续查询共享同一快照
+            if not conn.in_transaction:
+                cursor.execute('BEGIN')
+            if 'lottery' in sections:
+                spins_today, last_lottery = self._query_lottery_summary(cursor, user_id, today)
+                snapshot.update({
+                    'spins_today': spins_today,
+                    'last_lottery': last_lottery,
+                    'extra_purchases': self._query_extra_purchases(cursor, user_id, today),
+                    'lottery_history': self._query_lottery_history(cursor, user_id, history_limit),
+                })
+            if 'sign' in sections:
+                snapshot.update({
+                    'sign_today': self._query_today_sign(cursor, user_id, today),
+                    'sign_history': self._query_sign_history(cursor, user_id, sign_history_limit),
+                })
+            if 'leaderboard' in sections:
+                snapshot.update({
+                    'leaderboard': (self._query_lottery_totals(cursor, today, leaderboard_limit)
+                                    if leaderboard_limit else None),
+                    'leaderboard_self': self._query_lottery_totals_for_user(cursor, user_id, today)
+                })
+            return snapshot
+
+    # 签到相关 --------------------------------------------------------------
+    def check_today_sign(self, user_id):
+        today = datetime.now().date().isoformat()
+        with self.get_connection() as conn:
+            return self._query_today_sign(conn.cursor(), user_id, today)
+
+    @staticmethod
+    def _query_today_sign(cursor, user_id, today):
+        cursor.execute(
+            'SELECT * FROM sign_records WHERE user_id = ? AND sign_date = ?',
+            (user_id, today)
+        )
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def create_sign_record_atomic(self, user_id, reward, quota_change=None):
+        today = datetime.now().date().isoformat()
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # 每日一次由唯一索引 idx_unique_sign_user_date 保证
+                cursor.execute(
+                    '''INSERT INTO sign_records
+                       (user_id, reward, sign_date, status)
+                       VALUES (?, ?, ?, 'pending')
+                       ON CONFLICT(user_id, sign_date) DO NOTHING''',
+                    (user_id, reward, today)
+                )
+                if cursor.rowcount == 0:
+                    return None
+
+                record_id = cursor.lastrowid
+                cursor.execute('SELECT * FROM sign_records WHERE id = ?', (record_id,))
+                record = dict(cursor.fetchone())
+                if quota_change:
+                    record['outbox_id'] = self._enqueue_quota_change(
+                        cursor, user_id, 'sign', record_id, quota_change
+                    )
+                return record
+        except sqlite3.IntegrityError:
+            return None
+
+    def get_recent_sign_history(self, user_id, limit=7):
+        with self.get_connection() as conn:
+            return self._query_sign_history(conn.cursor(), user_id, limit)
+
+    @staticmethod
+    def _query_sign_history(cursor, user_id, limit):
+        cursor.execute(
+            '''SELECT * FROM sign_records
+               WHERE user_id = ?
+               ORDER BY created_at DESC
+               LIMIT ?''',
+            (user_id, limit)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def update_sign_status(self, record_id, status):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE sign_records SET status = ? WHERE id = ?', (status, record_id))
             return cursor.rowcount > 0
 
-    def get_user_lottery_history(self, user_id, limit=10):
+    def delete_sign_record(self, record_id):
         with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM sign_records WHERE id = ?', (record_id,))
+            return cursor.rowcount > 0
+
+    # 额度结算队列（outbox） -------------------------------------------------
+    @staticmethod
+    def _enqueue_quota_change(cursor, user_id, source_type, source_id, quota_change, source_count=1):
+        """在调用方事务内写入一条待提交的额度调整
+
+        quota_change 需包含 donehub_user_id、delta_units，可选 cost、prize、remark，
+        以及 next_attempt_at（后台线程最早可领取的时间，缺省为立即）。
+        幂等键由来源类型与来源记录 id 组成，同一笔业务只会入队一次。
+        """
+        idempotency_key = f"{source_type}:{source_id}"
+        cursor.execute(
+            '''INSERT INTO quota_outbox
+               (idempotency_key, user_id, donehub_user_id, source_type, source_id, source_count,
+                cost, prize, delta_units, remark, status, next_attempt_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)''',
+            (
+                idempotency_key, user_id, quota_change['donehub_user_id'], source_type, source_id, source_count,
+                quota_change.get('cost', 0), quota_change.get('prize', 0), quota_change['delta_units'],
+                quota_change.get('remark', ''), quota_change.get('next_attempt_at', 0)
+            )
+        )
+        return cursor.lastrowid
+
+    def claim_due_outbox_entries(self, limit, now):
+        """领取到期的待提交条目并标记为 processing，多进程并发领取时每条只会被领取一次"""
+        with self.get_connection(immediate=True) as conn:
             cursor = conn.cursor()
             cursor.execute(
-                '''SELECT * FROM lottery_records
-                   WHERE user_id = ? AND status = 'completed'
-                   ORDER BY created_at DESC
+                '''SELECT id FROM quota_outbox
+                   WHERE status = 'pending' AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at, id
                    LIMIT ?''',
-                (user_id, limit)
+                (now, limit)
             )
-            return [dict(row) for row in cursor.fetchall()]
+            ids = [row['id'] for row in cursor.fetchall()]
+            return [self._claim_outbox_entry(cursor, entry_id, now) for entry_id in ids]
 
-    def get_today_extra_purchases(self, user_id):
-        today = datetime.now().date().isoformat()
+    def claim_outbox_entry(self, entry_id, now):
+        with self.get_connection(immediate=True) as conn:
+            return self._claim_outbox_entry(conn.cursor(), entry_id, now)
+
+    @staticmethod
+    def _claim_outbox_entry(cursor, entry_id, now):
+        cursor.execute(
+            '''UPDATE quota_outbox
+               SET status = 'processing', claimed_at = ?, attempts = attempts + 1,
+                   updated_at = CURRENT_TIMESTAMP
+               WHERE status = 'pending' AND id = ?''',
+            (now, entry_id)
+        )
+        if cursor.rowcount == 0:
+            return None
+        cursor.execute('SELECT * FROM quota_outbox WHERE id = ?', (entry_id,))
+        return dict(cursor.fetchone())
+
+    def complete_outbox_entry(self, entry_id):
+        """DoneHub 调整成功后：标记已提交、完成来源记录、写入记账流水并更新资料缓存的额度，全部在同一事务内
+
+        缓存额度与条目状态同时变化，余额推算（缓存额度 + 未提交的调整）不会重复或遗漏这笔调整。
+        """
+        with self.get_connection(immediate=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''UPDATE quota_outbox
+                   SET status = 'applied', last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status IN ('processing', 'unknown')''',
+                (entry_id,)
+            )
+            if cursor.rowcount == 0:
+                return False
+
+            cursor.execute('SELECT * FROM quota_outbox WHERE id = ?', (entry_id,))
+            entry = cursor.fetchone()
+            if entry['source_type'] == 'lottery':
+                for record_id in self._outbox_source_ids(entry):
+                    self._set_lottery_status(cursor, record_id, 'completed')
+            elif entry['source_type'] == 'sign':
+                cursor.execute(
+                    "UPDATE sign_records SET status = 'completed' WHERE id = ?",
+                    (entry['source_id'],)
+                )
+
+            self._insert_ledger_entry(
+                cursor, entry['user_id'], entry['donehub_user_id'], entry['source_type'], entry['source_id'],
+                entry['cost'], entry['prize'], entry['delta_units'], entry['remark']
+            )
+            if entry['delta_units']:
+                self._adjust_cached_profile_quota(cursor, entry['donehub_user_id'], entry['delta_units'])
+            return True
+
+    def retry_outbox_entry(self, entry_id, error, next_attempt_at):
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                'SELECT COUNT(*) as cnt FROM lottery_extra_purchases WHERE user_id = ? AND purchase_date = ?',
-                (user_id, today)
+                '''UPDATE quota_outbox
+                   SET status = 'pending', last_error = ?, next_attempt_at = ?, claimed_at = NULL,
+                       updated_at = CURRENT_TIMESTAMP
+                   WHERE status = 'processing' AND id = ?''',
+                (error, next_attempt_at, entry_id)
             )
-            row = cursor.fetchone()
-            count = row['cnt'] if row and 'cnt' in row.keys() else 0
-            return int(count or 0)
+            return cursor.rowcount > 0
 
-    def add_extra_purchase_atomic(self, user_id, max_purchases, count=1):
-        today = datetime.now().date().isoformat()
-        with self.lock:
-            try:
-                with self.get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'SELECT COUNT(*) as cnt FROM lottery_extra_purchases WHERE user_id = ? AND purchase_date = ?',
-                        (user_id, today)
-                    )
-                    row = cursor.fetchone()
-                    current = row['cnt'] if row and 'cnt' in row.keys() else 0
-                    count = max(1, int(count or 1))
-
-                    if (current or 0) + count > max_purchases:
-                        return None
-
-                    inserted_records = []
-                    for _ in range(count):
-                        cursor.execute(
-                            'INSERT INTO lottery_extra_purchases (user_id, purchase_date) VALUES (?, ?)',
-                            (user_id, today)
-                        )
-                        cursor.execute('SELECT * FROM lottery_extra_purchases WHERE id = ?', (cursor.lastrowid,))
-                        inserted = cursor.fetchone()
-                        if inserted:
-                            inserted_records.append(dict(inserted))
-
-                    return inserted_records
-            except sqlite3.IntegrityError:
-                return None
+    def fail_outbox_entry(self, entry_id, error):
+        """确认未提交成功且不再重试：标记失败并撤销来源记录（释放当日次数）"""
+        with self.get_connection(immediate=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''UPDATE quota_outbox
+                   SET status = 'failed', last_error = ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status IN ('processing', 'unknown')''',
+                (error, entry_id)
+            )
+            if cursor.rowcount == 0:
+                return False
 
-    def delete_extra_purchase(self, record_id):
+            cursor.execute('SELECT * FROM quota_outbox WHERE id = ?', (entry_id,))
+            entry = cursor.fetchone()
+            if entry['source_type'] == 'lottery':
+                for record_id in self._outbox_source_ids(entry):
+                    self._delete_lottery_record(cursor, record_id)
+            elif entry['source_type'] == 'sign':
+                cursor.execute('DELETE FROM sign_records WHERE id = ?', (entry['source_id'],))
+            elif entry['source_type'] == 'purchase':
+                # 现在一次购买只有一行；保留区间条件以兼容升级前按多行写入的条目
+                cursor.execute(
+                    'DELETE FROM lottery_extra_purchases WHERE user_id = ? AND id >= ? AND id < ?',
+                    (entry['user_id'], entry['source_id'], entry['source_id'] + (entry['source_count'] or 1))
+                )
+            return True
+
+    @staticmethod
+    def _outbox_source_ids(entry):
+        return range(entry['source_id'], entry['source_id'] + (entry['source_count'] or 1))
+
+    def mark_outbox_unknown(self, entry_id, error):
+        """请求可能已被 DoneHub 处理但结果未知：不再自动重试，等待人工核对"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM lottery_extra_purchases WHERE id = ?', (record_id,))
+            cursor.execute(
+                '''UPDATE quota_outbox
+                   SET status = 'unknown', last_error = ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE status = 'processing' AND id = ?''',
+                (error, entry_id)
+            )
             return cursor.rowcount > 0
 
-    def get_today_lottery_totals(self, limit=10):
-        today = datetime.now().date().isoformat()
+    def resolve_unknown_outbox_entry(self, entry_id, applied):
+        """人工核对 DoneHub 流水后确认 unknown 条目的结果
+
+        同时移除该用户的资料缓存，下次读取时以 DoneHub 的实际余额为准。
+        """
+        if applied:
+            resolved = self.complete_outbox_entry(entry_id)
+        else:
+            resolved = self.fail_outbox_entry(entry_id, '人工确认未到账')
+        if resolved:
+            entry = self.get_outbox_entry(entry_id)
+            self.delete_cached_profile(entry['donehub_user_id'])
+        return resolved
+
+    def get_unknown_outbox_entries(self, limit=100):
+        """等待人工核对的条目，旧的在前"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                '''SELECT
-                       u.id as user_id,
-                       u.username as username,
-                       COALESCE(SUM(l.quota), 0) as total_quota,
-                       COALESCE(SUM(l.cost), 0) as total_cost,
-                       COALESCE(SUM(l.quota - l.cost), 0) as net_change,
-                       COUNT(l.id) as attempts
-                   FROM lottery_records l
-                   JOIN users u ON u.id = l.user_id
-                   WHERE l.lottery_date = ? AND l.status = 'completed'
-                   GROUP BY l.user_id, u.username
-                   ORDER BY net_change DESC, total_quota DESC
-                   LIMIT ?''',
-                (today, limit)
+                '''SELECT * FROM quota_outbox WHERE status = 'unknown'
+                   ORDER BY next_attempt_at, id LIMIT ?''',
+                (limit,)
             )
-            rows = cursor.fetchall()
-            return [
-                {
-                    'user_id': row['user_id'],
-                    'username': row['username'],
-                    'total_quota': row['total_quota'] or 0,
-                    'total_cost': row['total_cost'] or 0,
-                    'net_change': row['net_change'] or 0,
-                    'attempts': row['attempts'] or 0
-                }
-                for row in rows
-            ]
+            return [dict(row) for row in cursor.fetchall()]
 
-    def get_today_lottery_summary_for_user(self, user_id):
-        today = datetime.now().date().isoformat()
+    def expire_outbox_leases(self, claimed_before):
+        """领取后长时间未完成的条目（进程中途退出）无法确认是否已提交，转为 unknown"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                '''SELECT
-                       COALESCE(SUM(l.quota), 0) as total_quota,
-                       COALESCE(SUM(l.cost), 0) as total_cost,
-                       COALESCE(SUM(l.quota - l.cost), 0) as net_change,
-                       COUNT(l.id) as attempts
+                '''UPDATE quota_outbox
+                   SET status = 'unknown', last_error = '结算进程中断，结果未知', updated_at = CURRENT_TIMESTAMP
+                   WHERE status = 'processing' AND claimed_at < ?''',
+                (claimed_before,)
+            )
+            return cursor.rowcount
+
+    def mark_stale_pending_records_unknown(self, older_than_seconds, quota_unit):
+        """长期停留在 pending 且没有结算条目的抽奖与签到记录（旧版本中途退出遗留）转为 unknown 条目
+
+        旧版本先写记录再直接调用 DoneHub，额度可能已经到账，因此不删除记录（签到记录还承担
+        当日唯一约束），而是补一条 unknown 结算条目，与其他结果未知的条目一起人工核对。
+        条目的 updated_at 取记录创建时间，之后从 DoneHub 读取的余额不再叠加其额度。
+        """
+        modifier = f'-{int(older_than_seconds)} seconds'
+        with self.get_connection(immediate=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''SELECT l.id, l.user_id, l.quota, l.cost, l.created_at, k.donehub_user_id
                    FROM lottery_records l
-                   WHERE l.user_id = ? AND l.lottery_date = ? AND l.status = 'completed'
-                ''',
-                (user_id, today)
+                   LEFT JOIN donehub_user_links k ON k.user_id = l.user_id
+                   WHERE l.status = 'pending' AND l.created_at < datetime('now', ?)
+                     AND NOT EXISTS (
+                         -- 各条目的记录区间互不重叠，只需检查起点不超过 l.id 的最后一个条目
+                         SELECT 1 FROM quota_outbox o
+                         WHERE o.source_type = 'lottery'
+                           AND o.source_id = (
+                               SELECT MAX(source_id) FROM quota_outbox
+                               WHERE source_type = 'lottery' AND source_id <= l.id
+                           )
+                           AND o.user_id = l.user_id AND l.id < o.source_id + o.source_count
+                     )''',
+                (modifier,)
             )
-            row = cursor.fetchone()
-            if not row:
-                return {
-                    'total_quota': 0,
-                    'total_cost': 0,
-                    'net_change': 0,
-                    'attempts': 0
-                }
+            stale = [('lottery', dict(row)) for row in cursor.fetchall()]
 
-            return {
-                'total_quota': row['total_quota'] or 0,
-                'total_cost': row['total_cost'] or 0,
-                'net_change': row['net_change'] or 0,
-                'attempts': row['attempts'] or 0
-            }
+            cursor.execute(
+                '''SELECT s.id, s.user_id, s.reward AS quota, 0 AS cost, s.created_at, k.donehub_user_id
+                   FROM sign_records s
+                   LEFT JOIN donehub_user_links k ON k.user_id = s.user_id
+                   WHERE s.status = 'pending' AND s.created_at < datetime('now', ?)
+                     AND NOT EXISTS (
+                         SELECT 1 FROM quota_outbox o
+                         WHERE o.source_type = 'sign' AND o.source_id = s.id
+                     )''',
+                (modifier,)
+            )
+            stale.extend(('sign', dict(row)) for row in cursor.fetchall())
 
-    # 签到相关 --------------------------------------------------------------
-    def check_today_sign(self, user_id):
-        today = datetime.now().date().isoformat()
+            for source_type, record in stale:
+                prize = record['quota'] or 0
+                cost = record['cost'] or 0
+                remark = f"抽奖扣除 {cost} $，奖励 {prize} $" if source_type == 'lottery' else f"签到奖励 {prize} $"
+                entry_id = self._enqueue_quota_change(cursor, record['user_id'], source_type, record['id'], {
+                    # 未绑定 DoneHub 用户时记为 0，核对时按本地用户查找
+                    'donehub_user_id': record['donehub_user_id'] or 0,
+                    'delta_units': (prize - cost) * quota_unit,
+                    'cost': cost,
+                    'prize': prize,
+                    'remark': remark
+                })
+                cursor.execute(
+                    '''UPDATE quota_outbox
+                       SET status = 'unknown', last_error = '旧版本遗留的 pending 记录，结果未知',
+                           created_at = ?, updated_at = ?
+                       WHERE id = ?''',
+                    (record['created_at'], record['created_at'], entry_id)
+                )
+            return len(stale)
+
+    def get_pending_quota_delta(self, donehub_user_id):
+        """尚未确认提交到 DoneHub 的额度变化合计
+
+        unknown 条目只在资料缓存最后一次从 DoneHub 读取早于其转为 unknown 时计入：之后读取的余额
+        已经反映了这笔调整是否到账，再叠加会重复计算。updated_at 只精确到秒，读取须晚于该秒结束。
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                'SELECT * FROM sign_records WHERE user_id = ? AND sign_date = ?',
-                (user_id, today)
+                '''SELECT COALESCE(SUM(o.delta_units), 0) as total FROM quota_outbox o
+                   WHERE o.donehub_user_id = ?
+                     AND (
+                         o.status IN ('pending', 'processing')
+                         OR (o.status = 'unknown' AND NOT EXISTS (
+                             SELECT 1 FROM donehub_profile_cache c
+                             WHERE c.donehub_user_id = o.donehub_user_id
+                               AND c.updated_at >= CAST(strftime('%s', o.updated_at) AS REAL) + 1
+                         ))
+                     )''',
+                (donehub_user_id,)
             )
             row = cursor.fetchone()
+            return int(row['total'] or 0)
+
+    def count_inflight_quota_changes(self, donehub_user_id):
+        """仍在排队或提交中的额度调整数量"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''SELECT COUNT(*) as cnt FROM quota_outbox
+                   WHERE donehub_user_id = ? AND status IN ('pending', 'processing')''',
+                (donehub_user_id,)
+            )
+            row = cursor.fetchone()
+            return int(row['cnt'] or 0)
+
+    def get_outbox_entry(self, entry_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM quota_outbox WHERE id = ?', (entry_id,))
+            row = cursor.fetchone()
             return dict(row) if row else None
 
-    def create_sign_record_atomic(self, user_id, reward):
-        today = datetime.now().date().isoformat()
-        with self.lock:
-            try:
-                with self.get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'SELECT id FROM sign_records WHERE user_id = ? AND sign_date = ?',
-                        (user_id, today)
-                    )
-                    if cursor.fetchone():
-                        return None
-
-                    cursor.execute(
-                        '''INSERT INTO sign_records
-                           (user_id, reward, sign_date, status)
-                           VALUES (?, ?, ?, 'pending')''',
-                        (user_id, reward, today)
-                    )
-                    cursor.execute('SELECT * FROM sign_records WHERE id = ?', (cursor.lastrowid,))
-                    return dict(cursor.fetchone())
-            except sqlite3.IntegrityError:
-                return None
+    def get_outbox_stats(self):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT status, COUNT(*) as cnt FROM quota_outbox GROUP BY status')
+            return {row['status']: row['cnt'] for row in cursor.fetchall()}
 
-    def get_recent_sign_history(self, user_id, limit=7):
+    # 额度记账流水 ---------------------------------------------------------
+    @staticmethod
+    def _insert_ledger_entry(cursor, user_id, donehub_user_id, source_type, source_id,
+                             cost, prize, delta_units, remark):
+        cursor.execute(
+            '''INSERT INTO quota_ledger
+               (user_id, donehub_user_id, source_type, source_id, cost, prize, delta_units, remark)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(source_type, source_id) DO NOTHING''',
+            (user_id, donehub_user_id, source_type, source_id, cost, prize, delta_units, remark)
+        )
+
+    def get_user_ledger(self, user_id, limit=50):
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                '''SELECT * FROM sign_records
+                '''SELECT * FROM quota_ledger
                    WHERE user_id = ?
-                   ORDER BY created_at DESC
+                   ORDER BY created_at DESC, id DESC
                    LIMIT ?''',
                 (user_id, limit)
             )
             return [dict(row) for row in cursor.fetchall()]
 
-    def update_sign_status(self, record_id, status):
+    def get_quota_ledger_position(self):
+        """当前最后一条记账流水的 id，配合 sum_quota_ledger_delta 统计此后记账的调整"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('UPDATE sign_records SET status = ? WHERE id = ?', (status, record_id))
+            cursor.execute('SELECT COALESCE(MAX(id), 0) AS position FROM quota_ledger')
+            return int(cursor.fetchone()['position'])
+
+    def sum_quota_ledger_delta(self, user_id, after_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT COALESCE(SUM(delta_units), 0) AS total FROM quota_ledger WHERE user_id = ? AND id > ?',
+                (user_id, after_id)
+            )
+            return int(cursor.fetchone()['total'])
+
+    # DoneHub 账号映射 -----------------------------------------------------
+    def get_donehub_user_id(self, user_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT donehub_user_id FROM donehub_user_links WHERE user_id = ?', (user_id,))
+            row = cursor.fetchone()
+            return row['donehub_user_id'] if row else None
+
+    def set_donehub_user_id(self, user_id, donehub_user_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO donehub_user_links (user_id, donehub_user_id, updated_at)
+                   VALUES (?, ?, CURRENT_TIMESTAMP)
+                   ON CONFLICT(user_id) DO UPDATE SET
+                       donehub_user_id = excluded.donehub_user_id,
+                       updated_at = excluded.updated_at''',
+                (user_id, donehub_user_id)
+            )
+
+    def delete_donehub_user_id(self, user_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM donehub_user_links WHERE user_id = ?', (user_id,))
             return cursor.rowcount > 0
 
-    def delete_sign_record(self, record_id):
+    # DoneHub 用户资料缓存 ---------------------------------------------------
+    def get_cached_profile(self, donehub_user_id, max_age, touch_interval=0):
+        """读取未过期的资料缓存
+
+        accessed_at 只用于 LRU 淘汰，距上次记录超过 touch_interval 秒才更新，
+        避免每次命中都占用写锁；touch_interval 为 None 时只读不更新。
+        """
+        now = time.time()
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM sign_records WHERE id = ?', (record_id,))
+            cursor.execute(
+                'SELECT profile, updated_at, accessed_at FROM donehub_profile_cache WHERE donehub_user_id = ?',
+                (donehub_user_id,)
+            )
+            row = cursor.fetchone()
+            if not row or now - row['updated_at'] > max_age:
+                return None
+
+            if touch_interval is not None and now - row['accessed_at'] >= touch_interval:
+                cursor.execute(
+                    'UPDATE donehub_profile_cache SET accessed_at = ? WHERE donehub_user_id = ?',
+                    (now, donehub_user_id)
+                )
+            return json.loads(row['profile'])
+
+    def save_cached_profile(self, donehub_user_id, profile, max_entries):
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO donehub_profile_cache (donehub_user_id, profile, updated_at, accessed_at)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(donehub_user_id) DO UPDATE SET
+                       profile = excluded.profile,
+                       updated_at = excluded.updated_at,
+                       accessed_at = excluded.accessed_at''',
+                (donehub_user_id, json.dumps(profile, ensure_ascii=False), now, now)
+            )
+            # 按最近访问时间淘汰超出容量的条目（LRU）
+            cursor.execute(
+                '''DELETE FROM donehub_profile_cache
+                   WHERE donehub_user_id IN (
+                       SELECT donehub_user_id FROM donehub_profile_cache
+                       ORDER BY accessed_at DESC
+                       LIMIT -1 OFFSET ?
+                   )''',
+                (max_entries,)
+            )
+
+    def adjust_cached_profile_quota(self, donehub_user_id, delta_units):
+        with self.get_connection() as conn:
+            return self._adjust_cached_profile_quota(conn.cursor(), donehub_user_id, delta_units)
+
+    @staticmethod
+    def _adjust_cached_profile_quota(cursor, donehub_user_id, delta_units):
+        """在调用方事务内把已到账的调整计入缓存额度，并把 updated_at 记为当前时间
+
+        缓存加上这笔调整后等同于此刻读取的余额；但仍有未反映在缓存中的 unknown 条目时
+        保留原 updated_at，余额推算继续叠加这些条目（见 get_pending_quota_delta）。
+        """
+        cursor.execute(
+            '''UPDATE donehub_profile_cache
+               SET profile = json_set(profile, '$.quota', COALESCE(json_extract(profile, '$.quota'), 0) + ?),
+                   updated_at = CASE WHEN EXISTS (
+                       SELECT 1 FROM quota_outbox o
+                       WHERE o.donehub_user_id = donehub_profile_cache.donehub_user_id AND o.status = 'unknown'
+                         AND donehub_profile_cache.updated_at < CAST(strftime('%s', o.updated_at) AS REAL) + 1
+                   ) THEN updated_at ELSE ? END
+               WHERE donehub_user_id = ?''',
+            (delta_units, time.time(), donehub_user_id)
+        )
+        return cursor.rowcount > 0
+
+    def delete_cached_profile(self, donehub_user_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM donehub_profile_cache WHERE donehub_user_id = ?', (donehub_user_id,))
+            return cursor.rowcount > 0
+
+    def get_web_session(self, session_id, now):
+        """返回未过期会话的 data 与 expires_at"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT data, expires_at FROM web_sessions WHERE id = ? AND expires_at > ?',
+                (session_id, now)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def save_web_session(self, session_id, data, expires_at):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO web_sessions (id, data, expires_at)
+                   VALUES (?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET
+                       data = excluded.data,
+                       expires_at = excluded.expires_at''',
+                (session_id, data, expires_at)
+            )
+
+    def delete_web_session(self, session_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM web_sessions WHERE id = ?', (session_id,))
             return cursor.rowcount > 0
+
+    def delete_expired_web_sessions(self, now, limit=1000):
+        """分批删除过期会话，避免一次清理长时间占用写锁"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''DELETE FROM web_sessions
+                   WHERE id IN (
+                       SELECT id FROM web_sessions WHERE expires_at <= ? LIMIT ?
+                   )''',
+                (now, limit)
+            )
+            return cursor.rowcount
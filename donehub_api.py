@@ -1,21 +1,141 @@
 """DoneHub API 客户端封装."""
 
+import json
 import logging
+import os
+import threading
+import time
 from typing import Any, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
 
 logger = logging.getLogger(__name__)
 
 
 class DoneHubAPIError(Exception):
-    """DoneHub API 调用异常."""
+    """DoneHub API 调用异常.
+
+    kind 标识错误来源：connect（连接未建立）、timeout（已发出但等待响应超时）、
+    network（传输中断）、server（5xx）、http（其他非 2xx）、invalid_response、api（接口返回失败）。
+    """
+
+    def __init__(self, message: str = "", kind: str = "api", status_code: Optional[int] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.status_code = status_code
+
+    @property
+    def ambiguous(self) -> bool:
+        """请求可能已被 DoneHub 执行、只是没有拿到结果，此类写操作不能直接重试.
+
+        只有连接未建立（connect）与 DoneHub 明确拒绝（http 4xx、api）能确定未执行；
+        5xx 可能来自 DoneHub 已提交后的网关，2xx 但响应无法解析同样无法确认结果。
+        """
+        return self.kind not in ("connect", "http", "api")
+
+
+def parse_response(status_code: int, text: Optional[str]) -> Dict[str, Any]:
+    """解析 DoneHub 响应，同步与异步客户端共用同一套错误判定."""
+    if status_code >= 500:
+        raise DoneHubAPIError(f"服务器错误 {status_code}", kind="server", status_code=status_code)
+
+    if status_code == 204:
+        return {}
+
+    text = (text or "").strip()
+    if not text:
+        return {}
+
+    try:
+        data = json.loads(text)
+    except ValueError as exc:
+        # 某些接口可能返回纯文本（如 "OK" 或 html 错误页）
+        lowered = text.lower()
+        if status_code < 400 and lowered in {"ok", "success", "true"}:
+            return {"success": True}
+        if status_code >= 400:
+            raise DoneHubAPIError(text[:200], kind="http", status_code=status_code)
+        raise DoneHubAPIError(f"响应非 JSON: {text[:120]}", kind="invalid_response",
+                              status_code=status_code) from exc
+
+    if isinstance(data, dict) and "error" in data:
+        message = data.get("error", {}).get("message") or data.get("error")
+        raise DoneHubAPIError(str(message))
+
+    if isinstance(data, dict) and data.get("success") is False:
+        raise DoneHubAPIError(str(data.get("message", "未知错误")))
+
+    return data
+
+
+def match_linuxdo_username(items, linuxdo_username: str) -> Optional[Dict[str, Any]]:
+    """从搜索结果中挑选 LinuxDo 用户名匹配的用户，没有精确匹配时退回第一条."""
+    if not items:
+        return None
+    for item in items:
+        if item.get("linuxdo_username") == linuxdo_username:
+            return item
+    for item in items:
+        if item.get("username") == linuxdo_username:
+            return item
+    return items[0]
+
+
+def match_linuxdo_id(items, linuxdo_id: str) -> Optional[Dict[str, Any]]:
+    keyword = str(linuxdo_id)
+    for item in items or []:
+        candidate = item.get("linuxdo_id")
+        if candidate is not None and str(candidate) == keyword:
+            return item
+    return None
+
+
+def quota_payload(quota_delta_units: int, remark: str = "") -> Dict[str, Any]:
+    payload = {"quota": quota_delta_units}
+    if remark:
+        payload["remark"] = remark
+    return payload
+
+
+class _ConnectCountingAdapter(HTTPAdapter):
+    """记录实际建立的 TCP 连接数.
+
+    urllib3 的连接对象在服务端关闭或 Connection: close 后会原地重连，连接池的 num_connections
+    不会增加；因此在连接类的 _new_conn 上计数，每次新建 socket 都计入。
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.socket_connects = 0
+        self._connects_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: self._counting_pool_class(pool_cls)
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def _counting_pool_class(self, pool_cls):
+        adapter = self
+
+        class CountingConnection(pool_cls.ConnectionCls):
+            def _new_conn(self):
+                sock = super()._new_conn()
+                with adapter._connects_lock:
+                    adapter.socket_connects += 1
+                return sock
+
+        return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": CountingConnection})
 
 
 class DoneHubAPI:
     """DoneHub 后台接口轻量封装."""
 
-    def __init__(self, base_url: str, access_token: str, quota_unit: int = 500000, timeout: int = 10):
+    def __init__(self, base_url: str, access_token: str, quota_unit: int = 500000, timeout: int = 10,
+                 pool_size: int = 10, keep_alive: bool = True, profile_cache=None, metrics=None):
         if not base_url:
             raise ValueError("DoneHub base_url 未配置")
         if not access_token:
@@ -25,6 +145,84 @@ class DoneHubAPI:
         self.access_token = access_token
         self.quota_unit = quota_unit
         self.timeout = timeout
+        self.pool_size = max(1, int(pool_size or 1))
+        self.keep_alive = keep_alive
+        # 可选的资料缓存，需提供 get/put/invalidate
+        self.profile_cache = profile_cache
+        # 可选的运行指标（metrics.Metrics），记录各操作的耗时与错误类型
+        self.metrics = metrics
+
+        self._session_lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._session_pid: Optional[int] = None
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = _ConnectCountingAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self._headers())
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def _get_session(self) -> requests.Session:
+        # 连接池按进程持有：gunicorn fork 出的 worker 不能复用父进程的 socket
+        pid = os.getpid()
+        session = self._session
+        if session is not None and self._session_pid == pid:
+            return session
+
+        with self._session_lock:
+            if self._session is None or self._session_pid != pid:
+                self._session = self._create_session()
+                self._session_pid = pid
+            return self._session
+
+    def reset_pool(self) -> None:
+        """丢弃当前连接池，下次请求时重新建立."""
+        with self._session_lock:
+            session, owner_pid = self._session, self._session_pid
+            self._session = None
+            self._session_pid = None
+        # 继承自父进程的连接只丢弃不关闭，避免干扰父进程仍在使用的 socket
+        if session is not None and owner_pid == os.getpid():
+            try:
+                session.close()
+            except Exception:  # pylint:disable=broad-except
+                pass
+
+    def warmup(self) -> bool:
+        """预先建立到 DoneHub 的连接，供 gunicorn fork 后调用."""
+        try:
+            self._request("GET", "/api/user/self", "warmup")
+        except DoneHubAPIError as exc:
+            logger.warning("DoneHub 连接预热失败: %s", exc)
+            return False
+        return True
+
+    def pool_stats(self) -> Dict[str, int]:
+        """返回当前进程连接池的复用情况：misses 为实际建立的 TCP 连接数（含重连），hits 为其余复用连接的请求数."""
+        session = self._session
+        if session is None or self._session_pid != os.getpid():
+            return {"requests": 0, "hits": 0, "misses": 0, "pool_size": self.pool_size}
+
+        total_requests = 0
+        adapter = session.get_adapter(self.base_url)
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+
+        new_connections = getattr(adapter, "socket_connects", 0)
+        return {
+            "requests": total_requests,
+            "hits": max(0, total_requests - new_connections),
+            "misses": new_connections,
+            "pool_size": self.pool_size,
+        }
 
     def _headers(self) -> Dict[str, str]:
         return {
@@ -33,54 +231,77 @@ class DoneHubAPI:
             "Accept": "application/json",
         }
 
-    def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+    @staticmethod
+    def _is_connect_failure(exc: requests.ConnectionError) -> bool:
+        """连接阶段失败（拒绝连接、DNS 解析失败等）说明请求一定没有发出."""
+        reason = exc.args[0] if exc.args else None
+        if isinstance(reason, MaxRetryError):
+            reason = reason.reason
+        return isinstance(reason, NewConnectionError)
+
+    def _request(self, method: str, path: str, operation: str, **kwargs) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return self._send(method, path, **kwargs)
+        except DoneHubAPIError as exc:
+            if self.metrics is not None:
+                self.metrics.inc("donehub_errors_total", operation=operation, kind=exc.kind)
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe("donehub_request_duration_seconds", time.perf_counter() - started,
+                                     operation=operation, client="sync")
+
+    def _send(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
         url = f"{self.base_url}{path}"
         try:
-            response = requests.request(method, url, headers=self._headers(), timeout=self.timeout, **kwargs)
+            response = self._get_session().request(method, url, timeout=self.timeout, **kwargs)
+        except requests.ConnectTimeout as exc:
+            raise DoneHubAPIError(str(exc), kind="connect") from exc
+        except requests.Timeout as exc:
+            raise DoneHubAPIError(str(exc), kind="timeout") from exc
+        except requests.ConnectionError as exc:
+            kind = "connect" if self._is_connect_failure(exc) else "network"
+            raise DoneHubAPIError(str(exc), kind=kind) from exc
         except requests.RequestException as exc:
-            raise DoneHubAPIError(str(exc)) from exc
-
-        if response.status_code >= 500:
-            raise DoneHubAPIError(f"服务器错误 {response.status_code}")
+            raise DoneHubAPIError(str(exc), kind="network") from exc
 
-        if response.status_code == 204:
-            return {}
+        return parse_response(response.status_code, response.text)
 
-        text = (response.text or "").strip()
-        if not text:
-            return {}
-
-        try:
-            data = response.json()
-        except ValueError as exc:
-            # 某些接口可能返回纯文本（如 "OK" 或 html 错误页）
-            lowered = text.lower()
-            if response.status_code < 400 and lowered in {"ok", "success", "true"}:
-                return {"success": True}
-            if response.status_code >= 400:
-                raise DoneHubAPIError(text[:200])
-            raise DoneHubAPIError(f"响应非 JSON: {text[:120]}") from exc
+    def get_current_user(self) -> Dict[str, Any]:
+        data = self._request("GET", "/api/user/self", "get_current_user")
+        return data.get("data")
 
-        if isinstance(data, dict) and "error" in data:
-            message = data.get("error", {}).get("message") or data.get("error")
-            raise DoneHubAPIError(str(message))
+    def get_user_by_id(self, user_id: int, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        if use_cache and self.profile_cache is not None:
+            cached = self.profile_cache.get(user_id)
+            if cached:
+                return cached
 
-        if isinstance(data, dict) and data.get("success") is False:
-            raise DoneHubAPIError(str(data.get("message", "未知错误")))
+        data = self._request("GET", f"/api/user/{user_id}", "get_user_by_id")
+        profile = data.get("data")
+        self._cache_profile(profile)
+        return profile
 
-        return data
+    def get_cached_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """只读缓存，不发起请求；未配置缓存或未命中时返回 None."""
+        if self.profile_cache is None:
+            return None
+        return self.profile_cache.get(user_id)
 
-    def get_current_user(self) -> Dict[str, Any]:
-        data = self._request("GET", "/api/user/self")
-        return data.get("data")
+    def peek_cached_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """最近一次已知的资料（可能已超过 TTL），不发起请求、不写数据库."""
+        if self.profile_cache is None:
+            return None
+        return self.profile_cache.peek(user_id)
 
-    def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
-        data = self._request("GET", f"/api/user/{user_id}")
-        return data.get("data")
+    def _cache_profile(self, profile: Optional[Dict[str, Any]]) -> None:
+        if profile and self.profile_cache is not None:
+            self.profile_cache.put(profile)
 
     def search_users(self, keyword: str) -> Dict[str, Any]:
         params = {"keyword": keyword}
-        data = self._request("GET", "/api/user/", params=params)
+        data = self._request("GET", "/api/user/", "search_users", params=params)
         return data.get("data", {})
 
     def get_user_by_linuxdo_username(self, linuxdo_username: str) -> Optional[Dict[str, Any]]:
@@ -88,42 +309,24 @@ class DoneHubAPI:
             return None
 
         users_data = self.search_users(linuxdo_username)
-        items = users_data.get("data", [])
-        if not items:
-            return None
-
-        for item in items:
-            if item.get("linuxdo_username") == linuxdo_username:
-                return item
-        for item in items:
-            if item.get("username") == linuxdo_username:
-                return item
-
-        return items[0]
+        item = match_linuxdo_username(users_data.get("data", []), linuxdo_username)
+        self._cache_profile(item)
+        return item
 
     def get_user_by_linuxdo_id(self, linuxdo_id: str) -> Optional[Dict[str, Any]]:
         if not linuxdo_id:
             return None
 
-        keyword = str(linuxdo_id)
-        users_data = self.search_users(keyword)
-        items = users_data.get("data", [])
-        if not items:
-            return None
-
-        for item in items:
-            candidate = item.get("linuxdo_id")
-            if candidate is None:
-                continue
-            if str(candidate) == keyword:
-                return item
-
-        return None
+        users_data = self.search_users(str(linuxdo_id))
+        item = match_linuxdo_id(users_data.get("data", []), linuxdo_id)
+        self._cache_profile(item)
+        return item
 
     def change_user_quota(self, user_id: int, quota_delta_units: int, remark: str = "") -> None:
-        payload = {"quota": quota_delta_units}
-        if remark:
-            payload["remark"] = remark
-        data = self._request("POST", f"/api/user/quota/{user_id}", json=payload)
+        data = self._request(
+            "POST", f"/api/user/quota/{user_id}", "change_user_quota",
+            json=quota_payload(quota_delta_units, remark),
+        )
         if data.get("success") is False:
             raise DoneHubAPIError(str(data.get("message", "调整额度失败")))
+        # 缓存额度由结算记账时在同一事务内更新（DatabaseImproved.complete_outbox_entry）
@@ -0,0 +1,169 @@
+"""DoneHub API 的 asyncio 客户端（依赖可选的 httpx）."""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - 未安装时由调用方退回同步客户端
+    httpx = None
+
+from donehub_api import (
+    DoneHubAPIError,
+    match_linuxdo_id,
+    match_linuxdo_username,
+    parse_response,
+    quota_payload,
+)
+
+logger = logging.getLogger(__name__)
+
+HTTPX_AVAILABLE = httpx is not None
+
+
+class AsyncDoneHubAPI:
+    """与 DoneHubAPI 方法、错误语义一致的异步版本.
+
+    AsyncClient 绑定创建它的事件循环，切换事件循环或 fork 后会重新创建。
+    资料缓存沿用同步实现（本地 SQLite），不涉及网络等待。
+    """
+
+    def __init__(self, base_url: str, access_token: str, quota_unit: int = 500000, timeout: int = 10,
+                 pool_size: int = 10, keep_alive: bool = True, profile_cache=None, metrics=None):
+        if httpx is None:
+            raise RuntimeError("AsyncDoneHubAPI 需要安装 httpx")
+        if not base_url:
+            raise ValueError("DoneHub base_url 未配置")
+        if not access_token:
+            raise ValueError("DoneHub access_token 未配置")
+
+        self.base_url = base_url.rstrip("/")
+        self.access_token = access_token
+        self.quota_unit = quota_unit
+        self.timeout = timeout
+        self.pool_size = max(1, int(pool_size or 1))
+        self.keep_alive = keep_alive
+        self.profile_cache = profile_cache
+        self.metrics = metrics
+
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client_pid: Optional[int] = None
+
+    def _create_client(self) -> "httpx.AsyncClient":
+        limits = httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size if self.keep_alive else 0,
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.access_token}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+            timeout=self.timeout,
+            limits=limits,
+        )
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        loop = asyncio.get_running_loop()
+        pid = os.getpid()
+        if self._client is None or self._client_loop is not loop or self._client_pid != pid:
+            # 旧客户端属于其他事件循环或父进程，直接丢弃
+            self._client = self._create_client()
+            self._client_loop = loop
+            self._client_pid = pid
+        return self._client
+
+    async def aclose(self) -> None:
+        client = self._client
+        self._client = None
+        self._client_loop = None
+        if client is not None and self._client_pid == os.getpid():
+            await client.aclose()
+
+    async def _request(self, method: str, path: str, operation: str, **kwargs) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return await self._send(method, path, **kwargs)
+        except DoneHubAPIError as exc:
+            if self.metrics is not None:
+                self.metrics.inc("donehub_errors_total", operation=operation, kind=exc.kind)
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe("donehub_request_duration_seconds", time.perf_counter() - started,
+                                     operation=operation, client="async")
+
+    async def _send(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        try:
+            response = await self._get_client().request(method, path, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as exc:
+            # 连接未建立或未拿到连接池中的连接，请求一定没有发出
+            raise DoneHubAPIError(str(exc) or type(exc).__name__, kind="connect") from exc
+        except httpx.TimeoutException as exc:
+            raise DoneHubAPIError(str(exc) or type(exc).__name__, kind="timeout") from exc
+        except httpx.HTTPError as exc:
+            raise DoneHubAPIError(str(exc) or type(exc).__name__, kind="network") from exc
+
+        return parse_response(response.status_code, response.text)
+
+    async def get_current_user(self) -> Dict[str, Any]:
+        data = await self._request("GET", "/api/user/self", "get_current_user")
+        return data.get("data")
+
+    async def get_user_by_id(self, user_id: int, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        if use_cache and self.profile_cache is not None:
+            cached = self.profile_cache.get(user_id)
+            if cached:
+                return cached
+
+        data = await self._request("GET", f"/api/user/{user_id}", "get_user_by_id")
+        profile = data.get("data")
+        self._cache_profile(profile)
+        return profile
+
+    def get_cached_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """只读缓存，不发起请求；未配置缓存或未命中时返回 None."""
+        if self.profile_cache is None:
+            return None
+        return self.profile_cache.get(user_id)
+
+    def _cache_profile(self, profile: Optional[Dict[str, Any]]) -> None:
+        if profile and self.profile_cache is not None:
+            self.profile_cache.put(profile)
+
+    async def search_users(self, keyword: str) -> Dict[str, Any]:
+        data = await self._request("GET", "/api/user/", "search_users", params={"keyword": keyword})
+        return data.get("data", {})
+
+    async def get_user_by_linuxdo_username(self, linuxdo_username: str) -> Optional[Dict[str, Any]]:
+        if not linuxdo_username:
+            return None
+
+        users_data = await self.search_users(linuxdo_username)
+        item = match_linuxdo_username(users_data.get("data", []), linuxdo_username)
+        self._cache_profile(item)
+        return item
+
+    async def get_user_by_linuxdo_id(self, linuxdo_id: str) -> Optional[Dict[str, Any]]:
+        if not linuxdo_id:
+            return None
+
+        users_data = await self.search_users(str(linuxdo_id))
+        item = match_linuxdo_id(users_data.get("data", []), linuxdo_id)
+        self._cache_profile(item)
+        return item
+
+    async def change_user_quota(self, user_id: int, quota_delta_units: int, remark: str = "") -> None:
+        data = await self._request(
+            "POST", f"/api/user/quota/{user_id}", "change_user_quota",
+            json=quota_payload(quota_delta_units, remark),
+        )
+        if data.get("success") is False:
+            raise DoneHubAPIError(str(data.get("message", "调整额度失败")))
+        # 缓存额度由结算记账时在同一事务内更新（DatabaseImproved.complete_outbox_entry）
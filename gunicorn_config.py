@@ -6,8 +6,9 @@ bind = "0.0.0.0:15000"
 # 工作进程数
 workers = 2
 
-# 工作模式
-worker_class = "sync"
+# 工作模式：线程模式下一个 /events 推送连接只占用一个线程，而不是整个 worker
+worker_class = "gthread"
+threads = 32
 
 # 最大请求数
 max_requests = 1000
@@ -26,3 +27,41 @@ proc_name = "lucky-wheel"
 
 # 预加载
 preload_app = True
+
+
+def on_starting(server):
+    """清空上次运行留下的各 worker 指标文件，计数从本次启动开始"""
+    from app import metrics
+
+    if metrics is not None:
+        metrics.clear()
+
+
+def post_fork(server, worker):
+    """worker 启动后重建 DoneHub 连接池并预热，避免首个请求承担握手开销；同时启动额度结算与指标写盘线程"""
+    from app import donehub_api, metrics, settlement_worker
+
+    donehub_api.reset_pool()
+    donehub_api.warmup()
+    settlement_worker.ensure_started()
+    if metrics is not None:
+        metrics.ensure_started()
+
+
+def worker_exit(server, worker):
+    from app import _db, donehub_api, metrics
+
+    if metrics is not None:
+        # 退出前写入最后一次数据，之后由其他 worker 归档
+        metrics.flush()
+
+    stats = donehub_api.pool_stats()
+    server.log.info(
+        "DoneHub 连接池统计 (pid %s): 请求 %s, 复用 %s, 新建 %s",
+        worker.pid, stats['requests'], stats['hits'], stats['misses']
+    )
+    db_stats = _db.pool_stats()
+    server.log.info(
+        "SQLite 连接池统计 (pid %s): 新建 %s, 复用 %s, 复用率 %s",
+        worker.pid, db_stats['opened'], db_stats['reused'], db_stats['reuse_rate']
+    )
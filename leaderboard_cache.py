@@ -0,0 +1,45 @@
+"""今日榜单的进程内短时缓存."""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, List, Tuple
+
+
+class LeaderboardCache:
+    """缓存榜单数据并按内容生成版本号.
+
+    版本号只取决于榜单内容，因此不同 worker 对同一份榜单给出相同的版本，
+    客户端可据此判断榜单是否需要重新下发。
+    """
+
+    def __init__(self, loader: Callable[[], List[Any]], ttl: float = 5):
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._records: List[Any] = []
+        self._version = ""
+        self._expires_at = 0.0
+
+    @staticmethod
+    def compute_version(records: List[Any]) -> str:
+        payload = json.dumps(records, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    def get(self) -> Tuple[str, List[Any]]:
+        now = time.monotonic()
+        if now < self._expires_at:
+            return self._version, self._records
+
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                records = self.loader()
+                self._version = self.compute_version(records)
+                self._records = records
+                self._expires_at = time.monotonic() + self.ttl
+            return self._version, self._records
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._expires_at = 0.0
@@ -0,0 +1,356 @@
+"""Prometheus 文本格式的运行指标，跨 gunicorn worker 汇总."""
+
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 非 Unix 平台不做跨进程加锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQLITE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# 名称 -> (类型, 说明, 直方图分桶)
+METRIC_DEFINITIONS: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {
+    'http_request_duration_seconds': ('histogram', '按路由统计的请求处理耗时', LATENCY_BUCKETS),
+    'donehub_request_duration_seconds': ('histogram', 'DoneHub 接口调用耗时（按操作与客户端）', LATENCY_BUCKETS),
+    'donehub_errors_total': ('counter', 'DoneHubAPIError 次数（按操作与错误类型）', None),
+    'sqlite_connect_duration_seconds': ('histogram', 'SQLite 建立连接耗时', SQLITE_BUCKETS),
+    'sqlite_query_duration_seconds': ('histogram', 'SQLite 语句执行耗时（按语句类型与表）', SQLITE_BUCKETS),
+    'sqlite_write_lock_wait_seconds': ('histogram', 'BEGIN IMMEDIATE 等待写锁的耗时', SQLITE_BUCKETS),
+    'sqlite_commit_duration_seconds': ('histogram', 'SQLite 提交事务耗时', SQLITE_BUCKETS),
+    'settlement_results_total': ('counter', '后台结算的处理结果', None),
+    'settlement_verifications_total': ('counter', '抽样核对结算条目是否在 DoneHub 生效的结果', None),
+}
+
+PREFIX = 'lucky_'
+ARCHIVE_FILE = 'archive.json'
+_STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+(\w+)', re.IGNORECASE)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+@lru_cache(maxsize=1024)
+def statement_labels(sql: str) -> Tuple[str, str]:
+    """语句类型与主表，用作查询耗时的标签；不带参数值，取值范围有限"""
+    stripped = sql.lstrip()
+    verb = stripped.split(None, 1)[0].upper() if stripped else ''
+    match = _STATEMENT_TABLE.search(stripped)
+    return verb, match.group(1) if match else ''
+
+
+@lru_cache(maxsize=1024)
+def _statement_metric_key(sql: str) -> Optional[Tuple[str, LabelKey]]:
+    verb, table = statement_labels(sql)
+    if verb == 'BEGIN':
+        # BEGIN IMMEDIATE / EXCLUSIVE 的耗时几乎全部是等待其他连接释放写锁；
+        # 普通 BEGIN 不取锁，计入会拉低等待时间，不记录
+        mode = sql.split()[1:2]
+        if mode and mode[0].upper() in ('IMMEDIATE', 'EXCLUSIVE'):
+            return ('sqlite_write_lock_wait_seconds', ())
+        return None
+    if verb == 'PRAGMA':
+        return None
+    return ('sqlite_query_duration_seconds', _label_key({'statement': verb, 'table': table}))
+
+
+class Metrics:
+    """进程内的计数器与直方图.
+
+    每个进程的数据由后台线程定期写入 directory 下的 worker-<pid>.json，/metrics 渲染时
+    合并目录下所有文件，得到跨 worker 的汇总；已退出 worker 的数据并入 archive.json，
+    计数器因此单调递增。directory 为 None 时只输出当前进程的数据。
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], List[Any]] = {}
+        self._pid = os.getpid()
+        self._flushed_pid: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    # ---- 记录 ----
+
+    def _check_pid(self) -> None:
+        # fork 出的子进程不继承父进程已记录的数据，避免重复计数
+        pid = os.getpid()
+        if self._pid != pid:
+            self._counters = {}
+            self._histograms = {}
+            self._pid = pid
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_pid()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        self._observe((name, _label_key(labels)), value)
+
+    def _observe(self, key: Tuple[str, LabelKey], value: float) -> None:
+        buckets = METRIC_DEFINITIONS[key[0]][2]
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            self._check_pid()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._check_pid()
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, dict(labels), list(counts), total]
+                    for (name, labels), (counts, total) in self._histograms.items()
+                ],
+            }
+
+    # ---- 跨进程汇总 ----
+
+    def ensure_started(self) -> None:
+        """启动当前进程的定期写盘线程（gunicorn fork 后每个 worker 各自一个）"""
+        if not self.directory:
+            return
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._thread_pid == pid:
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._thread_pid == pid:
+                return
+            self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+            self._thread_pid = pid
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as exc:
+                logger.warning("写入运行指标失败: %s", exc)
+
+    def _worker_path(self, pid: int) -> str:
+        return os.path.join(self.directory, f'worker-{pid}.json')
+
+    def flush(self) -> None:
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        pid = os.getpid()
+        path = self._worker_path(pid)
+        if self._flushed_pid != pid:
+            # 同一 pid 的旧文件来自已退出的 worker（pid 被复用），先归档再覆盖
+            if os.path.exists(path):
+                with self._file_lock():
+                    self._archive([path])
+            self._flushed_pid = pid
+        self._write_json(path, self.snapshot())
+
+    def clear(self) -> None:
+        """清空汇总目录，供 gunicorn 主进程启动时调用"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') or name.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _file_lock(self):
+        return _DirectoryLock(os.path.join(self.directory, '.lock'))
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]) -> None:
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(data, handle, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, encoding='utf-8') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def _archive(self, paths: List[str]) -> None:
+        """把已退出 worker 的数据并入 archive.json 并删除原文件（调用方持有目录锁）"""
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        merged = _Merged()
+        merged.add(self._read_json(archive_path))
+        for path in paths:
+            merged.add(self._read_json(path))
+        self._write_json(archive_path, merged.to_snapshot())
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def collect(self) -> '_Merged':
+        merged = _Merged()
+        if not self.directory:
+            merged.add(self.snapshot())
+            return merged
+
+        self.flush()
+        with self._file_lock():
+            dead = []
+            for name in os.listdir(self.directory):
+                match = re.match(r'^worker-(\d+)\.json$', name)
+                if match and not pid_alive(int(match.group(1))):
+                    dead.append(os.path.join(self.directory, name))
+            if dead:
+                self._archive(dead)
+            for name in os.listdir(self.directory):
+                if name == ARCHIVE_FILE or re.match(r'^worker-\d+\.json$', name):
+                    merged.add(self._read_json(os.path.join(self.directory, name)))
+        return merged
+
+    def render(self) -> str:
+        return self.collect().render()
+
+    # ---- SQLite（作为 DatabaseImproved 的 listener） ----
+
+    def on_connect(self, elapsed: float) -> None:
+        self._observe(('sqlite_connect_duration_seconds', ()), elapsed)
+
+    def on_statement(self, conn, sql: str, parameters, elapsed: float) -> None:
+        key = _statement_metric_key(sql)
+        if key is not None:
+            self._observe(key, elapsed)
+
+    def on_commit(self, elapsed: float) -> None:
+        self._observe(('sqlite_commit_duration_seconds', ()), elapsed)
+
+
+class _Merged:
+    """合并多个进程快照并按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, LabelKey], float] = {}
+        self.histograms: Dict[Tuple[str, LabelKey], List[Any]] = {}
+
+    def add(self, snapshot: Optional[Dict[str, Any]]) -> None:
+        if not snapshot:
+            return
+        for name, labels, value in snapshot.get('counters', []):
+            key = (name, _label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+        for name, labels, counts, total in snapshot.get('histograms', []):
+            definition = METRIC_DEFINITIONS.get(name)
+            if definition is None or len(counts) != len(definition[2]) + 1:
+                # 分桶定义变更前写入的数据无法合并
+                continue
+            key = (name, _label_key(labels))
+            current = self.histograms.get(key)
+            if current is None:
+                self.histograms[key] = [list(counts), total]
+            else:
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        return {
+            'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+            'histograms': [
+                [name, dict(labels), counts, total] for (name, labels), (counts, total) in self.histograms.items()
+            ],
+        }
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+            full_name = PREFIX + name
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+
+            for (metric, labels), (counts, total) in sorted(self.histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(bound)
+                    lines.append(f'{full_name}_bucket{_format_labels(labels, le=le)} {cumulative}')
+                lines.append(f'{full_name}_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{full_name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: LabelKey, **extra) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in items) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _DirectoryLock:
+    """基于 flock 的跨进程互斥，归档时避免两个 worker 同时改写 archive.json"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._handle = open(self.path, 'a', encoding='utf-8')  # pylint:disable=consider-using-with
+            fcntl.flock(self._handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._handle is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+            self._handle.close()
+            self._handle = None
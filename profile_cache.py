@@ -0,0 +1,54 @@
+"""跨 worker 共享的 DoneHub 用户资料缓存."""
+
+import logging
+import sqlite3
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DoneHubProfileCache:
+    """基于 SQLite 的资料缓存，带 TTL 与 LRU 淘汰；额度变更在结算记账时于同一事务内写入.
+
+    缓存故障只记录日志，不影响 DoneHub 调用本身。
+    """
+
+    def __init__(self, db, ttl: int = 300, max_entries: int = 1000):
+        self.db = db
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries or 1))
+        # LRU 只需要粗略的访问时间，命中时最多每 ttl/4 秒记录一次
+        self.touch_interval = ttl / 4
+
+    def get(self, donehub_user_id: int) -> Optional[Dict[str, Any]]:
+        if not donehub_user_id:
+            return None
+        try:
+            return self.db.get_cached_profile(donehub_user_id, self.ttl, self.touch_interval)
+        except (sqlite3.Error, ValueError) as exc:
+            logger.warning("读取资料缓存失败: %s", exc)
+            return None
+
+    def peek(self, donehub_user_id: int) -> Optional[Dict[str, Any]]:
+        """只读取最近一次已知的资料：不检查 TTL、不更新访问时间，适合高频轮询"""
+        if not donehub_user_id:
+            return None
+        try:
+            return self.db.get_cached_profile(donehub_user_id, float('inf'), None)
+        except (sqlite3.Error, ValueError) as exc:
+            logger.warning("读取资料缓存失败: %s", exc)
+            return None
+
+    def put(self, profile: Optional[Dict[str, Any]]) -> None:
+        if not profile or not profile.get("id"):
+            return
+        try:
+            self.db.save_cached_profile(profile["id"], profile, self.max_entries)
+        except (sqlite3.Error, TypeError) as exc:
+            logger.warning("写入资料缓存失败: %s", exc)
+
+    def invalidate(self, donehub_user_id: int) -> None:
+        try:
+            self.db.delete_cached_profile(donehub_user_id)
+        except sqlite3.Error as exc:
+            logger.warning("移除资料缓存失败: %s", exc)
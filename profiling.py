@@ -0,0 +1,131 @@
+"""按请求开启的 cProfile 采样与热点函数汇总."""
+
+import argparse
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+_LABEL_PATTERN = re.compile(r'[^A-Za-z0-9_.]+')
+
+
+class RequestProfiler:
+    """对单个请求做 cProfile，结果写入 directory/<毫秒时间戳>-<endpoint>-<pid>.prof.
+
+    - 每个进程同一时间只分析一个请求，其余请求照常处理、不做分析；
+    - 目录中最多保留 max_files 个文件，超出时删除最旧的；
+    - report() 合并目录中的文件（可按 endpoint 过滤），输出热点函数排行，多个 worker 的结果一起汇总。
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.0, max_files: int = 200):
+        self.directory = directory
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate or 0)))
+        self.max_files = max(1, int(max_files or 1))
+        self._busy = threading.Lock()
+
+    def should_profile(self, forced: bool = False) -> bool:
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """开始分析当前线程；已有请求在分析中时返回 None"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 其他分析工具正在运行（Python 3.12 起全局只允许一个）
+            self._busy.release()
+            return None
+        return profiler
+
+    def stop(self, profiler: cProfile.Profile, label: str) -> Optional[str]:
+        """结束分析并写入文件，返回文件名"""
+        try:
+            profiler.disable()
+        finally:
+            self._busy.release()
+
+        safe_label = _LABEL_PATTERN.sub('_', label or 'unknown')[:64]
+        name = f'{int(time.time() * 1000)}-{safe_label}-{os.getpid()}.prof'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.directory, name))
+            self._prune()
+        except OSError as exc:
+            logger.warning("写入请求分析结果失败: %s", exc)
+            return None
+        return name
+
+    def _profile_files(self, endpoint: Optional[str] = None) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith('.prof'))
+        if endpoint:
+            names = [name for name in names if _endpoint_of(name) == endpoint]
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _prune(self) -> None:
+        files = self._profile_files()
+        for path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def report(self, endpoint: Optional[str] = None, sort: str = 'cumulative', limit: int = 30) -> str:
+        files = self._profile_files(endpoint)
+        if not files:
+            return '暂无分析结果\n'
+        if sort not in SORT_KEYS:
+            sort = 'cumulative'
+
+        stream = io.StringIO()
+        stats = None
+        merged = 0
+        for path in files:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(path, stream=stream)
+                else:
+                    stats.add(path)
+                merged += 1
+            except (OSError, EOFError, TypeError, ValueError):
+                # 文件可能正被其他 worker 清理或尚未写完
+                continue
+        if stats is None:
+            return '暂无分析结果\n'
+
+        stream.write(f'合并 {merged} 个请求的分析结果（endpoint: {endpoint or "全部"}，排序: {sort}）\n')
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+def _endpoint_of(name: str) -> str:
+    # <时间戳>-<endpoint>-<pid>.prof
+    parts = name[:-len('.prof')].split('-')
+    return '-'.join(parts[1:-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='汇总 PROFILE_DIR 中的请求分析结果')
+    parser.add_argument('directory', nargs='?', default='profiles')
+    parser.add_argument('--endpoint', help='只汇总指定 endpoint，如 lottery、dashboard_data')
+    parser.add_argument('--sort', choices=SORT_KEYS, default='cumulative')
+    parser.add_argument('--top', type=int, default=30)
+    args = parser.parse_args(argv)
+    print(RequestProfiler(args.directory).report(args.endpoint, args.sort, args.top), end='')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,133 @@
+"""基于 SQLite 的服务端会话，Cookie 中只保存签名后的随机会话 id."""
+
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSession(SecureCookieSession):
+    """会话数据保存在服务端；sid 为 None 表示尚未写入数据库"""
+
+    def __init__(self, initial=None, sid: Optional[str] = None, expires_at: Optional[float] = None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.rotate_requested = False
+
+    def rotate(self) -> None:
+        """登录等权限变化时更换会话 id，防止会话固定攻击"""
+        self.rotate_requested = True
+        self.modified = True
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """把 Flask 会话保存在 DatabaseImproved 的 web_sessions 表中.
+
+    - 会话按最后一次续期滑动过期，剩余时间不足一半时才续期，大部分请求只读不写；
+    - 空会话不写库，已有会话被清空时删除记录与 Cookie；
+    - 每个进程每隔 sweep_interval 秒分批清理一次过期会话。
+    """
+
+    salt = 'lucky-server-session'
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSession
+
+    def __init__(self, db, lifetime: float = 7 * 24 * 3600, sweep_interval: float = 300):
+        self.db = db
+        self.lifetime = lifetime
+        self.sweep_interval = sweep_interval
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _signer(self, app) -> Signer:
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac')
+
+    def _maybe_sweep(self, now: float) -> None:
+        if now - self._last_sweep < self.sweep_interval or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            removed = self.db.delete_expired_web_sessions(now)
+            if removed:
+                logger.info("已清理 %s 个过期会话", removed)
+        except sqlite3.Error as exc:
+            logger.warning("清理过期会话失败: %s", exc)
+        finally:
+            self._sweep_lock.release()
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        now = time.time()
+        self._maybe_sweep(now)
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self.session_class()
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return self.session_class()
+
+        row = self.db.get_web_session(sid, now)
+        if row is None:
+            return self.session_class()
+        try:
+            data = self.serializer.loads(row['data'])
+        except ValueError:
+            return self.session_class()
+        return self.session_class(data, sid=sid, expires_at=row['expires_at'])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.sid is not None:
+                self.db.delete_web_session(session.sid)
+            if session.modified or session.sid is not None:
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        now = time.time()
+        sid = session.sid
+        issue_cookie = False
+        if sid is None or session.rotate_requested:
+            if sid is not None:
+                self.db.delete_web_session(sid)
+            sid = secrets.token_urlsafe(32)
+            issue_cookie = True
+
+        renew = session.expires_at is None or session.expires_at - now < self.lifetime / 2
+        if issue_cookie or session.modified or renew:
+            self.db.save_web_session(sid, self.serializer.dumps(dict(session)), now + self.lifetime)
+            session.sid = sid
+            session.expires_at = now + self.lifetime
+            session.rotate_requested = False
+
+        # 非永久会话沿用浏览器会话 Cookie，只在签发新 id 时下发；永久会话随续期刷新过期时间
+        if issue_cookie or (session.permanent and renew):
+            response.set_cookie(
+                name,
+                self._signer(app).sign(sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
@@ -0,0 +1,330 @@
+"""DoneHub 额度调整的后台结算."""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from database import DatabaseImproved
+from donehub_api import DoneHubAPIError
+
+logger = logging.getLogger(__name__)
+
+
+class SettlementWorker:
+    """把 quota_outbox 中的待提交调整应用到 DoneHub.
+
+    - 每个进程一个后台线程，多进程之间通过数据库条件更新领取条目，同一条目只会被处理一次；
+    - 明确失败（连接未建立、或 DoneHub 以 4xx/接口错误明确拒绝）按指数退避重试，超过次数后撤销来源记录；
+    - 结果未知（超时、传输中断、5xx、响应无法解析、进程中途退出）不再自动提交，标记为 unknown
+      等待人工核对，避免重复加减额度；
+    - 长期停留在 pending 且没有结算条目的历史记录（旧版本遗留）定期转为 unknown 条目，同样等待人工核对；
+    - 提供 async_api 时，一批条目在后台线程自己的事件循环中并发提交（最多 concurrency 个同时进行）；
+    - 按 verify_sample_rate 抽样核对条目是否到账：提交前读取一次 DoneHub 额度，提交成功 verify_delay
+      秒后再读取一次，检查变化是否包含本应用在此期间记账的调整（增加类不少于、扣减类不多于预期），
+      与余额因充值等外部操作产生的变化区分开；读取结果同时刷新本地缓存。
+    """
+
+    def __init__(self, db, donehub_api, interval: float = 1.0, batch_size: int = 20, max_attempts: int = 8,
+                 base_backoff: float = 2.0, max_backoff: float = 300.0, lease_seconds: float = 120.0,
+                 stale_record_seconds: int = 600, on_applied: Optional[Callable[[Dict], None]] = None,
+                 verify_sample_rate: float = 0.0, verify_delay: float = 5.0, async_api=None,
+                 concurrency: int = 10, metrics=None):
+        self.db = db
+        self.donehub_api = donehub_api
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lease_seconds = lease_seconds
+        self.stale_record_seconds = stale_record_seconds
+        self.on_applied = on_applied
+        self.verify_sample_rate = max(0.0, min(1.0, float(verify_sample_rate or 0)))
+        self.verify_delay = verify_delay
+        self.async_api = async_api
+        self.concurrency = max(1, int(concurrency or 1))
+        self.metrics = metrics
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._last_reconcile = 0.0
+
+        self._verify_lock = threading.Lock()
+        self._verify_queue: Deque[Tuple[float, Dict, Dict]] = deque(maxlen=1000)
+        self._verify_stats = {'checked': 0, 'mismatched': 0, 'skipped': 0, 'errors': 0}
+
+    def ensure_started(self) -> None:
+        """在当前进程中启动后台线程（fork 后的 worker 需各自启动）"""
+        pid = os.getpid()
+        if self._thread_pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._start_lock:
+            if self._thread_pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            # fork 前的事件循环不可在子进程中复用
+            self._loop = None
+            self._thread = threading.Thread(target=self._run, name="quota-settlement", daemon=True)
+            self._thread_pid = pid
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+
+    def notify(self) -> None:
+        """有新条目入队时唤醒后台线程，无需等到下一个轮询周期"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:  # pylint:disable=broad-except
+                logger.exception("额度结算循环异常")
+                processed = 0
+
+            if processed < self.batch_size:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+
+    def run_once(self) -> int:
+        now = time.time()
+        if now - self._last_reconcile >= max(self.interval, 30):
+            self._last_reconcile = now
+            self.reconcile(now)
+
+        entries = [entry for entry in self.db.claim_due_outbox_entries(self.batch_size, now) if entry]
+        if self.async_api is not None and len(entries) > 1:
+            self._settle_batch(entries)
+        else:
+            for entry in entries:
+                self._settle(entry)
+
+        self._run_verifications(time.time())
+        return len(entries)
+
+    def reconcile(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        expired = self.db.expire_outbox_leases(now - self.lease_seconds)
+        if expired:
+            logger.error("%s 条额度调整在结算过程中中断，已标记为 unknown，请人工核对", expired)
+
+        stale = self.db.mark_stale_pending_records_unknown(self.stale_record_seconds, self.donehub_api.quota_unit)
+        if stale:
+            logger.error("%s 条长期未结算的 pending 记录已转为 unknown 条目，请人工核对", stale)
+
+    def settle_now(self, entry_id: int, retry: bool = False) -> str:
+        """在当前线程立即结算指定条目，返回最终状态；retry=False 时失败即撤销，不再排队重试"""
+        entry = self.db.claim_outbox_entry(entry_id, time.time())
+        if entry is None:
+            current = self.db.get_outbox_entry(entry_id)
+            return current['status'] if current else 'missing'
+        return self._settle(entry, retry=retry)
+
+    @staticmethod
+    def _remark(entry: Dict) -> str:
+        remark = entry.get('remark') or ''
+        return f"{remark} [{entry['idempotency_key']}]".strip()
+
+    def _settle(self, entry: Dict, retry: bool = True) -> str:
+        check = None
+        if self._wants_verification(entry):
+            position = self.db.get_quota_ledger_position()
+            try:
+                check = self._verification_base(
+                    entry, position, self.donehub_api.get_user_by_id(entry['donehub_user_id'], use_cache=False)
+                )
+            except DoneHubAPIError as exc:
+                self._verification_error(entry['donehub_user_id'], exc)
+
+        try:
+            if entry['delta_units']:
+                self.donehub_api.change_user_quota(entry['donehub_user_id'], entry['delta_units'], self._remark(entry))
+        except DoneHubAPIError as exc:
+            return self._handle_failure(entry, exc, retry)
+        return self._handle_success(entry, check)
+
+    def _settle_batch(self, entries) -> None:
+        """在后台线程的事件循环中并发提交一批条目，结果处理与同步路径相同"""
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._settle_many(entries))
+
+    async def _settle_many(self, entries) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def settle(entry):
+            async with semaphore:
+                check = None
+                if self._wants_verification(entry):
+                    position = self.db.get_quota_ledger_position()
+                    try:
+                        check = self._verification_base(entry, position, await self.async_api.get_user_by_id(
+                            entry['donehub_user_id'], use_cache=False
+                        ))
+                    except DoneHubAPIError as exc:
+                        self._verification_error(entry['donehub_user_id'], exc)
+
+                try:
+                    if entry['delta_units']:
+                        await self.async_api.change_user_quota(
+                            entry['donehub_user_id'], entry['delta_units'], self._remark(entry)
+                        )
+                except DoneHubAPIError as exc:
+                    return self._handle_failure(entry, exc, True)
+            return self._handle_success(entry, check)
+
+        results = await asyncio.gather(*(settle(entry) for entry in entries), return_exceptions=True)
+        for entry, result in zip(entries, results):
+            if isinstance(result, Exception):
+                logger.error("额度调整 %s 结算异常: %s", entry['idempotency_key'], result)
+
+    def _handle_success(self, entry: Dict, check: Optional[Dict] = None) -> str:
+        self.db.complete_outbox_entry(entry['id'])
+        if check is not None:
+            with self._verify_lock:
+                self._verify_queue.append((time.time() + self.verify_delay, entry, check))
+        if self.on_applied:
+            try:
+                self.on_applied(entry)
+            except Exception:  # pylint:disable=broad-except
+                logger.exception("结算回调异常")
+        self._record_result('applied')
+        return 'applied'
+
+    def _handle_failure(self, entry: Dict, exc: DoneHubAPIError, retry: bool) -> str:
+        message = str(exc)[:500]
+        if exc.ambiguous:
+            self.db.mark_outbox_unknown(entry['id'], message)
+            logger.error("额度调整 %s 结果未知（%s），已暂停自动重试", entry['idempotency_key'], message)
+            self._record_result('unknown')
+            return 'unknown'
+
+        if not retry or entry['attempts'] >= self.max_attempts:
+            self.db.fail_outbox_entry(entry['id'], message)
+            logger.warning("额度调整 %s 失败并已撤销: %s", entry['idempotency_key'], message)
+            self._record_result('failed')
+            return 'failed'
+
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (entry['attempts'] - 1)))
+        delay *= random.uniform(0.8, 1.2)
+        self.db.retry_outbox_entry(entry['id'], message, time.time() + delay)
+        logger.info("额度调整 %s 将在 %.1f 秒后重试: %s", entry['idempotency_key'], delay, message)
+        self._record_result('retry')
+        return 'pending'
+
+    def verify_stats(self) -> Dict[str, int]:
+        with self._verify_lock:
+            stats = dict(self._verify_stats)
+            stats['queued'] = len(self._verify_queue)
+        return stats
+
+    def _wants_verification(self, entry: Dict) -> bool:
+        """抽样决定是否核对该条目；同一用户还有其他调整在途时无法区分各自的影响，不核对"""
+        if not entry['delta_units'] or not self.verify_sample_rate or random.random() >= self.verify_sample_rate:
+            return False
+        if self.db.count_inflight_quota_changes(entry['donehub_user_id']) > 1:
+            self._count('skipped')
+            return False
+        return True
+
+    def _verification_base(self, entry: Dict, ledger_position: int, profile: Optional[Dict]) -> Optional[Dict]:
+        """提交前的 DoneHub 额度与记账流水位置，作为核对基准"""
+        if not profile:
+            self._count('skipped')
+            return None
+        return {'before': profile.get('quota') or 0, 'ledger_position': ledger_position}
+
+    def _verification_error(self, donehub_user_id: int, exc: DoneHubAPIError) -> None:
+        self._count('errors')
+        logger.warning("核对 DoneHub 用户 %s 余额失败: %s", donehub_user_id, exc)
+
+    def _run_verifications(self, now: float) -> None:
+        while True:
+            with self._verify_lock:
+                if not self._verify_queue or self._verify_queue[0][0] > now:
+                    return
+                _, entry, check = self._verify_queue.popleft()
+            self._verify_settlement(entry, check)
+
+    def _verify_settlement(self, entry: Dict, check: Dict) -> None:
+        """核对条目是否已在 DoneHub 生效
+
+        预期额度 = 提交前额度 + 此后本应用记账的调整（含该条目）。充值、兑换等外部变化也会改变额度，
+        因此只检查与该条目同方向的部分：增加类要求不少于预期，扣减类要求不多于预期。
+        仍有调整在途时无法确定预期值，跳过。
+        """
+        donehub_user_id = entry['donehub_user_id']
+        if self.db.count_inflight_quota_changes(donehub_user_id):
+            self._count('skipped')
+            return
+
+        try:
+            latest = self.donehub_api.get_user_by_id(donehub_user_id, use_cache=False)
+        except DoneHubAPIError as exc:
+            self._verification_error(donehub_user_id, exc)
+            return
+
+        self._count('checked')
+        expected = check['before'] + self.db.sum_quota_ledger_delta(entry['user_id'], check['ledger_position'])
+        actual = (latest or {}).get('quota')
+        if actual is None or (actual < expected if entry['delta_units'] > 0 else actual > expected):
+            self._count('mismatched')
+            logger.warning("额度调整 %s 可能未在 DoneHub 生效: 提交前 %s，预期 %s，DoneHub %s",
+                           entry['idempotency_key'], check['before'], expected, actual)
+            if latest is None and self.donehub_api.profile_cache is not None:
+                self.donehub_api.profile_cache.invalidate(donehub_user_id)
+
+    def _count(self, key: str) -> None:
+        with self._verify_lock:
+            self._verify_stats[key] += 1
+        if self.metrics is not None:
+            self.metrics.inc('settlement_verifications_total', result=key)
+
+    def _record_result(self, result: str) -> None:
+        if self.metrics is not None:
+            self.metrics.inc('settlement_results_total', result=result)
+
+
+def main(argv=None) -> int:
+    """命令行核对 unknown 条目，供未开启管理接口时使用"""
+    parser = argparse.ArgumentParser(description='查看并确认结果未知的 DoneHub 额度调整')
+    parser.add_argument('--db', default='lucky.db', help='数据库路径')
+    commands = parser.add_subparsers(dest='command', required=True)
+    list_parser = commands.add_parser('list', help='列出 unknown 条目')
+    list_parser.add_argument('--limit', type=int, default=100)
+    resolve_parser = commands.add_parser('resolve', help='按 DoneHub 流水确认条目结果')
+    resolve_parser.add_argument('entry_id', type=int)
+    resolve_parser.add_argument('result', choices=('applied', 'failed'), help='applied: 已到账；failed: 未到账，撤销来源记录')
+    args = parser.parse_args(argv)
+
+    db = DatabaseImproved(args.db)
+    if args.command == 'list':
+        for entry in db.get_unknown_outbox_entries(args.limit):
+            print(json.dumps({key: entry[key] for key in (
+                'id', 'idempotency_key', 'donehub_user_id', 'source_type', 'delta_units', 'last_error', 'updated_at'
+            )}, ensure_ascii=False))
+        return 0
+
+    if not db.resolve_unknown_outbox_entry(args.entry_id, args.result == 'applied'):
+        print(f"条目 {args.entry_id} 不存在或不处于 unknown 状态")
+        return 1
+    print(f"条目 {args.entry_id} 已确认为 {args.result}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,176 @@
+"""SQLite 慢查询日志：超过阈值的语句连同查询计划记录在环形缓冲区中."""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from metrics import pid_alive
+
+logger = logging.getLogger(__name__)
+
+# 不做 EXPLAIN 的语句（事务控制、建表等）
+NON_EXPLAINABLE = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'CREATE', 'DROP', 'ALTER',
+                   'ANALYZE', 'VACUUM')
+_FILE_PATTERN = re.compile(r'^slow-queries-(\d+)\.json$')
+
+
+def parameter_types(parameters) -> Any:
+    """只记录绑定参数的类型，不记录取值"""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def plan_flags(plan: List[str]) -> List[str]:
+    flags = set()
+    for detail in plan:
+        if detail.startswith('SCAN ') and ' USING ' not in detail:
+            flags.add('full_scan')
+        if 'USE TEMP B-TREE' in detail:
+            flags.add('temp_btree')
+    return sorted(flags)
+
+
+class SlowQueryLog:
+    """DatabaseImproved 的 listener，记录耗时超过 threshold_ms 的语句.
+
+    每条记录包含语句形状（压缩空白后的 SQL，参数仍为占位符）、绑定参数类型、耗时与
+    EXPLAIN QUERY PLAN；每个进程保留最近 capacity 条。提供 directory 时同时写入
+    directory/slow-queries-<pid>.json（最多每 write_interval 秒一次），entries() 合并各 worker 的记录。
+    """
+
+    def __init__(self, threshold_ms: float = 50, capacity: int = 200, directory: Optional[str] = None,
+                 write_interval: float = 1.0):
+        self.threshold = max(0.0, float(threshold_ms or 0)) / 1000.0
+        self.capacity = max(1, int(capacity or 1))
+        self.directory = directory
+        self.write_interval = write_interval
+        self._lock = threading.Lock()
+        self._entries: deque = deque(maxlen=self.capacity)
+        self._pid = os.getpid()
+        self._dirty = False
+        self._last_write = 0.0
+        self._timer: Optional[threading.Timer] = None
+
+    def _check_pid(self) -> None:
+        # fork 后不保留父进程的记录（调用方持有锁）
+        pid = os.getpid()
+        if self._pid != pid:
+            self._entries.clear()
+            self._dirty = False
+            self._timer = None
+            self._pid = pid
+
+    def on_statement(self, conn, sql: str, parameters, elapsed: float) -> None:
+        if elapsed < self.threshold:
+            return
+        shape = ' '.join(sql.split())
+        verb = shape.split(' ', 1)[0].upper() if shape else ''
+        plan: List[str] = []
+        if verb not in NON_EXPLAINABLE:
+            try:
+                # 使用普通游标，避免 EXPLAIN 本身再次进入监听器
+                rows = conn.cursor(sqlite3.Cursor).execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+                plan = [row[3] for row in rows]
+            except (sqlite3.Error, ValueError) as exc:
+                plan = [f'EXPLAIN 失败: {exc}']
+
+        entry = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'pid': os.getpid(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'sql': shape[:2000],
+            'parameter_types': parameter_types(parameters),
+            'plan': plan,
+            'flags': plan_flags(plan),
+        }
+        logger.warning("慢查询 %.1fms: %s %s", entry['duration_ms'], shape[:200], ' | '.join(plan))
+
+        with self._lock:
+            self._check_pid()
+            self._entries.append(entry)
+            self._dirty = True
+        self._write(force=False)
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f'slow-queries-{pid}.json')
+
+    def _write(self, force: bool) -> None:
+        if not self.directory:
+            return
+        with self._lock:
+            self._check_pid()
+            now = time.time()
+            if not self._dirty:
+                return
+            if not force and now - self._last_write < self.write_interval:
+                # 限制写盘频率；稍后补写一次，避免 worker 空闲后最后几条一直不落盘
+                if self._timer is None:
+                    self._timer = threading.Timer(self.write_interval, self._deferred_write)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            entries = list(self._entries)
+            self._dirty = False
+            self._last_write = now
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(os.getpid())
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(entries, handle, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning("写入慢查询日志失败: %s", exc)
+
+    def _deferred_write(self) -> None:
+        with self._lock:
+            self._timer = None
+        self._write(force=True)
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """最近的慢查询，新的在前；配置了 directory 时包含所有 worker 的记录"""
+        limit = self.capacity if limit is None else max(1, min(int(limit), self.capacity))
+        if not self.directory:
+            with self._lock:
+                self._check_pid()
+                entries = list(self._entries)
+            return sorted(entries, key=lambda item: item['time'], reverse=True)[:limit]
+
+        self._write(force=True)
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        sources = {}
+        for name in os.listdir(self.directory):
+            match = _FILE_PATTERN.match(name)
+            if not match:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding='utf-8') as handle:
+                    items = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            entries.extend(items)
+            sources[path] = (int(match.group(1)), items)
+
+        entries.sort(key=lambda item: item['time'], reverse=True)
+        kept = entries[:self.capacity]
+        kept_ids = {id(item) for item in kept}
+        for path, (pid, items) in sources.items():
+            # 已退出的 worker 若没有记录能进入最近 capacity 条，删除其文件
+            if not pid_alive(pid) and not any(id(item) in kept_ids for item in items):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return kept[:limit]
+
@@ -0,0 +1,849 @@
+const WHEEL_PRIZES = [
+    { amount: 10, color: '#EF4444', label: '10$' },
+    { amount: 20, color: '#F97316', label: '20$' },
+    { amount: 30, color: '#10B981', label: '30$' },
+    { amount: 50, color: '#3B82F6', label: '50$' },
+    { amount: 60, color: '#8B5CF6', label: '60$' },
+    { amount: 100, color: '#FACC15', label: '100$' }
+];
+const SLICE_ANGLE = 360 / WHEEL_PRIZES.length;
+const MAX_WHEEL_SIZE = 420;
+const MAX_WHEEL_DRAW_ATTEMPTS = 6;
+
+let isSpinning = false;
+let currentRotation = 0;
+let pendingResizeRedraw = false;
+let wheelDrawRetry = 0;
+
+// 初始化数据（从 JSON 脚本容器安全读取）
+let initialData = (() => {
+    const el = document.getElementById('initialData');
+    if (!el) return {};
+    try { return JSON.parse(el.textContent || '{}'); } catch (e) { return {}; }
+})();
+
+// 页面配置（费用与次数上限）随初始数据下发，脚本本身不含服务端模板变量，可长期缓存
+const PAGE_CONFIG = initialData.config || {};
+const LOTTERY_COST = Number(PAGE_CONFIG.cost_per_spin);
+const EXTRA_PURCHASE_COST = Number(PAGE_CONFIG.extra_purchase_cost);
+const BASE_DAILY_SPINS = Number(PAGE_CONFIG.lottery_max);
+const EXTRA_PURCHASE_LIMIT = Number(PAGE_CONFIG.extra_purchase_limit);
+
+let dashboardRefreshing = false;
+let pendingRefreshSections = null;
+// 各标签页需要的数据，切换时只请求当前页用到的部分（余额显示在顶栏，榜单页不需要）
+const TAB_SECTIONS = {
+    gas: ['balance', 'sign'],
+    fun: ['balance', 'lottery'],
+    leaderboard: ['leaderboard']
+};
+let activeTab = 'gas';
+// 当前展示的榜单及其版本，服务端版本未变时不再重复下发榜单
+let latestLeaderboard = [];
+let leaderboardVersion = null;
+
+async function refreshDashboardData(sections = TAB_SECTIONS[activeTab]) {
+    if (!initialData || !initialData.is_authenticated) return;
+    if (dashboardRefreshing) {
+        // 上一次刷新结束后再请求，避免快速切换标签时丢掉新页面的数据
+        pendingRefreshSections = sections;
+        return;
+    }
+
+    dashboardRefreshing = true;
+    try {
+        const params = new URLSearchParams({ sections: sections.join(',') });
+        if (leaderboardVersion && sections.includes('leaderboard')) {
+            params.set('leaderboard_version', leaderboardVersion);
+        }
+        const response = await fetch(`/dashboard-data?${params}`, {
+            method: 'GET',
+            headers: {
+                'Accept': 'application/json'
+            },
+            credentials: 'same-origin',
+            cache: 'no-cache'
+        });
+
+        if (response.status === 401) {
+            window.location.reload();
+            return;
+        }
+
+        if (!response.ok) {
+            console.error('刷新数据失败:', response.statusText);
+            return;
+        }
+
+        const payload = await response.json();
+        if (payload && payload.success && payload.data) {
+            applyDashboardData(payload.data);
+        }
+    } catch (error) {
+        console.error('刷新数据异常:', error);
+    } finally {
+        dashboardRefreshing = false;
+        if (pendingRefreshSections) {
+            const next = pendingRefreshSections;
+            pendingRefreshSections = null;
+            refreshDashboardData(next);
+        }
+    }
+}
+
+// 实时推送：连接正常时由服务端推送榜单与余额，不再轮询 /dashboard-data
+let eventSource = null;
+let streamConnected = false;
+
+function connectEventStream() {
+    if (!window.EventSource || !initialData || !initialData.is_authenticated || eventSource) return;
+
+    eventSource = new EventSource('/events');
+    eventSource.addEventListener('open', () => {
+        streamConnected = true;
+    });
+    eventSource.addEventListener('leaderboard', (event) => {
+        try {
+            const payload = JSON.parse(event.data);
+            latestLeaderboard = Array.isArray(payload.leaderboard) ? payload.leaderboard : [];
+            leaderboardVersion = payload.version || null;
+            renderLeaderboard(latestLeaderboard, payload.leaderboard_self || null);
+        } catch (error) {
+            console.error('榜单推送解析失败:', error);
+        }
+    });
+    eventSource.addEventListener('balance', (event) => {
+        try {
+            updateBalanceDisplay(JSON.parse(event.data).balance);
+        } catch (error) {
+            console.error('余额推送解析失败:', error);
+        }
+    });
+    eventSource.addEventListener('error', () => {
+        streamConnected = false;
+        // 服务端拒绝（如连接已满）时浏览器不会重连，退回按需刷新
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+        }
+    });
+}
+
+function refreshUnlessStreaming() {
+    if (!streamConnected) {
+        refreshDashboardData();
+    }
+}
+
+// Tab切换功能
+function switchTab(tabName) {
+    // 切换导航栏按钮状态
+    document.querySelectorAll('.btn-topbar').forEach(btn => {
+        btn.classList.remove('active');
+    });
+    document.getElementById('nav-' + tabName)?.classList.add('active');
+
+    // 切换内容区域
+    document.querySelectorAll('.tab-content').forEach(content => {
+        content.classList.remove('active');
+    });
+    document.getElementById('tab-' + tabName)?.classList.add('active');
+    if (TAB_SECTIONS[tabName]) {
+        activeTab = tabName;
+    }
+
+    if (tabName === 'fun') {
+        requestAnimationFrame(() => drawWheel(true));
+    }
+
+    refreshUnlessStreaming();
+}
+
+// 绘制转盘
+function drawWheel(force = false) {
+    const canvas = document.getElementById('wheelCanvas');
+    if (!canvas) return;
+    if (isSpinning && !force) {
+        pendingResizeRedraw = true;
+        return;
+    }
+    pendingResizeRedraw = false;
+    const container = canvas.parentElement;
+    const availableWidth = container ? container.clientWidth : MAX_WHEEL_SIZE;
+    const size = Math.min(availableWidth || MAX_WHEEL_SIZE, MAX_WHEEL_SIZE);
+
+    if (!force && (size <= 0 || Number.isNaN(size))) {
+        if (wheelDrawRetry < MAX_WHEEL_DRAW_ATTEMPTS) {
+            wheelDrawRetry += 1;
+            setTimeout(() => drawWheel(), 120);
+        }
+        return;
+    }
+
+    if (!force && size < 140 && wheelDrawRetry < MAX_WHEEL_DRAW_ATTEMPTS) {
+        wheelDrawRetry += 1;
+        setTimeout(() => drawWheel(), 120);
+        return;
+    }
+
+    wheelDrawRetry = 0;
+    const dpr = window.devicePixelRatio || 1;
+
+    canvas.width = size * dpr;
+    canvas.height = size * dpr;
+    canvas.style.width = `${size}px`;
+    canvas.style.height = `${size}px`;
+
+    const ctx = canvas.getContext('2d');
+    if (!ctx) return;
+    if (ctx.resetTransform) {
+        ctx.resetTransform();
+    } else {
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+    }
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    ctx.scale(dpr, dpr);
+
+    const prizes = WHEEL_PRIZES;
+    const centerX = size / 2;
+    const centerY = size / 2;
+    const radius = size / 2 - Math.max(8, size * 0.02);
+    const sliceAngle = (Math.PI * 2) / prizes.length;
+    const fontSize = Math.max(16, size * 0.065);
+
+    prizes.forEach((prize, index) => {
+        const startAngle = index * sliceAngle - Math.PI / 2;
+        const endAngle = (index + 1) * sliceAngle - Math.PI / 2;
+
+        // 绘制扇形
+        ctx.beginPath();
+        ctx.arc(centerX, centerY, radius, startAngle, endAngle);
+        ctx.lineTo(centerX, centerY);
+        ctx.fillStyle = prize.color;
+        ctx.fill();
+
+        // 绘制边框
+        ctx.strokeStyle = 'white';
+        ctx.lineWidth = 3;
+        ctx.stroke();
+
+        // 绘制文字
+        ctx.save();
+        const textAngle = startAngle + sliceAngle / 2;
+        ctx.translate(centerX, centerY);
+        ctx.rotate(textAngle);
+        ctx.fillStyle = 'white';
+        ctx.font = `bold ${fontSize}px Inter`;
+        ctx.fillText(prize.label, radius * 0.6, fontSize * 0.3);
+        ctx.restore();
+    });
+
+    // 绘制中心圆
+    ctx.beginPath();
+    ctx.arc(centerX, centerY, size * 0.13, 0, Math.PI * 2);
+    ctx.fillStyle = 'white';
+    ctx.fill();
+}
+
+// 初始化转盘
+if (document.getElementById('wheelCanvas')) {
+    drawWheel();
+}
+
+let wheelResizeTimer = null;
+window.addEventListener('resize', () => {
+    clearTimeout(wheelResizeTimer);
+    wheelResizeTimer = setTimeout(() => {
+        drawWheel();
+    }, 200);
+});
+
+// 更新余额显示
+function updateBalanceDisplay(balance) {
+    if (balance === undefined || balance === null) return;
+    const numeric = Number(balance);
+    if (Number.isNaN(numeric)) return;
+    const normalized = numeric.toFixed(2);
+
+    const topBalance = document.getElementById('topBalance');
+    const statsBalance = document.getElementById('statsBalance');
+
+    if (topBalance) topBalance.textContent = normalized;
+    if (statsBalance) statsBalance.textContent = normalized;
+}
+
+const MS_PER_DAY = 24 * 60 * 60 * 1000;
+
+const normalizeDate = (value) => {
+    if (!value) return null;
+    const date = value instanceof Date ? value : new Date(value);
+    if (Number.isNaN(date.getTime())) return null;
+    return new Date(date.getFullYear(), date.getMonth(), date.getDate());
+};
+
+const calculateSignStreak = (history) => {
+    if (!Array.isArray(history) || !history.length) return 0;
+    const parsed = history
+        .map(item => normalizeDate(item?.sign_date))
+        .filter(Boolean)
+        .sort((a, b) => b.getTime() - a.getTime());
+    if (!parsed.length) return 0;
+
+    let streak = 0;
+    let expected = new Date(parsed[0].getTime());
+
+    for (const date of parsed) {
+        const current = normalizeDate(date);
+        if (!current) continue;
+        const diff = Math.round((expected.getTime() - current.getTime()) / MS_PER_DAY);
+        if (diff === 0) {
+            streak += 1;
+            expected = new Date(expected.getTime() - MS_PER_DAY);
+        } else if (diff > 0) {
+            break;
+        } else if (diff < 0) {
+            expected = new Date(current.getTime());
+        }
+    }
+    return streak;
+};
+
+const updateSignStreakDisplay = (history) => {
+    const streakEl = document.getElementById('signStreakCount');
+    if (!streakEl) return;
+    const streak = calculateSignStreak(history);
+    streakEl.textContent = streak;
+};
+
+// 更新签到历史
+function updateSignHistory(history) {
+    const container = document.getElementById('signHistory');
+    if (!container) return;
+
+    container.innerHTML = '';
+    if (!history || !history.length) {
+        container.innerHTML = '<div class="history-item"><span class="history-date">暂无签到记录</span><span class="history-amount">--</span></div>';
+        updateSignStreakDisplay([]);
+        return;
+    }
+
+    history.forEach(item => {
+        const div = document.createElement('div');
+        div.className = 'history-item';
+        div.innerHTML = `
+            <span class="history-date">${item.sign_date}</span>
+            <span class="history-amount">+${item.reward} $</span>
+        `;
+        container.appendChild(div);
+    });
+
+    updateSignStreakDisplay(history);
+}
+
+// 更新抽奖历史
+function updateLotteryHistory(history) {
+    const container = document.getElementById('lotteryHistory');
+    if (!container) return;
+
+    container.innerHTML = '';
+    if (!history || !history.length) {
+        container.innerHTML = '<div class="history-item"><span class="history-date">暂无抽奖记录</span><span class="history-amount">--</span></div>';
+        return;
+    }
+
+    history.forEach(item => {
+        const div = document.createElement('div');
+        div.className = 'history-item';
+        const prizeValue = item.quota ?? 0;
+        const netAmount = prizeValue - (item.cost ?? LOTTERY_COST);
+        const amountClass = netAmount >= 0 ? 'history-amount' : 'history-amount loss';
+        const netText = `净${netAmount >= 0 ? '+' : ''}${netAmount} $`;
+        div.innerHTML = `
+            <span class="history-date">${item.lottery_date || ''}</span>
+            <span class="${amountClass}">+${prizeValue} $<small>${netText}</small></span>
+        `;
+        container.appendChild(div);
+    });
+}
+
+function renderLeaderboard(data, selfInfo) {
+    const container = document.getElementById('leaderboardList');
+    if (container) {
+        container.innerHTML = '';
+
+        if (!Array.isArray(data) || !data.length) {
+            container.innerHTML = '<div class="leaderboard-empty">暂无数据</div>';
+        } else {
+            data.forEach((item, index) => {
+                const name = item?.username || '未知用户';
+                const attempts = Number(item?.attempts ?? 0);
+                const totalPrize = Number(item?.total_prize ?? 0);
+                const totalCost = Number(item?.total_cost ?? 0);
+                const net = Number(item?.net_change ?? 0);
+
+                const row = document.createElement('div');
+                row.className = 'leaderboard-item';
+
+                const rankEl = document.createElement('span');
+                rankEl.className = 'leaderboard-rank';
+                rankEl.textContent = String(index + 1);
+
+                const infoEl = document.createElement('div');
+                infoEl.className = 'leaderboard-info';
+
+                const nameEl = document.createElement('div');
+                nameEl.className = 'leaderboard-name';
+                nameEl.textContent = name;
+
+                const metaEl = document.createElement('div');
+                metaEl.className = 'leaderboard-meta';
+                metaEl.textContent = `中奖 ${totalPrize.toFixed(0)} $ · 扣费 ${totalCost.toFixed(0)} $ · ${Math.max(0, attempts)} 次`;
+
+                infoEl.appendChild(nameEl);
+                infoEl.appendChild(metaEl);
+
+                const amountEl = document.createElement('span');
+                amountEl.className = net >= 0 ? 'leaderboard-amount' : 'leaderboard-amount negative';
+                amountEl.textContent = `${net >= 0 ? '+' : ''}${net.toFixed(0)} $`;
+
+                row.appendChild(rankEl);
+                row.appendChild(infoEl);
+                row.appendChild(amountEl);
+
+                container.appendChild(row);
+            });
+        }
+    }
+
+    const selfNetEl = document.getElementById('leaderboardSelfNet');
+    const selfMetaEl = document.getElementById('leaderboardSelfMeta');
+    if (selfNetEl && selfMetaEl) {
+        const net = Number(selfInfo?.net_change ?? 0);
+        const totalPrize = Number(selfInfo?.total_quota ?? 0);
+        const totalCost = Number(selfInfo?.total_cost ?? 0);
+        const attempts = Number(selfInfo?.attempts ?? 0);
+
+        selfNetEl.textContent = `${net >= 0 ? '+' : ''}${net.toFixed(0)} $`;
+        selfNetEl.style.color = net >= 0 ? '#34D399' : '#F87171';
+
+        if (attempts > 0) {
+            selfMetaEl.textContent = `中奖 ${totalPrize.toFixed(0)} $ · 扣费 ${totalCost.toFixed(0)} $ · ${attempts} 次`;
+        } else {
+            selfMetaEl.textContent = '今日尚未参与抽奖';
+        }
+    }
+}
+
+function updatePurchaseButtonLabel(purchaseCost, remainingPurchases) {
+    const purchaseBtn = document.getElementById('purchaseExtraBtn');
+    const purchaseSelect = document.getElementById('purchaseExtraSelect');
+    if (!purchaseBtn) return;
+
+    if (remainingPurchases <= 0) {
+        purchaseBtn.disabled = true;
+        purchaseBtn.textContent = '今日购买已达上限';
+        return;
+    }
+
+    const selected = Math.max(1, Math.min(remainingPurchases, Number(purchaseSelect?.value ?? 1)));
+    const totalCost = purchaseCost * selected;
+    purchaseBtn.disabled = false;
+    purchaseBtn.textContent = `购买额外 ${selected} 次 (${purchaseCost} $ × ${selected} = ${totalCost} $)`;
+}
+
+let latestLotteryData = null;
+
+function updateLotterySummaryUI(lottery) {
+    if (!lottery) return;
+    latestLotteryData = lottery;
+
+    const attemptsLeftEl = document.getElementById('attemptsLeft');
+    const attemptsMaxEl = document.getElementById('attemptsMax');
+    const hintEl = document.getElementById('extraPurchaseHint');
+    const infoEl = document.getElementById('extraPurchaseInfo');
+    const purchaseBtn = document.getElementById('purchaseExtraBtn');
+    const purchaseSelect = document.getElementById('purchaseExtraSelect');
+
+    const remaining = Number(lottery.remaining_attempts ?? 0);
+    const maxAttempts = Number(lottery.max_attempts ?? BASE_DAILY_SPINS);
+    const baseAttempts = Number(lottery.base_attempts ?? BASE_DAILY_SPINS);
+    const extraPurchased = Number(lottery.extra_purchased ?? 0);
+    const purchaseLimit = Number(lottery.extra_purchase_limit ?? EXTRA_PURCHASE_LIMIT);
+    const purchaseCost = Number(lottery.extra_purchase_cost ?? EXTRA_PURCHASE_COST);
+    const remainingPurchases = Math.max(0, purchaseLimit - extraPurchased);
+
+    if (attemptsLeftEl) attemptsLeftEl.textContent = remaining;
+    if (attemptsMaxEl) attemptsMaxEl.textContent = maxAttempts;
+    if (hintEl) hintEl.textContent = `默认 ${baseAttempts} 次，可额外购买 ${purchaseLimit} 次`;
+    if (infoEl) infoEl.textContent = `已购 ${extraPurchased} 次 / 可购 ${purchaseLimit} 次`;
+
+    if (purchaseSelect) {
+        const currentValue = purchaseSelect.value;
+        purchaseSelect.innerHTML = '';
+        for (let i = 1; i <= remainingPurchases; i += 1) {
+            const option = document.createElement('option');
+            option.value = String(i);
+            option.textContent = `${i} 次`;
+            purchaseSelect.appendChild(option);
+        }
+        if (remainingPurchases === 0) {
+            const option = document.createElement('option');
+            option.value = '0';
+            option.textContent = '已达上限';
+            purchaseSelect.appendChild(option);
+        }
+
+        if (currentValue && Number(currentValue) <= remainingPurchases && Number(currentValue) > 0) {
+            purchaseSelect.value = currentValue;
+        } else if (remainingPurchases > 0) {
+            purchaseSelect.value = '1';
+        } else {
+            purchaseSelect.value = '0';
+        }
+
+        purchaseSelect.disabled = remainingPurchases <= 0;
+    }
+
+    updatePurchaseButtonLabel(purchaseCost, remainingPurchases);
+}
+
+function applyDashboardData(data) {
+    if (!data || !data.is_authenticated) return;
+
+    initialData = data;
+
+    if (data.balance !== undefined) {
+        updateBalanceDisplay(data.balance);
+    }
+
+    if (data.sign) {
+        const todaySigned = Boolean(data.sign.today_signed);
+        const signBtn = document.getElementById('signBtn');
+        const signBtnText = document.getElementById('signBtnText');
+        if (signBtn && signBtnText) {
+            signBtn.disabled = todaySigned;
+            signBtnText.textContent = todaySigned ? '今日已签到' : '立即签到领取奖励';
+        }
+        updateSignHistory(data.sign.history);
+    }
+
+    if (data.lottery) {
+        updateLotteryHistory(data.lottery.history);
+        updateLotterySummaryUI(data.lottery);
+    }
+
+    // 只请求了部分数据时不改动榜单
+    if (Array.isArray(data.sections) && !data.sections.includes('leaderboard')) return;
+
+    if (Array.isArray(data.leaderboard)) {
+        latestLeaderboard = data.leaderboard;
+        leaderboardVersion = data.leaderboard_version || null;
+    } else if (!data.leaderboard_unchanged) {
+        latestLeaderboard = [];
+        leaderboardVersion = null;
+    }
+
+    renderLeaderboard(latestLeaderboard, data.leaderboard_self || null);
+}
+
+applyDashboardData(initialData);
+connectEventStream();
+
+// 登录/退出功能
+function login() {
+    window.location.href = '/login';
+}
+
+function logout() {
+    window.location.href = '/logout';
+}
+
+// 签到功能
+async function startSign() {
+    const btn = document.getElementById('signBtn');
+    const btnText = document.getElementById('signBtnText');
+    const message = document.getElementById('signMessage');
+
+    btn.disabled = true;
+    btnText.textContent = '签到中...';
+    if (message) message.innerHTML = '';
+
+    try {
+        const response = await fetch('/sign', { method: 'POST' });
+        const data = await response.json();
+
+        if (data.success) {
+            btnText.textContent = '今日已签到';
+            if (message) {
+                message.className = 'message success';
+                message.textContent = data.message;
+            }
+
+            if (data.current_balance !== undefined) {
+                updateBalanceDisplay(data.current_balance);
+            }
+            updateSignHistory(data.sign_history);
+            refreshUnlessStreaming();
+        } else {
+            if (message) {
+                message.className = 'message error';
+                message.textContent = data.message;
+            }
+
+            if (data.code !== 'ALREADY_SIGNED') {
+                btn.disabled = false;
+                btnText.textContent = '立即签到领取奖励';
+            } else {
+                btnText.textContent = '今日已签到';
+            }
+        }
+    } catch (error) {
+        if (message) {
+            message.className = 'message error';
+            message.textContent = '签到失败，请稍后再试';
+        }
+        btn.disabled = false;
+        btnText.textContent = '立即签到领取奖励';
+        console.error('签到错误:', error);
+    }
+}
+
+async function startLottery() {
+    if (isSpinning) return;
+
+    const btn = document.getElementById('spinBtn');
+    const wheel = document.getElementById('wheel');
+    const message = document.getElementById('lotteryMessage');
+
+    isSpinning = true;
+    btn.disabled = true;
+    btn.textContent = '抽奖中...';
+    if (message) message.innerHTML = '';
+
+    const spinStartTime = performance.now();
+    const MIN_SPIN_TIME = 1500; // 确保至少旋转这么久
+    let continuousRAF = null;
+    let continuousActive = false;
+
+    const waitForMinimumSpin = () => {
+        const elapsed = performance.now() - spinStartTime;
+        if (elapsed >= MIN_SPIN_TIME) return Promise.resolve();
+        return new Promise(resolve => setTimeout(resolve, MIN_SPIN_TIME - elapsed));
+    };
+
+    const stopContinuousSpin = () => {
+        if (!continuousActive) return;
+        continuousActive = false;
+        if (continuousRAF) cancelAnimationFrame(continuousRAF);
+        continuousRAF = null;
+    };
+
+    const startContinuousSpin = () => {
+        continuousActive = true;
+        wheel.style.transition = 'none';
+        let last = performance.now();
+        const speed = 720; // 每秒旋转度数
+        const step = (now) => {
+            if (!continuousActive) return;
+            const delta = now - last;
+            last = now;
+            currentRotation += (speed * delta) / 1000;
+            wheel.style.transform = `rotate(${currentRotation}deg)`;
+            continuousRAF = requestAnimationFrame(step);
+        };
+        continuousRAF = requestAnimationFrame(step);
+    };
+
+    const finishWithError = async (
+        errorMessage = '抽奖失败，请稍后重试',
+        keepDisabled = false,
+        buttonLabel = '开始'
+    ) => {
+        await waitForMinimumSpin();
+        stopContinuousSpin();
+        if (message) {
+            message.className = 'message error';
+            message.textContent = errorMessage;
+        }
+        btn.textContent = buttonLabel;
+        btn.disabled = !!keepDisabled;
+        isSpinning = false;
+        if (pendingResizeRedraw) {
+            pendingResizeRedraw = false;
+            drawWheel(true);
+        }
+    };
+
+    // 工具函数：收尾动画
+    const startSettleSpin = async (data) => {
+        await waitForMinimumSpin();
+        stopContinuousSpin();
+
+        const prizeIndex = Math.max(0, WHEEL_PRIZES.findIndex(p => p.amount === data.quota));
+        const normalizedCurrent = ((currentRotation % 360) + 360) % 360;
+        const randomOffset = (Math.random() - 0.5) * SLICE_ANGLE * 0.4;
+        const targetAngle = (360 - (prizeIndex * SLICE_ANGLE + SLICE_ANGLE / 2) + randomOffset + 360) % 360;
+        const baseSpins = 4;
+        let extraRotation = (targetAngle - normalizedCurrent + 360) % 360;
+        extraRotation += baseSpins * 360;
+        const finalRotation = currentRotation + extraRotation;
+        const settleDuration = 1800;
+
+        wheel.style.transition = 'none';
+        wheel.style.transform = `rotate(${currentRotation}deg)`;
+        void wheel.offsetWidth;
+        requestAnimationFrame(() => {
+            wheel.style.transition = `transform ${settleDuration}ms cubic-bezier(0.23, 1, 0.32, 1)`;
+            wheel.style.transform = `rotate(${finalRotation}deg)`;
+        });
+        currentRotation = finalRotation;
+
+        setTimeout(() => {
+            if (data.current_balance !== undefined) updateBalanceDisplay(data.current_balance);
+            const attemptsLeft = document.getElementById('attemptsLeft');
+            if (attemptsLeft && data.remaining_attempts !== undefined) attemptsLeft.textContent = data.remaining_attempts;
+            updateLotteryHistory(data.lottery_history);
+            if (message) {
+                const net = (data.quota ?? 0) - LOTTERY_COST;
+                const netText = `净${net >= 0 ? '+' : ''}${net} $`;
+                message.className = 'message success';
+                message.innerHTML = `🎉 恭喜获得 ${data.quota} $奖励！<br><small>${netText}</small>`;
+            }
+            btn.disabled = false;
+            btn.textContent = '开始';
+            isSpinning = false;
+            refreshUnlessStreaming();
+            if (pendingResizeRedraw) {
+                pendingResizeRedraw = false;
+                drawWheel(true);
+            }
+        }, settleDuration);
+    };
+
+    startContinuousSpin();
+
+    try {
+        const response = await fetch('/lottery', { method: 'POST' });
+        const data = await response.json();
+
+        if (!data.success) {
+            const isUserMissing = data.code === 'USER_NOT_FOUND';
+            const isInsufficient = data.code === 'INSUFFICIENT_FUNDS';
+            let buttonLabel = '开始';
+            let keepDisabled = false;
+            let msg = data.message || '抽奖失败，请稍后重试';
+
+            if (isUserMissing) {
+                buttonLabel = '账号未绑定';
+                keepDisabled = true;
+                msg = data.message || '账号未绑定，无法抽奖';
+            } else if (isInsufficient) {
+                buttonLabel = '余额不足';
+                keepDisabled = true;
+                msg = data.message || '余额不足，无法抽奖';
+            }
+
+            await finishWithError(msg, keepDisabled, buttonLabel);
+            return;
+        }
+
+        await startSettleSpin(data);
+    } catch (error) {
+        console.error('抽奖错误:', error);
+        await finishWithError('抽奖失败，请稍后重试');
+    }
+}
+
+async function purchaseExtraAttempt() {
+    const btn = document.getElementById('purchaseExtraBtn');
+    const message = document.getElementById('lotteryMessage');
+    const purchaseSelect = document.getElementById('purchaseExtraSelect');
+    if (!btn) return;
+
+    if (btn.disabled && btn.textContent === '今日购买已达上限') {
+        return;
+    }
+
+    btn.disabled = true;
+    btn.textContent = '购买中...';
+    if (message) {
+        message.className = '';
+        message.textContent = '';
+    }
+
+    const quantity = Math.max(1, Number(purchaseSelect?.value ?? 1));
+
+    try {
+        const response = await fetch('/lottery/purchase', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ quantity })
+        });
+        const data = await response.json().catch(() => ({}));
+
+        if (response.ok && data?.success) {
+            if (message) {
+                message.className = 'message success';
+                message.textContent = data.message || `购买成功，已增加 ${quantity} 次抽奖机会`;
+            }
+
+            if (data.data) {
+                applyDashboardData(data.data);
+            } else {
+                refreshDashboardData();
+            }
+        } else {
+            const errorMsg = data?.message || '购买失败，请稍后重试';
+            if (message) {
+                message.className = 'message error';
+                message.textContent = errorMsg;
+            }
+            btn.disabled = false;
+            const remainingPurchases = Math.max(
+                0,
+                ((latestLotteryData?.extra_purchase_limit ?? EXTRA_PURCHASE_LIMIT) - (latestLotteryData?.extra_purchased ?? 0))
+            );
+            const purchaseCost = Number(latestLotteryData?.extra_purchase_cost ?? EXTRA_PURCHASE_COST);
+            updatePurchaseButtonLabel(purchaseCost, remainingPurchases);
+        }
+    } catch (error) {
+        console.error('购买额外次数失败:', error);
+        if (message) {
+            message.className = 'message error';
+            message.textContent = '购买失败，请稍后重试';
+        }
+        btn.disabled = false;
+        const remainingPurchases = Math.max(
+            0,
+            ((latestLotteryData?.extra_purchase_limit ?? EXTRA_PURCHASE_LIMIT) - (latestLotteryData?.extra_purchased ?? 0))
+        );
+        const purchaseCost = Number(latestLotteryData?.extra_purchase_cost ?? EXTRA_PURCHASE_COST);
+        updatePurchaseButtonLabel(purchaseCost, remainingPurchases);
+    }
+}
+
+const purchaseBtn = document.getElementById('purchaseExtraBtn');
+if (purchaseBtn) {
+    purchaseBtn.addEventListener('click', purchaseExtraAttempt);
+}
+
+const purchaseSelect = document.getElementById('purchaseExtraSelect');
+if (purchaseSelect) {
+    purchaseSelect.addEventListener('change', () => {
+        const remainingPurchases = Math.max(
+            0,
+            ((latestLotteryData?.extra_purchase_limit ?? EXTRA_PURCHASE_LIMIT) - (latestLotteryData?.extra_purchased ?? 0))
+        );
+        const purchaseCost = Number(latestLotteryData?.extra_purchase_cost ?? EXTRA_PURCHASE_COST);
+        updatePurchaseButtonLabel(purchaseCost, remainingPurchases);
+    });
+}
+
+// 绑定全局函数
+window.login = login;
+window.logout = logout;
+window.startSign = startSign;
+window.startLottery = startLottery;
+window.switchTab = switchTab;
+window.purchaseExtraAttempt = purchaseExtraAttempt;
@@ -0,0 +1,159 @@
+"""带内容哈希的静态资源地址：文件内容不变时 URL 不变，可以让浏览器长期缓存.
+
+运行过 build_assets.py 后，资源从构建目录读取：按 manifest.json 选择预压缩（br/gzip）
+或新格式（AVIF/WebP）版本；未构建时直接对 static 目录中的文件计算哈希。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 10
+# <文件名>.<哈希><扩展名>，如 css/app.1a2b3c4d5e.css
+_HASHED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[A-Za-z0-9]+)$' % HASH_LENGTH)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+@dataclass
+class AssetVariant:
+    """构建目录中选中的一个文件版本"""
+    path: str
+    mimetype: str
+    encoding: Optional[str]
+    etag: str
+    vary: List[str]
+
+
+class StaticAssets:
+    """为 directory 下的文件生成带哈希的文件名，并在构建目录中选择合适的版本.
+
+    - 哈希按文件的修改时间与大小缓存，文件变化后下次取地址时重新计算，开发时修改资源无需重启；
+    - 构建目录中的 manifest.json 同样按修改时间重新加载；源文件在构建后被修改时，该文件退回直接读取 static 目录。
+    """
+
+    def __init__(self, directory: str, build_directory: Optional[str] = None):
+        self.directory = directory
+        self.build_directory = build_directory
+        self._lock = threading.Lock()
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._manifest_mtime: Optional[int] = None
+        self._assets: Dict[str, Dict[str, Any]] = {}
+        self._by_hashed_name: Dict[str, Dict[str, Any]] = {}
+
+    def digest(self, filename: str) -> Optional[str]:
+        path = os.path.join(self.directory, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._digests.get(filename)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(65536), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()[:HASH_LENGTH]
+        with self._lock:
+            self._digests[filename] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def _load_manifest(self) -> None:
+        if not self.build_directory:
+            return
+        path = os.path.join(self.build_directory, MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return
+        assets: Dict[str, Dict[str, Any]] = {}
+        if mtime is not None:
+            try:
+                with open(path, encoding='utf-8') as handle:
+                    assets = json.load(handle).get('assets', {})
+            except (OSError, ValueError) as exc:
+                logger.warning("读取静态资源清单失败: %s", exc)
+        with self._lock:
+            self._manifest_mtime = mtime
+            self._assets = assets
+            self._by_hashed_name = {entry['file']: entry for entry in assets.values()}
+
+    def _built_entry(self, filename: str) -> Optional[Dict[str, Any]]:
+        """构建结果仍与源文件一致时返回清单条目"""
+        self._load_manifest()
+        with self._lock:
+            entry = self._assets.get(filename)
+        if entry is None or entry.get('source') != self.digest(filename):
+            return None
+        return entry
+
+    def hashed_name(self, filename: str) -> str:
+        """返回带哈希的文件名；文件不存在时原样返回"""
+        entry = self._built_entry(filename)
+        if entry is not None:
+            return entry['file']
+        digest = self.digest(filename)
+        if digest is None:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f'{stem}.{digest}{ext}'
+
+    def resolve(self, hashed_name: str) -> Tuple[str, bool]:
+        """把带哈希的文件名还原为 static 目录中的文件名，并返回哈希是否与当前内容一致"""
+        match = _HASHED_NAME.match(hashed_name)
+        if not match:
+            return hashed_name, False
+        filename = match.group('stem') + match.group('ext')
+        return filename, self.digest(filename) == match.group('digest')
+
+    def select(self, hashed_name: str, accepted_types: Iterable[str],
+               accepted_encodings: Iterable[str]) -> Optional[AssetVariant]:
+        """在构建目录中按客户端声明支持的格式与压缩方式选择版本；未构建该文件时返回 None.
+
+        只使用客户端明确列出的类型与编码（忽略 */*），清单中的版本已按优先级排好序，
+        原始类型、未压缩的版本总是可用。
+        """
+        self._load_manifest()
+        with self._lock:
+            entry = self._by_hashed_name.get(hashed_name)
+        if entry is None:
+            return None
+        accepted_types = set(accepted_types)
+        accepted_encodings = set(accepted_encodings)
+        variants = entry['variants']
+
+        vary = []
+        if any(variant['encoding'] for variant in variants):
+            vary.append('Accept-Encoding')
+        if any(variant['type'] != entry['type'] for variant in variants):
+            vary.append('Accept')
+
+        for variant in variants:
+            if variant['type'] != entry['type'] and variant['type'] not in accepted_types:
+                continue
+            if variant['encoding'] and variant['encoding'] not in accepted_encodings:
+                continue
+            return AssetVariant(
+                path=os.path.join(self.build_directory, variant['file']),
+                mimetype=variant['type'],
+                encoding=variant['encoding'],
+                etag=variant['etag'],
+                vary=vary,
+            )
+        return None